@@ -5,8 +5,11 @@ import uvicorn
 import logging
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Any
-from main import BenchmarkComparison
+from typing import List, Dict, Any, Optional
+from main import BenchmarkComparison, GCS_BUCKET_NAME, GCS_CREDENTIALS_PATH
+from src.process_stats import get_memory_usage
+from src.gcp_storage_adapter import GCPStorageAdapter
+from src.index_cache import IndexCacheManager
 import json
 import os 
 from datetime import datetime
@@ -34,6 +37,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Local index cache shared by all requests of this worker (created on startup)
+index_cache: Optional[IndexCacheManager] = None
+
+@app.on_event("startup")
+async def start_index_cache():
+    global index_cache
+    index_cache = IndexCacheManager(
+        GCPStorageAdapter(bucket_name=GCS_BUCKET_NAME, credentials_path=GCS_CREDENTIALS_PATH)
+    )
+    # Re-download indexes that changed in GCS every INDEX_CACHE_REFRESH_SECONDS (disabled when unset)
+    index_cache.start_background_refresh()
+    # Load the INDEX_PREFETCH_TOP_N most used indexes in the background; /ready reports when done
+    asyncio.get_running_loop().run_in_executor(None, index_cache.prefetch)
+
+@app.on_event("shutdown")
+async def stop_index_cache():
+    if index_cache is not None:
+        index_cache.stop_background_refresh()
+
 # # Define request/response models
 # class QueryRequest(BaseModel):
 #     query: str
@@ -44,6 +66,9 @@ from pydantic import BaseModel, ConfigDict
 class QueryRequest(BaseModel):
     query: str
     model_id: str
+    model_ids: Optional[List[str]] = None  # search several indexes at once (federated)
+    rerank: Optional[bool] = None  # BM25 + vector re-rank of retrieved papers (defaults to LEXICAL_RERANK)
+    speculative_fetch: Optional[bool] = None  # fetch trials from the raw query during profiling (defaults to SPECULATIVE_CT_FETCH)
     model_config = ConfigDict(protected_namespaces=())  # silence "model_" warning
 
 
@@ -177,15 +202,40 @@ async def create_comparison_reports_progressive(
 async def benchmark_comparison(request: QueryRequest):
     try:
         start_time = datetime.now()
-        benchmark_agent = BenchmarkComparison()
+        benchmark_agent = BenchmarkComparison(index_cache=index_cache)
         logger.info(f"Received query: {request.query} for model_id: {request.model_id}")
         
+        # Speculatively fetch trials from the raw query while the profile is generated
+        speculative_fetch = request.speculative_fetch
+        if speculative_fetch is None:
+            speculative_fetch = os.getenv("SPECULATIVE_CT_FETCH", "false").lower() == "true"
+        speculative_future = None
+        if speculative_fetch:
+            speculative_future = asyncio.get_running_loop().run_in_executor(
+                None, benchmark_agent.speculative_fetch_trials, request.query
+            )
+        
         # Create local study profile
-        local_study = benchmark_agent.create_local_study_profile(
-            question=request.query,
-            context={"model_id": request.model_id}
-        )
+        profiled = False
+        try:
+            local_study = benchmark_agent.create_local_study_profile(
+                question=request.query,
+                context={"model_id": request.model_id, "model_ids": request.model_ids, "rerank": request.rerank}
+            )
+            profiled = True
+        finally:
+            if not profiled and speculative_future is not None:
+                # Profiling failed: drop the speculative fetch instead of leaving it un-awaited
+                speculative_future.cancel()
         logger.info("Local study profile created successfully")
+        
+        speculative_result = None
+        if speculative_future is not None:
+            try:
+                speculative_result = await speculative_future
+                logger.info(f"Speculative fetch success: {speculative_result.get('success')} time elapsed: {datetime.now() - start_time}")
+            except Exception as e:
+                logger.error(f"Speculative clinical trials fetch failed: {e}")
         # print(local_study)
         # print("********************************")
         
@@ -193,7 +243,11 @@ async def benchmark_comparison(request: QueryRequest):
         clinical_success = False
         attempt = 0
         while clinical_success == False:
-            clinical_trials = benchmark_agent.fetch_clinical_ncts(local_study)
+            # Only the first attempt reuses the speculative fetch; retries fetch from the profile
+            clinical_trials = benchmark_agent.fetch_clinical_ncts(
+                local_study, 
+                speculative_result=speculative_result if attempt == 0 else None
+            )
             # print(f"---------------{clinical_trials}")
             clinical_success = clinical_trials['success']
             attempt += 1
@@ -262,6 +316,18 @@ async def benchmark_comparison(request: QueryRequest):
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/benchmark_comparison/ready")
+async def readiness_check():
+    # Not ready until the startup prefetch of the most used indexes has finished
+    if index_cache is None or not index_cache.prefetch_complete.is_set():
+        raise HTTPException(status_code=503, detail="Prefetching indexes")
+    return {"status": "ready", "loaded_indexes": index_cache.loaded_model_ids()}
+
+@app.get("/benchmark_comparison/memory")
+async def memory_usage():
+    # Resident memory of the worker that serves this request (compare across workers with FAISS_MMAP_INDEXES)
+    return get_memory_usage()
+
 @app.get("/benchmark_comparison/summary")
 async def get_summary():
     return {
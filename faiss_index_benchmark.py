@@ -0,0 +1,206 @@
+# faiss_index_benchmark.py
+"""
+Recall-vs-latency benchmark of the FaissVectorDB index backends against the exact flat baseline,
+with single-query and batched (batch_similarity_search) latencies. The compressed backends
+(sq8, ivf_opq) are also run with exact re-ranking over raw vectors.
+
+Usage:
+    python faiss_index_benchmark.py --num-vectors 100000 --dimension 1536
+    python faiss_index_benchmark.py --index-path gcp-indexes/medical_papers
+"""
+import argparse
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.faiss_db_manager import FaissVectorDB
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def make_synthetic_vectors(num_vectors: int, dimension: int, num_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Generate clustered unit vectors that roughly mimic text embeddings.
+
+    Args:
+        num_vectors: Number of vectors to generate
+        dimension: Vector dimension
+        num_clusters: Number of topic clusters
+        seed: Random seed
+
+    Returns:
+        float32 array of shape (num_vectors, dimension)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension), dtype=np.float32)
+    assignments = rng.integers(0, num_clusters, num_vectors)
+    vectors = centers[assignments] + 0.5 * rng.standard_normal((num_vectors, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def load_index_vectors(index_path: str) -> np.ndarray:
+    """
+    Read the stored vectors back out of an existing local index.
+
+    Args:
+        index_path: Local index path (without extension)
+
+    Returns:
+        float32 array of the stored vectors
+    """
+    vector_db = FaissVectorDB()
+    if not vector_db.load(index_path):
+        raise ValueError(f"Failed to load index: {index_path}")
+    return vector_db.reconstruct_vectors()
+
+
+def build_vector_db(vectors: np.ndarray, **index_kwargs: Any) -> FaissVectorDB:
+    """
+    Build a FaissVectorDB over the benchmark vectors.
+
+    Args:
+        vectors: float32 vectors to index
+        **index_kwargs: FaissVectorDB constructor arguments
+
+    Returns:
+        Populated vector database
+    """
+    vector_db = FaissVectorDB(dimension=vectors.shape[1], **index_kwargs)
+    documents = [{'doc_id': i} for i in range(len(vectors))]
+    if not vector_db.add_documents(documents, embeddings=vectors):
+        raise RuntimeError(f"Failed to build index with {index_kwargs}")
+    return vector_db
+
+
+def run_queries(vector_db: FaissVectorDB, queries: np.ndarray, k: int, **search_kwargs: Any) -> Dict[str, Any]:
+    """
+    Run every query one at a time, then all at once, collecting latencies and result ids.
+
+    Args:
+        vector_db: Vector database to search
+        queries: float32 query vectors
+        k: Number of neighbours per query
+        **search_kwargs: Per-query search parameters (nprobe / ef_search / rerank_factor)
+
+    Returns:
+        Dictionary with result ids, per-query latencies and the amortized
+        batch latency per query, in milliseconds
+    """
+    result_ids = []
+    latencies_ms = []
+    for query in queries:
+        start = time.perf_counter()
+        results, _ = vector_db.similarity_search(query, k=k, **search_kwargs)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        result_ids.append([doc['doc_id'] for doc in results])
+
+    start = time.perf_counter()
+    vector_db.batch_similarity_search(queries, k=k, **search_kwargs)
+    batch_ms_per_query = (time.perf_counter() - start) * 1000 / len(queries)
+
+    return {'ids': result_ids, 'latencies_ms': np.array(latencies_ms), 'batch_ms_per_query': batch_ms_per_query}
+
+
+def recall_at_k(result_ids: List[List[int]], ground_truth: List[List[int]], k: int) -> float:
+    """
+    Compute mean recall@k against the exact results.
+
+    Args:
+        result_ids: Approximate result ids per query
+        ground_truth: Exact result ids per query
+        k: Number of neighbours per query
+
+    Returns:
+        Mean fraction of the exact top-k that was retrieved
+    """
+    hits = [len(set(found[:k]) & set(exact[:k])) for found, exact in zip(result_ids, ground_truth)]
+    return float(np.mean(hits)) / k
+
+
+def run_benchmark(vectors: np.ndarray, num_queries: int, k: int, nlist: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Benchmark every index backend across a sweep of search parameters.
+
+    Args:
+        vectors: float32 vectors to index
+        num_queries: Number of queries to run per configuration
+        k: Number of neighbours per query
+        nlist: IVF cluster count (defaults to ~4 * sqrt(n))
+
+    Returns:
+        List of result rows
+    """
+    rng = np.random.default_rng(1)
+    query_rows = rng.choice(len(vectors), num_queries, replace=False)
+    queries = vectors[query_rows] + 0.05 * rng.standard_normal((num_queries, vectors.shape[1]), dtype=np.float32)
+
+    nlist = nlist or max(1, int(4 * np.sqrt(len(vectors))))
+    pq_m = next(m for m in (64, 48, 32, 16, 8, 4, 2, 1) if vectors.shape[1] % m == 0)
+
+    configurations = [
+        ("flat", {}, [{}]),
+        ("hnsw", {'hnsw_m': 32}, [{'ef_search': ef} for ef in (16, 32, 64, 128)]),
+        ("ivf_flat", {'nlist': nlist}, [{'nprobe': p} for p in (1, 4, 16, 64)]),
+        ("ivf_pq", {'nlist': nlist, 'pq_m': pq_m}, [{'nprobe': p} for p in (1, 4, 16, 64)]),
+        ("ivf_opq", {'nlist': nlist, 'pq_m': pq_m}, [{'nprobe': 16, 'rerank_factor': r} for r in (1, 4, 16)]),
+        ("sq8", {}, [{'rerank_factor': r} for r in (1, 4)]),
+    ]
+
+    rows = []
+    ground_truth = None
+    for index_type, index_kwargs, search_sweep in configurations:
+        start = time.perf_counter()
+        vector_db = build_vector_db(vectors, index_type=index_type, **index_kwargs)
+        build_seconds = time.perf_counter() - start
+        if any('rerank_factor' in search_kwargs for search_kwargs in search_sweep):
+            vector_db.set_rerank_vectors(vectors, np.arange(len(vectors)))
+
+        for search_kwargs in search_sweep:
+            run = run_queries(vector_db, queries, k, **search_kwargs)
+            if ground_truth is None:
+                ground_truth = run['ids']
+
+            rows.append({
+                'index_type': index_type,
+                'params': ", ".join(f"{key}={value}" for key, value in search_kwargs.items()) or "exact",
+                'build_s': build_seconds,
+                'p50_ms': float(np.percentile(run['latencies_ms'], 50)),
+                'p95_ms': float(np.percentile(run['latencies_ms'], 95)),
+                'batch_ms': run['batch_ms_per_query'],
+                'recall': recall_at_k(run['ids'], ground_truth, k)
+            })
+
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]], k: int) -> None:
+    """Print the benchmark rows as a table."""
+    print(f"{'index':<10} {'params':<28} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'batch ms/q':>10} {f'recall@{k}':>10}")
+    for row in rows:
+        print(
+            f"{row['index_type']:<10} {row['params']:<28} {row['build_s']:>8.2f} "
+            f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['batch_ms']:>10.3f} {row['recall']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", help="Benchmark the vectors of an existing local index instead of synthetic data")
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.index_path:
+        benchmark_vectors = load_index_vectors(args.index_path)
+    else:
+        benchmark_vectors = make_synthetic_vectors(args.num_vectors, args.dimension)
+
+    print(f"Benchmarking {len(benchmark_vectors)} vectors of dimension {benchmark_vectors.shape[1]}")
+    print_report(run_benchmark(benchmark_vectors, args.num_queries, args.k, args.nlist), args.k)
@@ -0,0 +1,128 @@
+# index_tools.py
+"""
+Maintenance commands for local FAISS index files.
+
+Usage:
+    python index_tools.py migrate-metric gcp-indexes/medical_papers gcp-indexes/medical_papers_ip
+    python index_tools.py convert-documents gcp-indexes/medical_papers
+    python index_tools.py convert-gcs-documents medical_papers ct_epa_1
+    python index_tools.py compress gcp-indexes/medical_papers gcp-indexes/medical_papers_opq
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from src.faiss_db_manager import COMPRESSED_INDEX_TYPES, compress_index, migrate_index_metric
+from src.document_store import convert_documents_file, is_legacy_documents_file
+from src.gcp_storage_adapter import GCPStorageAdapter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def convert_gcs_documents(storage: GCPStorageAdapter, model_id: str) -> bool:
+    """
+    Convert the legacy pickled `.documents` file of an index in GCS.
+
+    Downloads the index, converts its documents and uploads it again in the
+    same (per-file or packaged) format. The upload changes the index's GCS
+    signature, so index caches re-download it on their next freshness check
+    (or when their old copy fails to load). Already converted indexes are
+    left untouched.
+
+    Args:
+        storage: Storage adapter of the bucket
+        model_id: Model ID of the index
+
+    Returns:
+        Success status
+    """
+    gcs_path = f"indexes/{model_id}/{model_id}"
+    packaged = storage.bucket.get_blob(f"{gcs_path}.manifest.json") is not None
+    with tempfile.TemporaryDirectory(prefix="convert_documents_") as temp_dir:
+        local_path = os.path.join(temp_dir, model_id)
+        if not storage.download_index(gcs_path, local_path):
+            return False
+        if not is_legacy_documents_file(f"{local_path}.documents"):
+            logger.info(f"Documents of {model_id} are already converted")
+            return True
+        if not convert_documents_file(f"{local_path}.documents"):
+            return False
+        return storage.upload_index(local_path, gcs_path, packaged=packaged)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-metric",
+        help="Rebuild an index with inner-product (cosine) or L2 distance"
+    )
+    migrate_parser.add_argument("source", help="Existing index path (without extension)")
+    migrate_parser.add_argument("output", help="Output index path (without extension)")
+    migrate_parser.add_argument("--metric", choices=["ip", "l2"], default="ip")
+
+    convert_parser = subparsers.add_parser(
+        "convert-documents",
+        help="Rewrite a trusted legacy pickled .documents file in the columnar format"
+    )
+    convert_parser.add_argument("path", help="Index path (without extension)")
+
+    convert_gcs_parser = subparsers.add_parser(
+        "convert-gcs-documents",
+        help="Convert the legacy pickled .documents files of trusted indexes in GCS and re-upload them"
+    )
+    convert_gcs_parser.add_argument("model_ids", nargs="+", help="Model IDs of the indexes")
+    convert_gcs_parser.add_argument("--bucket", default=None, help="GCS bucket (defaults to the API's bucket)")
+    convert_gcs_parser.add_argument("--credentials", default=None, help="Service account credentials file")
+
+    compress_parser = subparsers.add_parser(
+        "compress",
+        help="Rebuild a rarely queried index as a compressed OPQ/PQ or SQ8 index"
+    )
+    compress_parser.add_argument("source", help="Existing index path (without extension)")
+    compress_parser.add_argument("output", help="Output index path (without extension)")
+    compress_parser.add_argument("--type", choices=COMPRESSED_INDEX_TYPES, default="ivf_opq")
+    compress_parser.add_argument("--pq-m", type=int, default=64, help="PQ sub-quantizers (bytes per vector)")
+    compress_parser.add_argument("--nlist", type=int, default=None, help="IVF clusters (defaults to ~4 * sqrt(n))")
+    compress_parser.add_argument(
+        "--no-raw-vectors",
+        action="store_true",
+        help="Do not keep the float32 vectors on disk for exact re-ranking"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "migrate-metric":
+        success = migrate_index_metric(args.source, args.output, metric=args.metric)
+    elif args.command == "convert-documents":
+        success = convert_documents_file(f"{args.path}.documents")
+    elif args.command == "convert-gcs-documents":
+        from main import GCS_BUCKET_NAME, GCS_CREDENTIALS_PATH
+        storage = GCPStorageAdapter(
+            bucket_name=args.bucket or GCS_BUCKET_NAME,
+            credentials_path=args.credentials or GCS_CREDENTIALS_PATH
+        )
+        results = {model_id: convert_gcs_documents(storage, model_id) for model_id in args.model_ids}
+        failed = [model_id for model_id, converted in results.items() if not converted]
+        if failed:
+            logger.error(f"Failed to convert the documents of: {', '.join(failed)}")
+        success = not failed
+    elif args.command == "compress":
+        success = compress_index(
+            args.source,
+            args.output,
+            index_type=args.type,
+            pq_m=args.pq_m,
+            nlist=args.nlist,
+            keep_raw_vectors=not args.no_raw_vectors
+        )
+
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
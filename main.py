@@ -8,13 +8,16 @@ for var in proxy_vars:
     if var in os.environ:
         print(f"Removing proxy env var: {var}={os.environ[var]}")
         del os.environ[var]
+import logging
 from typing import Any, Dict, Optional
 
 from dotenv import load_dotenv
 from src.rag_module import RAGModule
 from src.vectorization import VectorizationModule
-from src.faiss_db_manager import FaissVectorDB
+from src.faiss_db_manager import FaissVectorDB, federated_search
 from src.gcp_storage_adapter import GCPStorageAdapter
+from src.index_cache import IndexCacheManager
+from src.reranker import rerank_results
 from src.clinical_trials_rag_pipeline import ClinicalTrialsRAGPipeline
 
 import openai
@@ -26,13 +29,26 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+GCS_BUCKET_NAME = "intraintel-cloudrun-clinical-volume"
+GCS_CREDENTIALS_PATH = "service_account_credentials.json"
+
 class BenchmarkComparison:
     def __init__(self, api_key: Optional[str] = None,
                  model: str = os.getenv("MODEL_ID_GPT5", "gpt-5-2025-08-07"),
                  temperature: float = 0.0,
-                 max_tokens: int = 1000):
-        self.vectorizer = VectorizationModule()
-        self.vector_db = FaissVectorDB()
+                 max_tokens: int = 1000,
+                 index_cache: Optional[IndexCacheManager] = None):
+        embedding_dimensions = os.getenv("EMBEDDING_DIMENSIONS")
+        self.vectorizer = VectorizationModule(
+            model_name=os.getenv("EMBEDDING_MODEL_ID", "text-embedding-ada-002"),
+            dimensions=int(embedding_dimensions) if embedding_dimensions else None
+        )
+        self.vector_db = FaissVectorDB(
+            dimension=self.vectorizer.embedding_dim,
+            embedding_model=self.vectorizer.model_name
+        )
         self.rag = RAGModule()
         self.model = model
         self.temperature = temperature
@@ -48,30 +64,76 @@ class BenchmarkComparison:
         # Initialize OpenAI client
         self.client = openai.OpenAI(api_key=self.api_key)
         self.gcp_storage = GCPStorageAdapter(
-            bucket_name="intraintel-cloudrun-clinical-volume",
-            credentials_path="service_account_credentials.json"
+            bucket_name=GCS_BUCKET_NAME,
+            credentials_path=GCS_CREDENTIALS_PATH
         )
+        # Shared across requests by the API so LRU state and background refresh persist
+        self.index_cache = index_cache or IndexCacheManager(self.gcp_storage)
         
     def get_summary(self) -> str:
         return "Benchmark comparison between local and FDA agents"
         
+    def _load_vector_db(self, model_id: str) -> FaissVectorDB:
+        """
+        Get the loaded index of one model_id, downloading and loading it if needed.
+        
+        Args:
+            model_id: Model ID of the index
+            
+        Returns:
+            Loaded vector database (shared through the index cache; search only)
+        """
+        vector_db = self.index_cache.load_vector_db(model_id)
+        
+        if vector_db.dimension != self.vectorizer.embedding_dim:
+            raise ValueError(
+                f"Index {model_id} has dimension {vector_db.dimension} but query embeddings "
+                f"have dimension {self.vectorizer.embedding_dim}"
+            )
+        if vector_db.embedding_model and vector_db.embedding_model != self.vectorizer.model_name:
+            raise ValueError(
+                f"Index {model_id} was built with {vector_db.embedding_model} but queries "
+                f"use {self.vectorizer.model_name}"
+            )
+        
+        return vector_db
+        
     def query(self, question: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         try:
             model_id = context.get('model_id', 'medical_papers')
+            model_ids = context.get('model_ids') or [model_id]
             top_k = context.get('top_k', 5)
+            additional_queries = context.get('additional_queries', [])
+            rerank = context.get('rerank')
+            if rerank is None:
+                rerank = os.getenv("LEXICAL_RERANK", "false").lower() == "true"
+            
+            # With re-ranking, retrieve a wider candidate set and keep the best top_k after fusion
+            search_k = (context.get('rerank_candidates') or 4 * top_k) if rerank else top_k
+            
+            if len(model_ids) > 1:
+                vector_dbs = {index_id: self._load_vector_db(index_id) for index_id in model_ids}
+            else:
+                self.vector_db = self._load_vector_db(model_ids[0])
             
-            # Download and load index
-            index_path = os.path.join("gcp-indexes", model_id)
-            if not os.path.exists(index_path):
-                if not self.gcp_storage.download_index_using_model_id(model_id, index_path):
-                    raise ValueError(f"Failed to download index: {model_id}")
+            # Process query (alternative phrasings are embedded and searched as one batch)
+            if additional_queries:
+                query_embeddings = self.vectorizer.embed_queries([question] + list(additional_queries))
+            else:
+                query_embeddings = self.vectorizer.embed_query(question)
             
-            if not self.vector_db.load(f"gcp-indexes/{model_id}"):
-                raise ValueError(f"Failed to load index: {model_id}")
+            if len(model_ids) > 1:
+                # Papers split across several indexes: search them all in parallel and merge by score
+                results, scores = federated_search(vector_dbs, query_embeddings, k=search_k)
+            else:
+                if additional_queries:
+                    results, scores = self.vector_db.multi_query_search(query_embeddings, k=search_k)
+                else:
+                    results, scores = self.vector_db.similarity_search(query_embeddings, k=search_k)
             
-            # Process query
-            query_embedding = self.vectorizer.embed_query(question)
-            results, _ = self.vector_db.similarity_search(query_embedding, k=top_k)
+            if rerank:
+                # Fuse vector similarity with BM25 over the candidates' text (reciprocal rank fusion)
+                results, _ = rerank_results(question, results, scores, top_k)
             documents = self.vector_db.get_langchain_documents(results)
             
             return {
@@ -111,10 +173,52 @@ class BenchmarkComparison:
         answer = response.choices[0].message.content.strip()
         return answer
 
-    def fetch_clinical_ncts(self, local_study: str):
-        clinical_fetcher = ClinicalTrialsRAGPipeline(openai_client=self.client, model_name=self.model)
-        fetch_result = clinical_fetcher.fetch_clinical_trials_data(local_study)
-        trials_data = fetch_result['data']
+    @staticmethod
+    def _study_prefilter_top_n() -> Optional[int]:
+        """CT_STUDY_PREFILTER_TOP_N, or None (pre-filter disabled) if unset, not positive or malformed."""
+        value = os.getenv("CT_STUDY_PREFILTER_TOP_N", "")
+        try:
+            top_n = int(value) if value.strip() else 0
+        except ValueError:
+            logger.warning(f"Ignoring malformed CT_STUDY_PREFILTER_TOP_N={value!r}; study pre-filter disabled")
+            return None
+        return top_n if top_n > 0 else None
+
+    def _create_clinical_fetcher(self) -> ClinicalTrialsRAGPipeline:
+        return ClinicalTrialsRAGPipeline(
+            openai_client=self.client,
+            model_name=self.model,
+            study_prefilter_top_n=self._study_prefilter_top_n()
+        )
+
+    def speculative_fetch_trials(self, question: str) -> Dict[str, Any]:
+        """
+        Fetch candidate trials from the raw user question.
+        
+        Runs while the local study profile is still being generated. A
+        successful result is the candidate set of fetch_clinical_ncts, so the
+        profile-based URL generation and fetch are skipped; the profile only
+        pre-filters and ranks the candidates.
+        
+        Args:
+            question: Raw user question
+            
+        Returns:
+            Fetch result as returned by ClinicalTrialsRAGPipeline.fetch_clinical_trials_data
+        """
+        return self._create_clinical_fetcher().fetch_clinical_trials_data(question)
+
+    def fetch_clinical_ncts(self, local_study: str, speculative_result: Optional[Dict[str, Any]] = None):
+        clinical_fetcher = self._create_clinical_fetcher()
+        if speculative_result and speculative_result.get('success') and (speculative_result.get('data') or {}).get('studies'):
+            # The speculative studies are the candidates; the profile refines and ranks them below
+            fetch_result = speculative_result
+            logger.info(f"Using speculative fetch: {len(fetch_result['data']['studies'])} candidate studies")
+        else:
+            fetch_result = clinical_fetcher.fetch_clinical_trials_data(local_study)
+        if not fetch_result.get('success'):
+            return {"success": False, "data": {}, "nct_ids": []}
+        trials_data = clinical_fetcher.prefilter_studies(local_study, fetch_result['data'])
         # print(f"Fetched (trials_data) clinical trials from ClinicalTrials.gov : {trials_data}")
         chunks = clinical_fetcher.process_and_chunk_data(trials_data)
         chunk_embeddings = clinical_fetcher.vectorize_chunks(chunks)
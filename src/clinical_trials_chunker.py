@@ -351,4 +351,52 @@ class ClinicalTrialsChunker:
             logger.error(f"Error chunking clinical trials data: {e}")
             
         return all_chunks
+
+    def create_study_summaries(self, clinical_trials_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Create one compact summary per study for study-level pre-filtering.
+        
+        The summary only carries the title, conditions and intervention names so
+        that it stays short enough to embed every fetched study cheaply.
+        
+        Args:
+            clinical_trials_data: Raw clinical trials data from API
+            
+        Returns:
+            List of summary dictionaries with 'study_id' and 'content'
+        """
+        summaries = []
+        
+        try:
+            studies = clinical_trials_data.get('studies', [])
+            
+            for study in studies:
+                protocol_section = study.get('protocolSection', {})
+                identification = protocol_section.get('identificationModule', {})
+                study_id = identification.get('nctId', 'unknown')
+                
+                conditions = protocol_section.get('conditionsModule', {}).get('conditions', [])
+                interventions = protocol_section.get('armsInterventionsModule', {}).get('interventions', [])
+                intervention_names = [
+                    f"{intervention.get('type', '')} {intervention.get('name', '')}".strip()
+                    for intervention in interventions
+                ]
+                
+                summary_content = (
+                    f"Study: {identification.get('briefTitle', '')} "
+                    f"Conditions: {', '.join(conditions)} "
+                    f"Interventions: {', '.join(intervention_names)}"
+                )
+                
+                summaries.append({
+                    'study_id': study_id,
+                    'content': self.clean_text(summary_content)
+                })
+                
+            logger.info(f"Created {len(summaries)} study summaries for pre-filtering")
+            
+        except Exception as e:
+            logger.error(f"Error creating study summaries: {e}")
+            
+        return summaries
     
\ No newline at end of file
@@ -1,7 +1,10 @@
 # clinical_trials_rag_pipeline.py
 import logging
+import threading
 import time
 import os
+import numpy as np # type: ignore
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import Dict, Any, Optional, List
 from .fetcher import ClinicalTrialsFetcherAgent
 from .clinical_trials_chunker import ClinicalTrialsChunker
@@ -17,6 +20,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Time budget of process_query shared by the RAG steps and the endpoint prediction
+PIPELINE_DEADLINE_SECONDS = float(os.getenv("PIPELINE_DEADLINE_SECONDS", "300"))
+
+# Background endpoint predictions, shared by all pipelines of the process
+ENDPOINT_PREDICTION_WORKERS = int(os.getenv("ENDPOINT_PREDICTION_WORKERS", "8"))
+_endpoint_executor = ThreadPoolExecutor(max_workers=ENDPOINT_PREDICTION_WORKERS, thread_name_prefix="endpoint-prediction")
+
 class ClinicalTrialsRAGPipeline:
     """
     End-to-end RAG pipeline for clinical trials data.
@@ -27,11 +37,13 @@ class ClinicalTrialsRAGPipeline:
                  openai_client=None,
                  model_name: str = os.getenv("MODEL_ID_GPT5", "gpt-5-2025-08-07"),
                  embedding_model: str = "text-embedding-ada-002",
+                 embedding_dimensions: Optional[int] = None,
                  max_trials: int = 5,  # Lowered for faster inference
                  max_chunks_per_trial: int = 5,  # Lowered for faster inference
                  max_context_length: int = 100000,
                  chunk_size: int = 10000,
-                 chunk_overlap: int = 500):
+                 chunk_overlap: int = 500,
+                 study_prefilter_top_n: Optional[int] = None):
         """
         Initialize the Clinical Trials RAG Pipeline.
         
@@ -39,14 +51,21 @@ class ClinicalTrialsRAGPipeline:
             openai_client: OpenAI client instance (optional)
             model_name: OpenAI model for answer generation
             embedding_model: OpenAI model for embeddings
+            embedding_dimensions: Reduced embedding dimension (None for the model's native size)
             max_trials: Maximum number of trials to fetch
             max_chunks_per_trial: Maximum chunks to create per trial
             max_context_length: Maximum context length for RAG
             chunk_size: Size of each chunk in characters
             chunk_overlap: Overlap between chunks in characters
+            study_prefilter_top_n: If set (and positive), enables two-stage retrieval: only
+                the top N studies by summary similarity are chunked and embedded in full
         """
         self.max_trials = max_trials
         self.max_chunks_per_trial = max_chunks_per_trial
+        # Zero or negative disables the pre-filter (a negative slice would drop studies)
+        self.study_prefilter_top_n = study_prefilter_top_n if study_prefilter_top_n and study_prefilter_top_n > 0 else None
+        self._query_embeddings = {}  # query text -> embedding, see embed_query
+        self._query_embedding_lock = threading.Lock()
         
         # Initialize components
         logger.info("Initializing Clinical Trials RAG Pipeline components...")
@@ -79,7 +98,8 @@ class ClinicalTrialsRAGPipeline:
             
             # Initialize vectorizer
             self.vectorizer = ClinicalTrialsVectorizer(
-                openai_model=embedding_model
+                openai_model=embedding_model,
+                dimensions=embedding_dimensions
             )
             logger.info("[OK] ClinicalTrialsVectorizer initialized")
             
@@ -95,7 +115,11 @@ class ClinicalTrialsRAGPipeline:
             )
             logger.info("[OK] ClinicalTrialsRAGModule initialized")
             
-            self.endpoint_predictor = EndpointPredictionAPIIntegration()
+            # The classifier's optional linear model reuses the pipeline's query embeddings
+            self.endpoint_predictor = EndpointPredictionAPIIntegration(
+                embed_query=self.embed_query,
+                embedding_model=self.vectorizer.openai_model
+            )
             logger.info("[OK] EndpointPredictionAPIIntegration initialized")
 
             logger.info("Clinical Trials RAG Pipeline initialization complete!")
@@ -152,6 +176,72 @@ class ClinicalTrialsRAGPipeline:
                 'data': None
             }
     
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a query once per pipeline.
+        
+        Pre-filtering, retrieval and the endpoint query classifier (running
+        concurrently) all need the same query embedding; the first caller
+        computes it and the others reuse it.
+        
+        Args:
+            query: Query text
+            
+        Returns:
+            Query embedding
+        """
+        with self._query_embedding_lock:
+            if query not in self._query_embeddings:
+                embedding = self.vectorizer.embed_query(query)
+                if not np.any(embedding):
+                    return embedding  # failed (zero) embeddings are not cached
+                self._query_embeddings[query] = embedding
+            return self._query_embeddings[query]
+    
+    def prefilter_studies(self, query: str, trials_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Keep only the studies most similar to the query before full chunking.
+        
+        Embeds one compact summary per study (title + conditions + interventions)
+        and keeps the top `study_prefilter_top_n` studies, so that only those are
+        chunked and embedded in full. Returns the data unchanged when the
+        pre-filter is disabled or fails.
+        
+        Args:
+            query: User query
+            trials_data: Raw clinical trials data from API
+            
+        Returns:
+            Clinical trials data restricted to the top studies
+        """
+        studies = trials_data.get('studies', []) if trials_data else []
+        if not self.study_prefilter_top_n or len(studies) <= self.study_prefilter_top_n:
+            return trials_data
+        
+        logger.info(f"Pre-filtering {len(studies)} studies to top {self.study_prefilter_top_n} by summary similarity...")
+        
+        try:
+            summaries = self.chunker.create_study_summaries(trials_data)
+            summary_embeddings = self.vectorizer.get_batch_embeddings([summary['content'] for summary in summaries])
+            query_embedding = self.embed_query(query)
+            
+            # Key by position so studies sharing an unknown NCT ID stay distinct
+            similarities = self.vectorizer.compute_similarity(
+                query_embedding,
+                {i: {'embedding': embedding} for i, embedding in enumerate(summary_embeddings)}
+            )
+            top_positions = sorted(similarities, key=similarities.get, reverse=True)[:self.study_prefilter_top_n]
+            
+            filtered_data = dict(trials_data)
+            filtered_data['studies'] = [studies[i] for i in sorted(top_positions)]
+            
+            logger.info(f"Kept {len(filtered_data['studies'])} of {len(studies)} studies after pre-filtering")
+            return filtered_data
+            
+        except Exception as e:
+            logger.error(f"Error pre-filtering studies, using all studies: {e}")
+            return trials_data
+    
     def process_and_chunk_data(self, trials_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Process and chunk the fetched clinical trials data.
@@ -221,8 +311,8 @@ class ClinicalTrialsRAGPipeline:
         logger.info(f"Retrieving relevant context for query: '{query[:50]}...'")
         
         try:
-            # Embed the query
-            query_embedding = self.vectorizer.embed_query(query)
+            # Embed the query (usually cached from pre-filtering or endpoint classification)
+            query_embedding = self.embed_query(query)
             
             # Extract relevant context
             context_result = self.context_extractor.extract_context(
@@ -282,20 +372,68 @@ class ClinicalTrialsRAGPipeline:
                 'metadata': {'error': str(e)}
             }
     
-    def process_query(self, query: str, top_k: int = 10) -> Dict[str, Any]:
+    @staticmethod
+    def _check_deadline(deadline: float, next_step: str) -> None:
+        """
+        Stop processing a query whose deadline has passed.
+        
+        Args:
+            deadline: time.monotonic() value by which the query must be answered
+            next_step: Step about to start (for the error message)
+            
+        Raises:
+            TimeoutError: If the deadline has passed
+        """
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Query deadline exceeded before {next_step}")
+    
+    def _collect_endpoint_prediction(self, endpoint_future: Future, deadline: float) -> str:
+        """
+        Wait for the endpoint prediction until the shared deadline.
+        
+        Args:
+            endpoint_future: Future of endpoint_predictor.process_query
+            deadline: time.monotonic() value by which the query must be answered
+            
+        Returns:
+            Endpoint prediction as text, or a placeholder if none is available in time
+        """
+        try:
+            endpoint_results = endpoint_future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            logger.warning("Endpoint prediction missed the query deadline; answering without it")
+            endpoint_results = None
+        except Exception as e:
+            logger.error(f"Endpoint prediction failed: {e}")
+            endpoint_results = None
+        return str(endpoint_results) if endpoint_results else "No endpoint prediction available"
+    
+    def process_query(self, query: str, top_k: int = 10, deadline_seconds: Optional[float] = None) -> Dict[str, Any]:
         """
         Main method to process a clinical trials query end-to-end.
         
+        The endpoint prediction only needs the query, so it runs in the background
+        alongside the whole RAG path instead of after the answer is generated. Both
+        share one deadline: it is checked before every RAG step (a step already
+        running is not interrupted, and the query fails once it has passed), and a
+        prediction that is not ready by the time the answer is done is left out.
+        
         Args:
             query: User query about clinical trials
             top_k: Number of top relevant chunks to use for context
+            deadline_seconds: Time budget for the query (defaults to PIPELINE_DEADLINE_SECONDS)
             
         Returns:
             Dictionary containing the complete response
         """
         start_time = time.time()
+        deadline = time.monotonic() + (deadline_seconds or PIPELINE_DEADLINE_SECONDS)
         logger.info(f"Starting end-to-end processing for query: '{query}'")
         
+        # Step 0: Endpoint classification + prediction, concurrently with steps 1-6
+        # A late prediction is never waited for; its own requests stop at the deadline
+        endpoint_future = _endpoint_executor.submit(self.endpoint_predictor.process_query, query, deadline)
+        
         try:
             # Step 1: Fetch clinical trials data
             fetch_result = self.fetch_clinical_trials_data(query)
@@ -310,7 +448,12 @@ class ClinicalTrialsRAGPipeline:
             
             trials_data = fetch_result['data']
             
-            # Step 2: Process and chunk data
+            # Step 2: Pre-filter studies by summary similarity (two-stage mode)
+            self._check_deadline(deadline, "pre-filtering")
+            trials_data = self.prefilter_studies(query, trials_data)
+            
+            # Step 3: Process and chunk data
+            self._check_deadline(deadline, "chunking")
             chunks = self.process_and_chunk_data(trials_data)
             
             if not chunks:
@@ -321,7 +464,8 @@ class ClinicalTrialsRAGPipeline:
                     'processing_time': time.time() - start_time
                 }
             
-            # Step 3: Vectorize chunks
+            # Step 4: Vectorize chunks
+            self._check_deadline(deadline, "vectorizing")
             chunk_embeddings = self.vectorize_chunks(chunks)
             
             if not chunk_embeddings:
@@ -332,15 +476,16 @@ class ClinicalTrialsRAGPipeline:
                     'processing_time': time.time() - start_time
                 }
             
-            # Step 4: Retrieve relevant context
+            # Step 5: Retrieve relevant context
+            self._check_deadline(deadline, "retrieval")
             context_result = self.retrieve_relevant_context(query, chunk_embeddings, top_k)
             
-            # Step 5: Generate final answer
+            # Step 6: Generate final answer
+            self._check_deadline(deadline, "answer generation")
             answer_result = self.generate_final_answer(query, context_result)
 
-            # Step 6: Endpoint prediction integration
-            endpoint_results = self.endpoint_predictor.process_query(query) #implement this part in async way later
-            endpoint_results = str(endpoint_results) if endpoint_results else "No endpoint prediction available"
+            # Step 7: Join the endpoint prediction started in step 0
+            endpoint_results = self._collect_endpoint_prediction(endpoint_future, deadline)
             
             # Calculate processing time
             processing_time = time.time() - start_time
@@ -357,8 +502,10 @@ class ClinicalTrialsRAGPipeline:
                     'processing_time': processing_time,
                     'total_trials_fetched': fetch_result.get('total_count', 0),
                     'trials_processed': fetch_result.get('studies_returned', 0),
+                    'trials_after_prefilter': len(trials_data.get('studies', [])),
                     'chunks_created': len(chunks),
                     'chunks_vectorized': len(chunk_embeddings),
+                    'embedding_dedup': self.vectorizer.last_dedup_stats,
                     'relevant_chunks': context_result.get('chunk_count', 0),
                     'fetch_metadata': {
                         'source_url': fetch_result.get('source_url', ''),
@@ -366,6 +513,7 @@ class ClinicalTrialsRAGPipeline:
                     }
                 },
                 'endpoint_prediction': endpoint_results,
+                'endpoint_api': self.endpoint_predictor.circuit_breaker.get_metrics(),
                 'quality_assessment': answer_result.get('quality_assessment', {})
             }
             
@@ -403,9 +551,11 @@ class ClinicalTrialsRAGPipeline:
             'configuration': {
                 'max_trials': self.max_trials,
                 'max_chunks_per_trial': self.max_chunks_per_trial,
+                'study_prefilter_top_n': self.study_prefilter_top_n,
                 'chunker_max_size': self.chunker.max_chunk_size,
                 'chunker_overlap': self.chunker.overlap_size,
                 'vectorizer_model': self.vectorizer.openai_model,
+                'vectorizer_dimension': self.vectorizer.embedding_dim,
                 'context_max_length': self.context_extractor.max_context_length,
                 'rag_model': self.rag_module.model_name
             }
@@ -3,12 +3,23 @@ import os
 import time
 import logging
 import numpy as np # type: ignore
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import backoff # type: ignore
 from dotenv import load_dotenv # type: ignore
 from openai import OpenAI, APIError, APITimeoutError, RateLimitError, APIConnectionError, BadRequestError # type: ignore
 from openai.types.create_embedding_response import CreateEmbeddingResponse # type: ignore
 from openai.types import Embedding # type: ignore
+from .embedding_utils import (
+    EMBEDDING_DTYPE,
+    resolve_embedding_dimension,
+    embedding_request_kwargs,
+    decode_embedding_into,
+    decode_embeddings_into,
+    deduplicate_texts,
+    dedup_stats,
+    zero_embedding,
+    cosine_similarities,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,16 +29,26 @@ class ClinicalTrialsVectorizer:
     Optimized for clinical trial data with appropriate chunking and batch processing.
     """
 
-    def __init__(self, openai_model: str = "text-embedding-ada-002"):
+    def __init__(self, openai_model: str = "text-embedding-ada-002", dimensions: Optional[int] = None,
+                 encoding_format: str = "base64"):
         """
         Initialize the vectorization module.
         
         Args:
             openai_model: The OpenAI embedding model to use
+            dimensions: Reduced output dimension for models that support it (e.g. 256/512)
+            encoding_format: Embedding transport format, "base64" (compact) or "float" (JSON lists)
         """
         load_dotenv()
         self.openai_model = openai_model
-        self.embedding_dim = 1536  # text-embedding-ada-002 returns 1536-dimensional embeddings
+        self.dimensions = dimensions
+        self.encoding_format = encoding_format
+        self.embedding_dim = resolve_embedding_dimension(openai_model, dimensions)
+        
+        # Chunk text deduplication counters (last request and cumulative)
+        self.last_dedup_stats = dedup_stats(0, 0)
+        self.total_texts_seen = 0
+        self.total_texts_embedded = 0
         
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
@@ -35,7 +56,7 @@ class ClinicalTrialsVectorizer:
         
         # Initialize OpenAI client
         self.client = OpenAI(api_key=self.api_key)
-        logger.info(f"Initialized ClinicalTrialsVectorizer with model: {self.openai_model}")
+        logger.info(f"Initialized ClinicalTrialsVectorizer with model: {self.openai_model} ({self.embedding_dim} dimensions)")
 
     @backoff.on_exception(
         backoff.expo,
@@ -51,13 +72,13 @@ class ClinicalTrialsVectorizer:
             text: Text to embed
         
         Returns:
-            numpy array representing the embedding
+            float32 numpy array representing the embedding
         """
         try:
             # Ensure text is not empty
             if not text or not text.strip():
                 logger.warning("Empty text provided for embedding, returning zero vector")
-                return np.zeros(self.embedding_dim)
+                return zero_embedding(self.embedding_dim)
                 
             # Truncate text if too long (OpenAI has token limits)
             max_tokens = 8000  # Conservative limit
@@ -68,15 +89,18 @@ class ClinicalTrialsVectorizer:
             response: CreateEmbeddingResponse = self.client.embeddings.create(
                 input=[text],
                 model=self.openai_model,
-                encoding_format="float"
+                encoding_format=self.encoding_format,
+                **embedding_request_kwargs(self.openai_model, self.dimensions)
             )
             
             embedding: Embedding = response.data[0]
-            return np.array(embedding.embedding)
+            embedding_vector = np.empty(self.embedding_dim, dtype=EMBEDDING_DTYPE)
+            decode_embedding_into(embedding.embedding, embedding_vector)
+            return embedding_vector
             
         except Exception as e:
             logger.error(f"Error getting embedding: {e}")
-            return np.zeros(self.embedding_dim)
+            return zero_embedding(self.embedding_dim)
 
     @backoff.on_exception(
         backoff.expo,
@@ -84,18 +108,19 @@ class ClinicalTrialsVectorizer:
         max_tries=5,
         factor=2
     )
-    def get_batch_embeddings(self, texts: List[str], batch_size: int = 50) -> List[np.ndarray]:
+    def get_batch_embedding_matrix(self, texts: List[str], batch_size: int = 50) -> np.ndarray:
         """
-        Get embeddings for a batch of texts with rate limiting.
+        Get embeddings for a batch of texts as one contiguous matrix, with rate limiting.
         
         Args:
             texts: List of text strings to embed
             batch_size: Number of texts to process per API call
         
         Returns:
-            List of numpy arrays representing embeddings
+            float32 array of shape (len(texts), embedding_dim)
         """
-        all_embeddings = []
+        # Preallocated float32 matrix; empty texts and failed batches stay zero vectors
+        all_embeddings = np.zeros((len(texts), self.embedding_dim), dtype=EMBEDDING_DTYPE)
         
         for i in range(0, len(texts), batch_size):
             batch = texts[i:i + batch_size]
@@ -110,29 +135,22 @@ class ClinicalTrialsVectorizer:
                     
             if not valid_batch:
                 # All texts in batch were empty
-                batch_embeddings = [np.zeros(self.embedding_dim) for _ in batch]
-                all_embeddings.extend(batch_embeddings)
                 continue
             
             try:
                 response: CreateEmbeddingResponse = self.client.embeddings.create(
                     input=valid_batch,
                     model=self.openai_model,
-                    encoding_format="float"
+                    encoding_format=self.encoding_format,
+                    **embedding_request_kwargs(self.openai_model, self.dimensions)
                 )
                 
-                # Create embeddings array for full batch (including empty texts)
-                batch_embeddings = []
-                valid_idx = 0
-                
-                for j in range(len(batch)):
-                    if j in valid_indices:
-                        batch_embeddings.append(np.array(response.data[valid_idx].embedding))
-                        valid_idx += 1
-                    else:
-                        batch_embeddings.append(np.zeros(self.embedding_dim))
-                
-                all_embeddings.extend(batch_embeddings)
+                # Decode valid texts into their rows (empty texts keep zero vectors)
+                if len(valid_indices) == len(batch):
+                    decode_embeddings_into(response.data, all_embeddings[i:i + len(batch)])
+                else:
+                    for item, index in zip(response.data, valid_indices):
+                        decode_embedding_into(item.embedding, all_embeddings[i + index])
                 
                 # Rate limiting - pause between batches
                 if i + batch_size < len(texts):
@@ -141,16 +159,31 @@ class ClinicalTrialsVectorizer:
             except Exception as e:
                 logger.error(f"Error in batch embedding: {e}")
                 # Return zero vectors for failed batch
-                batch_embeddings = [np.zeros(self.embedding_dim) for _ in batch]
-                all_embeddings.extend(batch_embeddings)
+                all_embeddings[i:i + batch_size] = 0.0
         
         logger.info(f"Successfully embedded {len(all_embeddings)} texts")
         return all_embeddings
 
+    def get_batch_embeddings(self, texts: List[str], batch_size: int = 50) -> List[np.ndarray]:
+        """
+        Get embeddings for a batch of texts with rate limiting.
+        
+        Args:
+            texts: List of text strings to embed
+            batch_size: Number of texts to process per API call
+        
+        Returns:
+            List of float32 numpy arrays (row views of one contiguous matrix)
+        """
+        return list(self.get_batch_embedding_matrix(texts, batch_size))
+
     def embed_chunks(self, chunks: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
         """
         Embed clinical trial chunks.
         
+        Identical chunk texts (shared sponsor/location blocks, sibling trials)
+        are embedded once and the vector is shared by every matching chunk ID.
+        
         Args:
             chunks: List of chunk dictionaries containing 'content' and metadata
         
@@ -172,8 +205,18 @@ class ClinicalTrialsVectorizer:
             chunk_texts.append(content)
             chunk_ids.append(chunk_id)
         
-        # Get embeddings
-        embeddings = self.get_batch_embeddings(chunk_texts)
+        # Embed each unique text once and fan the rows back out to all chunk IDs
+        unique_texts, inverse = deduplicate_texts(chunk_texts)
+        unique_embeddings = self.get_batch_embedding_matrix(unique_texts)
+        embeddings = [unique_embeddings[position] for position in inverse]
+        
+        self.last_dedup_stats = dedup_stats(len(chunk_texts), len(unique_texts))
+        self.total_texts_seen += len(chunk_texts)
+        self.total_texts_embedded += len(unique_texts)
+        logger.info(
+            f"Embedding {len(unique_texts)} unique texts for {len(chunk_texts)} chunks "
+            f"(dedup ratio {self.last_dedup_stats['dedup_ratio']:.1%})"
+        )
         
         # Create mapping
         embedded_chunks = {}
@@ -186,6 +229,18 @@ class ClinicalTrialsVectorizer:
         logger.info(f"Successfully embedded {len(embedded_chunks)} clinical trial chunks")
         return embedded_chunks
 
+    def get_dedup_stats(self) -> Dict[str, Any]:
+        """
+        Get chunk deduplication counters.
+        
+        Returns:
+            Dictionary with the last request's stats and cumulative totals
+        """
+        return {
+            'last_request': self.last_dedup_stats,
+            'cumulative': dedup_stats(self.total_texts_seen, self.total_texts_embedded)
+        }
+
     def embed_query(self, query_text: str) -> np.ndarray:
         """
         Embed a query string for similarity search.
@@ -199,13 +254,13 @@ class ClinicalTrialsVectorizer:
         try:
             if not query_text or not query_text.strip():
                 logger.warning("Empty query provided")
-                return np.zeros(self.embedding_dim)
+                return zero_embedding(self.embedding_dim)
                 
             return self.get_embedding(query_text)
             
         except Exception as e:
             logger.error(f"Error embedding query: {e}")
-            return np.zeros(self.embedding_dim)
+            return zero_embedding(self.embedding_dim)
 
     def compute_similarity(self, query_embedding: np.ndarray, chunk_embeddings: Dict[str, np.ndarray]) -> Dict[str, float]:
         """
@@ -218,32 +273,19 @@ class ClinicalTrialsVectorizer:
         Returns:
             Dictionary mapping chunk IDs to similarity scores
         """
-        similarities = {}
+        if not chunk_embeddings:
+            return {}
         
-        # Normalize query embedding
-        query_norm = np.linalg.norm(query_embedding)
-        if query_norm == 0:
+        if not np.any(query_embedding):
             logger.warning("Query embedding is zero vector")
             return {chunk_id: 0.0 for chunk_id in chunk_embeddings.keys()}
         
-        normalized_query = query_embedding / query_norm
-        
-        for chunk_id, chunk_data in chunk_embeddings.items():
-            embedding = chunk_data['embedding']
-            
-            # Normalize chunk embedding
-            chunk_norm = np.linalg.norm(embedding)
-            if chunk_norm == 0:
-                similarities[chunk_id] = 0.0
-                continue
-            
-            normalized_chunk = embedding / chunk_norm
-            
-            # Compute cosine similarity
-            similarity = np.dot(normalized_query, normalized_chunk)
-            similarities[chunk_id] = float(similarity)
+        # Score all chunks at once with the shared cosine kernel (zero vectors score 0.0)
+        chunk_ids = list(chunk_embeddings.keys())
+        embedding_matrix = np.stack([chunk_embeddings[chunk_id]['embedding'] for chunk_id in chunk_ids])
+        scores = cosine_similarities(query_embedding, embedding_matrix)
         
-        return similarities
+        return dict(zip(chunk_ids, scores.tolist()))
 
     def find_most_similar_chunks(self, 
                                 query_embedding: np.ndarray, 
@@ -0,0 +1,362 @@
+# document_store.py
+import json
+import logging
+import os
+import pickle
+from collections.abc import Sequence
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# File signature of the columnar document format (legacy files are plain pickles)
+DOCUMENT_STORE_MAGIC = b"FDOCCOL1"
+
+# Sections are 8-byte aligned so numeric columns can be viewed in place
+_ALIGNMENT = 8
+
+_NUMPY_COLUMN_TYPES = {
+    "int64": np.dtype("<i8"),
+    "float64": np.dtype("<f8"),
+    "bool": np.dtype("u1"),
+}
+
+
+def _infer_column_type(values: List[Any]) -> str:
+    """
+    Pick the storage type for one metadata key.
+
+    Args:
+        values: Values of the documents that have the key
+
+    Returns:
+        "bool", "int64", "float64", "str" or "json" (anything else, incl. mixed types)
+    """
+    # NumPy scalars (common in legacy pickled indexes) are typed like their Python counterparts
+    if all(isinstance(value, (bool, np.bool_)) for value in values):
+        return "bool"
+    if all(
+        isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)) and -2**63 <= int(value) < 2**63
+        for value in values
+    ):
+        return "int64"
+    if all(isinstance(value, (float, np.floating)) for value in values):
+        return "float64"
+    if all(isinstance(value, str) for value in values):
+        return "str"
+    return "json"
+
+
+def _json_default(value: Any) -> Any:
+    """Convert NumPy scalars and arrays for json.dumps."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_json(key: str, value: Any) -> str:
+    """
+    Encode one value of a "json" column.
+
+    Raises:
+        ValueError: If the value cannot be stored, naming the metadata key
+    """
+    try:
+        return json.dumps(value, default=_json_default)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Cannot store metadata key {key!r}: {e}") from e
+
+
+class _Column:
+    """Read-only view of one column inside a memory-mapped document file."""
+
+    def __init__(self, name: str, column_type: str, presence: np.ndarray, data: np.ndarray, offsets: Optional[np.ndarray]):
+        self.name = name
+        self.type = column_type
+        self.presence = presence  # little-endian bitmap of documents that have the key
+        self.data = data
+        self.offsets = offsets  # (n + 1) byte offsets into data for "str"/"json"
+
+    def has(self, doc_id: int) -> bool:
+        return bool((self.presence[doc_id >> 3] >> (doc_id & 7)) & 1)
+
+    def value(self, doc_id: int) -> Any:
+        if self.offsets is not None:
+            raw = bytes(self.data[self.offsets[doc_id]:self.offsets[doc_id + 1]]).decode("utf-8")
+            return json.loads(raw) if self.type == "json" else raw
+        if self.type == "bool":
+            return bool(self.data[doc_id])
+        return self.data[doc_id].item()
+
+
+class DocumentStore(Sequence):
+    """
+    Document metadata for a FAISS index, stored column by column.
+
+    Saved stores are memory-mapped on load and each document is only decoded
+    when it is accessed by id, so loading a large index no longer builds a
+    Python object per document. Documents added after loading are kept in memory
+    until the next save.
+
+    Every row also carries an ascending int64 document id (the FAISS id of its
+    vector), which defaults to the row position.
+    """
+
+    def __init__(self, documents: Optional[List[Dict[str, Any]]] = None, doc_ids: Optional[List[int]] = None):
+        """
+        Initialize an in-memory document store.
+
+        Args:
+            documents: Optional initial documents
+            doc_ids: Ascending ids of the documents (defaults to their positions)
+        """
+        self._columns = []  # memory-mapped columns of the loaded file
+        self._mapped_count = 0
+        self._mapped_ids = np.empty(0, dtype=np.int64)
+        self._buffer = None
+        self._documents = list(documents) if documents else []  # documents added since load
+        self._document_ids = list(doc_ids) if doc_ids is not None else list(range(len(self._documents)))
+        self._ids = None  # cached concatenation of all ids
+
+    def __len__(self) -> int:
+        return self._mapped_count + len(self._documents)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+
+        if index >= self._mapped_count:
+            return self._documents[index - self._mapped_count]
+        return {column.name: column.value(index) for column in self._columns if column.has(index)}
+
+    def append(self, document: Dict[str, Any], doc_id: Optional[int] = None) -> None:
+        """Add one document (ids must be larger than every existing id)."""
+        self._document_ids.append(len(self) if doc_id is None else doc_id)
+        self._documents.append(document)
+        self._ids = None
+
+    def extend(self, documents: List[Dict[str, Any]], doc_ids: Optional[List[int]] = None) -> None:
+        """Add several documents (ids must be larger than every existing id)."""
+        self._document_ids.extend(range(len(self), len(self) + len(documents)) if doc_ids is None else doc_ids)
+        self._documents.extend(documents)
+        self._ids = None
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Ascending document ids, one per row."""
+        if self._ids is None:
+            self._ids = np.concatenate([self._mapped_ids, np.asarray(self._document_ids, dtype=np.int64)])
+        return self._ids
+
+    def rows_of(self, doc_ids: np.ndarray) -> np.ndarray:
+        """
+        Find the rows holding the given document ids.
+
+        Args:
+            doc_ids: Document ids
+
+        Returns:
+            Row per id, -1 where the id is not stored
+        """
+        ids = self.ids
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if len(ids) == 0:
+            return np.full(doc_ids.shape, -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(ids, doc_ids), len(ids) - 1)
+        return np.where(ids[rows] == doc_ids, rows, -1)
+
+    def select(self, rows: np.ndarray) -> "DocumentStore":
+        """
+        Copy a subset of rows (with their ids) into a new in-memory store.
+
+        Args:
+            rows: Ascending row numbers to keep
+
+        Returns:
+            New document store
+        """
+        return DocumentStore([self[int(row)] for row in rows], self.ids[rows].tolist())
+
+    def metadata_items(self, doc_id: int) -> Iterator[Tuple[str, Any]]:
+        """
+        Iterate over a document's metadata without decoding its text.
+
+        Args:
+            doc_id: Document id
+
+        Returns:
+            Iterator of (key, value) pairs, excluding 'text'
+        """
+        if doc_id >= self._mapped_count:
+            return ((key, value) for key, value in self._documents[doc_id - self._mapped_count].items() if key != 'text')
+        return (
+            (column.name, column.value(doc_id))
+            for column in self._columns
+            if column.name != 'text' and column.has(doc_id)
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Write all documents in the columnar format.
+
+        The file is written next to the target and renamed into place, so a
+        store that is currently memory-mapped from `path` stays readable.
+
+        Args:
+            path: Output file path
+        """
+        documents = list(self)
+        num_documents = len(documents)
+
+        keys = {}
+        for doc in documents:
+            for key in doc:
+                keys.setdefault(key, None)
+
+        sections = []
+        section_offset = 0
+
+        def add_section(payload: bytes) -> List[int]:
+            nonlocal section_offset
+            location = [section_offset, len(payload)]
+            padding = -len(payload) % _ALIGNMENT
+            sections.append(payload + b"\0" * padding)
+            section_offset += len(payload) + padding
+            return location
+
+        schema = []
+        for key in keys:
+            presence = np.array([key in doc for doc in documents], dtype=bool)
+            values = [doc[key] for doc in documents if key in doc]
+            column_type = _infer_column_type(values)
+            column = {
+                'name': key,
+                'type': column_type,
+                'presence': add_section(np.packbits(presence, bitorder='little').tobytes())
+            }
+
+            if column_type in _NUMPY_COLUMN_TYPES:
+                data = np.zeros(num_documents, dtype=_NUMPY_COLUMN_TYPES[column_type])
+                data[presence] = values
+                column['data'] = add_section(data.tobytes())
+            else:
+                encoded = [
+                    (_encode_json(key, doc[key]) if column_type == "json" else doc[key]).encode("utf-8") if key in doc else b""
+                    for doc in documents
+                ]
+                offsets = np.zeros(num_documents + 1, dtype="<i8")
+                np.cumsum([len(value) for value in encoded], out=offsets[1:])
+                column['offsets'] = add_section(offsets.tobytes())
+                column['data'] = add_section(b"".join(encoded))
+
+            schema.append(column)
+
+        ids = add_section(self.ids.astype("<i8").tobytes())
+        header = json.dumps({'version': 1, 'count': num_documents, 'ids': ids, 'columns': schema}).encode("utf-8")
+        preamble = DOCUMENT_STORE_MAGIC + np.array(len(header), dtype="<u8").tobytes() + header
+        preamble += b"\0" * (-len(preamble) % _ALIGNMENT)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(preamble)
+            for section in sections:
+                f.write(section)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, allow_legacy_pickle: bool = False) -> "DocumentStore":
+        """
+        Open a saved document store.
+
+        Args:
+            path: Path of the documents file
+            allow_legacy_pickle: Also accept the old pickled document list.
+                Unpickling can run arbitrary code, so only enable this for trusted files.
+
+        Returns:
+            Memory-mapped document store
+
+        Raises:
+            ValueError: If the file is a legacy pickle and allow_legacy_pickle is False
+        """
+        if is_legacy_documents_file(path):
+            if not allow_legacy_pickle:
+                raise ValueError(
+                    f"{path} is a legacy pickled document file; convert it with "
+                    f"`python index_tools.py convert-documents` (or `convert-gcs-documents` for indexes in GCS) "
+                    f"or set ALLOW_LEGACY_PICKLE_DOCUMENTS=true"
+                )
+            logger.warning(f"Loading legacy pickled documents from {path}")
+            with open(path, 'rb') as f:
+                return cls(pickle.load(f))
+
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        header_start = len(DOCUMENT_STORE_MAGIC) + 8
+        header_length = int(buffer[len(DOCUMENT_STORE_MAGIC):header_start].view("<u8")[0])
+        header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+        data_start = header_start + header_length
+        data_start += -data_start % _ALIGNMENT
+
+        def section(location: List[int], dtype: Any = np.uint8) -> np.ndarray:
+            start = data_start + location[0]
+            return buffer[start:start + location[1]].view(dtype)
+
+        store = cls()
+        store._buffer = buffer
+        store._mapped_count = header['count']
+        store._mapped_ids = section(header['ids'], "<i8") if 'ids' in header else np.arange(header['count'], dtype=np.int64)
+        for column in header['columns']:
+            column_type = column['type']
+            store._columns.append(_Column(
+                column['name'],
+                column_type,
+                section(column['presence']),
+                section(column['data'], _NUMPY_COLUMN_TYPES.get(column_type, np.uint8)),
+                section(column['offsets'], "<i8") if 'offsets' in column else None
+            ))
+        return store
+
+
+def is_legacy_documents_file(path: str) -> bool:
+    """
+    Check whether a documents file is an old pickled document list.
+
+    Args:
+        path: Path of the documents file
+
+    Returns:
+        True if the file is not in the columnar format
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(DOCUMENT_STORE_MAGIC)) != DOCUMENT_STORE_MAGIC
+
+
+def convert_documents_file(source_path: str, output_path: Optional[str] = None) -> bool:
+    """
+    Rewrite a legacy pickled documents file in the columnar format.
+
+    Only run this on files you trust: the legacy file is unpickled.
+
+    Args:
+        source_path: Existing documents file
+        output_path: Output file (defaults to converting in place)
+
+    Returns:
+        Success status
+    """
+    try:
+        store = DocumentStore.load(source_path, allow_legacy_pickle=True)
+        store.save(output_path or source_path)
+        logger.info(f"Converted {len(store)} documents from {source_path}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error converting documents file: {e}")
+        return False
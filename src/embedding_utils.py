@@ -0,0 +1,195 @@
+# embedding_utils.py
+import base64
+import logging
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+import numpy as np # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Native output dimension of each supported OpenAI embedding model
+EMBEDDING_MODEL_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# Models that accept the `dimensions` parameter (Matryoshka-style shortening)
+REDUCIBLE_EMBEDDING_MODELS = {"text-embedding-3-small", "text-embedding-3-large"}
+
+# All embeddings are kept as float32, the native FAISS vector type
+EMBEDDING_DTYPE = np.float32
+
+
+def resolve_embedding_dimension(model_name: str, dimensions: Optional[int] = None) -> int:
+    """
+    Resolve the output dimension for an embedding model.
+
+    Args:
+        model_name: OpenAI embedding model name
+        dimensions: Requested output dimension (None for the model's native size)
+
+    Returns:
+        Dimension of the vectors the model will return
+
+    Raises:
+        ValueError: If the model does not support the requested dimension
+    """
+    native_dim = EMBEDDING_MODEL_DIMENSIONS.get(model_name)
+
+    if dimensions is None:
+        if native_dim is None:
+            raise ValueError(f"Unknown embedding model {model_name}; pass dimensions explicitly")
+        return native_dim
+
+    if dimensions <= 0:
+        raise ValueError(f"Embedding dimension must be positive, got {dimensions}")
+
+    if native_dim is not None:
+        if dimensions > native_dim:
+            raise ValueError(f"{model_name} returns at most {native_dim} dimensions, got {dimensions}")
+        if dimensions != native_dim and model_name not in REDUCIBLE_EMBEDDING_MODELS:
+            raise ValueError(f"{model_name} does not support reduced dimensions")
+
+    return dimensions
+
+
+def embedding_request_kwargs(model_name: str, dimensions: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build the extra keyword arguments for `client.embeddings.create`.
+
+    Args:
+        model_name: OpenAI embedding model name
+        dimensions: Requested output dimension (None for the model's native size)
+
+    Returns:
+        Keyword arguments to pass alongside `input` and `model`
+    """
+    kwargs = {}
+    if dimensions is not None and model_name not in EMBEDDING_MODEL_DIMENSIONS:
+        # Unknown (newer) model: trust the caller and forward the dimension
+        kwargs["dimensions"] = dimensions
+    elif dimensions is not None and model_name in REDUCIBLE_EMBEDDING_MODELS:
+        kwargs["dimensions"] = dimensions
+    return kwargs
+
+
+def zero_embedding(dimension: int) -> np.ndarray:
+    """
+    Create a float32 zero vector used as the fallback embedding.
+
+    Args:
+        dimension: Embedding dimension
+
+    Returns:
+        Zero vector of the given dimension
+    """
+    return np.zeros(dimension, dtype=EMBEDDING_DTYPE)
+
+
+def decode_embedding_into(embedding: Union[str, Sequence[float]], out: np.ndarray) -> None:
+    """
+    Decode one API embedding directly into a preallocated float32 row.
+
+    Handles both the `float` encoding (list of floats) and the `base64`
+    encoding (little-endian float32 bytes) of the OpenAI embeddings API.
+
+    Args:
+        embedding: Embedding as returned in `response.data[i].embedding`
+        out: Preallocated float32 row to write into
+    """
+    if isinstance(embedding, str):
+        out[:] = np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    else:
+        out[:] = embedding
+
+
+def decode_embeddings_into(data: Sequence[Any], out: np.ndarray) -> None:
+    """
+    Decode a batch of API embeddings into a preallocated float32 matrix.
+
+    Each base64 payload is decoded and viewed with `np.frombuffer`, then
+    copied once into its row; no batch-sized intermediate buffer is built.
+
+    Args:
+        data: `response.data` items, each with an `embedding` attribute
+        out: Preallocated float32 matrix of shape (len(data), dimension)
+    """
+    if len(data) != len(out):
+        raise ValueError(f"Got {len(data)} embeddings for {len(out)} rows")
+    for item, row in zip(data, out):
+        decode_embedding_into(item.embedding, row)
+
+
+def deduplicate_texts(texts: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    """
+    Collapse identical texts so each unique text is embedded once.
+
+    Args:
+        texts: Texts to embed, possibly with repeats
+
+    Returns:
+        Tuple of (unique texts in first-seen order, index into the unique
+        texts for every input text)
+    """
+    positions = {}
+    unique_texts = []
+    inverse = np.empty(len(texts), dtype=np.int64)
+
+    for i, text in enumerate(texts):
+        position = positions.get(text)
+        if position is None:
+            position = positions[text] = len(unique_texts)
+            unique_texts.append(text)
+        inverse[i] = position
+
+    return unique_texts, inverse
+
+
+def dedup_stats(total_texts: int, unique_texts: int) -> Dict[str, Any]:
+    """
+    Summarize one deduplication pass.
+
+    Args:
+        total_texts: Number of texts before deduplication
+        unique_texts: Number of texts actually embedded
+
+    Returns:
+        Dictionary with counts and the fraction of embeddings saved
+    """
+    return {
+        'total_texts': total_texts,
+        'unique_texts': unique_texts,
+        'duplicates_removed': total_texts - unique_texts,
+        'dedup_ratio': (total_texts - unique_texts) / total_texts if total_texts else 0.0
+    }
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize vectors so inner product equals cosine similarity.
+
+    Zero vectors (failed or empty embeddings) are left as zeros.
+
+    Args:
+        vectors: float32 array of shape (n, d) or (d,)
+
+    Returns:
+        New float32 array with unit-norm rows
+    """
+    vectors = np.asarray(vectors, dtype=EMBEDDING_DTYPE)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def cosine_similarities(query_embedding: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    """
+    Score every embedding against the query with one matrix-vector product.
+
+    Args:
+        query_embedding: Query vector of shape (d,)
+        embeddings: Matrix of shape (n, d)
+
+    Returns:
+        float32 array of n cosine similarities (0.0 for zero vectors)
+    """
+    return normalize_rows(embeddings) @ normalize_rows(query_embedding)
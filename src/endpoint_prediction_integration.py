@@ -2,19 +2,182 @@
 import requests
 import logging
 import openai
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional
 from dotenv import load_dotenv
+import numpy as np # type: ignore
 import os
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from .endpoint_query_classifier import EndpointQueryClassifier, get_default_classifier
 
 logger = logging.getLogger(__name__)
 
+# Used when the caller sets no deadline (each is also capped by the time left before a deadline)
+CLASSIFICATION_TIMEOUT_SECONDS = 30
+PREDICTION_CONNECT_TIMEOUT_SECONDS = float(os.getenv("ENDPOINT_API_CONNECT_TIMEOUT", "3"))
+PREDICTION_READ_TIMEOUT_SECONDS = float(os.getenv("ENDPOINT_API_READ_TIMEOUT", "120"))
+
+# Keep-alive connections kept per predictor host
+ENDPOINT_API_POOL_SIZE = int(os.getenv("ENDPOINT_API_POOL_SIZE", "10"))
+# Consecutive failures that open the circuit, and how long it stays open before a trial request
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("ENDPOINT_API_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("ENDPOINT_API_RECOVERY_SECONDS", "30"))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for a remote dependency.
+    
+    Closed: requests pass. After failure_threshold consecutive failures the
+    circuit opens and requests are rejected without being sent. After
+    recovery_seconds one trial request is let through (half-open); its
+    success closes the circuit, its failure opens it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    _TRANSITION_COUNTERS = {OPEN: 'opened', HALF_OPEN: 'half_opened', CLOSED: 'closed'}
+    
+    def __init__(self, name: str,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS):
+        """
+        Initialize the circuit breaker.
+        
+        Args:
+            name: Name of the protected dependency (for logs)
+            failure_threshold: Consecutive failures that open the circuit
+            recovery_seconds: Seconds the circuit stays open before a trial request
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._metrics = {
+            'successes': 0,
+            'failures': 0,
+            'short_circuited': 0,
+            'opened': 0,
+            'half_opened': 0,
+            'closed': 0,
+        }
+    
+    def _transition(self, state: str) -> None:
+        """Move to a new state and count the transition (lock held)."""
+        logger.warning(f"Circuit for {self.name}: {self.state} -> {state}")
+        self.state = state
+        self._metrics[self._TRANSITION_COUNTERS[state]] += 1
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+    
+    def allow_request(self) -> bool:
+        """
+        Check whether a request may be sent.
+        
+        Returns:
+            True if the request may be sent; the caller must then report it
+            with record_success or record_failure
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_seconds:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._trial_in_flight):
+                self._trial_in_flight = self.state == self.HALF_OPEN
+                return True
+            self._metrics['short_circuited'] += 1
+            return False
+    
+    def record_success(self) -> None:
+        """Report a successful request."""
+        with self._lock:
+            self._metrics['successes'] += 1
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+    
+    def record_failure(self) -> None:
+        """Report a failed request."""
+        with self._lock:
+            self._metrics['failures'] += 1
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self._transition(self.OPEN)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the current state and counters.
+        
+        Returns:
+            Dictionary with state, consecutive failures, seconds open and event counts
+        """
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'open_for_seconds': time.monotonic() - self.opened_at if self.state != self.CLOSED else 0.0,
+                **self._metrics
+            }
+
+
+# One keep-alive session and one circuit breaker per predictor URL, shared by all pipelines
+_sessions: Dict[str, requests.Session] = {}
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_shared_lock = threading.Lock()
+
+
+def _get_shared_clients(api_base_url: str):
+    """
+    Get the shared session and circuit breaker of a predictor URL.
+    
+    Args:
+        api_base_url: Base URL of the endpoint prediction API
+        
+    Returns:
+        Tuple of (requests.Session, CircuitBreaker)
+    """
+    with _shared_lock:
+        if api_base_url not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ENDPOINT_API_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[api_base_url] = session
+            _circuit_breakers[api_base_url] = CircuitBreaker(f"endpoint prediction API {api_base_url}")
+        return _sessions[api_base_url], _circuit_breakers[api_base_url]
+
+
+def get_endpoint_api_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Get circuit breaker metrics of every predictor URL used by this process.
+    
+    Returns:
+        Dictionary of API base URL -> circuit breaker metrics
+    """
+    with _shared_lock:
+        breakers = dict(_circuit_breakers)
+    return {url: breaker.get_metrics() for url, breaker in breakers.items()}
+
 class EndpointPredictionAPIIntegration:
     """Integration module for endpoint prediction API."""
     
     def __init__(self, 
                  api_base_url: str = "http://localhost:8000",
                  docs_model_id: str = "ct_epa_1", 
-                 csv_model_id: str = "ct_endpoints1"):
+                 csv_model_id: str = "ct_endpoints1",
+                 classifier: Optional[EndpointQueryClassifier] = None,
+                 embed_query: Optional[Callable[[str], np.ndarray]] = None,
+                 embedding_model: Optional[str] = None):
         """
         Initialize the integration.
         
@@ -22,23 +185,86 @@ class EndpointPredictionAPIIntegration:
             api_base_url: Base URL of the endpoint prediction API
             docs_model_id: Model ID for document embeddings
             csv_model_id: Model ID for CSV embeddings
+            classifier: Local query classifier (defaults to the process-wide one)
+            embed_query: Optional query embedding function for the classifier's linear model
+            embedding_model: Embedding model behind embed_query (the linear model is
+                only used if it was trained on the same one)
         """
         load_dotenv()
         self.api_base_url = api_base_url
         self.docs_model_id = docs_model_id
         self.csv_model_id = csv_model_id
         self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.classifier = classifier or get_default_classifier()
+        self.embed_query = embed_query
+        self.embedding_model = embedding_model
+        self.session, self.circuit_breaker = _get_shared_clients(api_base_url)
+    
+    @staticmethod
+    def _timeout(deadline: Optional[float], default: float) -> float:
+        """
+        Seconds left until the deadline, capped at default.
         
-    def requires_endpoint_prediction(self, query: str) -> bool:
+        Args:
+            deadline: time.monotonic() value to finish by (None for no deadline)
+            default: Timeout to use without a deadline
+            
+        Returns:
+            Timeout in seconds
+            
+        Raises:
+            TimeoutError: If the deadline has already passed
         """
-        Classify if query requires endpoint prediction using LLM.
+        if deadline is None:
+            return default
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Deadline exceeded")
+        return min(default, remaining)
+        
+    def requires_endpoint_prediction(self, query: str, deadline: Optional[float] = None) -> bool:
+        """
+        Classify if query requires endpoint prediction.
+        
+        The local classifier decides instantly; only low-confidence queries
+        are sent to the LLM. Decisions are cached per normalized query.
         
         Args:
             query: User query
+            deadline: Optional time.monotonic() value to finish by
             
         Returns:
             True if endpoint prediction needed
         """
+        probability, source = self.classifier.classify(query, self.embed_query, self.embedding_model)
+        if source == "cache":
+            return probability >= 0.5
+        
+        if self.classifier.is_confident(probability):
+            decision = probability >= 0.5
+        else:
+            decision = self._llm_requires_endpoint_prediction(query, deadline)
+            if decision is None:
+                # LLM unavailable: go with the local estimate but don't cache it
+                logger.info(f"Using low-confidence local classification ({probability:.2f})")
+                return probability >= 0.5
+            source = "llm"
+        
+        logger.info(f"Endpoint prediction {'required' if decision else 'not required'} ({source}, p={probability:.2f})")
+        self.classifier.remember(query, decision)
+        return decision
+    
+    def _llm_requires_endpoint_prediction(self, query: str, deadline: Optional[float] = None) -> Optional[bool]:
+        """
+        Classify if query requires endpoint prediction using LLM.
+        
+        Args:
+            query: User query
+            deadline: Optional time.monotonic() value to finish by
+            
+        Returns:
+            True if endpoint prediction needed, None if the LLM call failed
+        """
         try:
             prompt = f"""Classify if this clinical trial query requires endpoint timing prediction.
 
@@ -66,26 +292,44 @@ Classification:"""
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=10,
-                temperature=0.1
+                temperature=0.1,
+                timeout=self._timeout(deadline, CLASSIFICATION_TIMEOUT_SECONDS)
             )
             
             classification = response.choices[0].message.content.strip().upper()
             return "YES" in classification
             
         except Exception as e:
-            logger.warning(f"Classification failed, defaulting to False: {e}")
-            return False
+            logger.warning(f"LLM classification failed: {e}")
+            return None
     
-    def get_endpoint_prediction(self, query: str) -> Dict[str, Any]:
+    def get_endpoint_prediction(self, query: str, deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         Get endpoint prediction from API.
         
+        Uses the shared keep-alive session; returns nothing without sending
+        while the predictor's circuit is open.
+        
         Args:
             query: User query
+            deadline: Optional time.monotonic() value to finish by
             
         Returns:
             Prediction results or empty dict
         """
+        try:
+            timeout = (
+                self._timeout(deadline, PREDICTION_CONNECT_TIMEOUT_SECONDS),
+                self._timeout(deadline, PREDICTION_READ_TIMEOUT_SECONDS)
+            )
+        except TimeoutError as e:
+            logger.error(f"Endpoint prediction skipped: {e}")
+            return {}
+        
+        if not self.circuit_breaker.allow_request():
+            logger.warning(f"Endpoint prediction API circuit is {self.circuit_breaker.state}; skipping prediction")
+            return {}
+        
         try:
             url = f"{self.api_base_url}/predict"
             payload = {
@@ -97,8 +341,20 @@ Classification:"""
                 "return_trials": 5
             }
             
-            response = requests.post(url, json=payload, timeout=2000)
+            response = self.session.post(url, json=payload, timeout=timeout)
             
+        except Exception as e:
+            self.circuit_breaker.record_failure()
+            logger.error(f"Endpoint prediction failed: {e}")
+            return {}
+        
+        # Client errors are our fault, not a sign the predictor is unhealthy
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        
+        try:
             if response.status_code == 200:
                 result = response.json()
                 logger.info(f"Endpoint prediction successful")
@@ -111,20 +367,21 @@ Classification:"""
             logger.error(f"Endpoint prediction failed: {e}")
             return {}
     
-    def process_query(self, query: str) -> Dict[str, Any]:
+    def process_query(self, query: str, deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         Main processing method: classify and predict if needed.
         
         Args:
             query: User query
+            deadline: Optional time.monotonic() value by which both calls must finish
             
         Returns:
             Endpoint prediction results or empty dict
         """
         # Check if endpoint prediction is needed
-        if self.requires_endpoint_prediction(query):
+        if self.requires_endpoint_prediction(query, deadline):
             logger.info(f"Endpoint prediction required for query")
-            return self.get_endpoint_prediction(query)
+            return self.get_endpoint_prediction(query, deadline)
         else:
             logger.info(f"No endpoint prediction needed")
             return {}
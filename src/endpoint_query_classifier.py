@@ -0,0 +1,289 @@
+# endpoint_query_classifier.py
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+import numpy as np # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Optional linear model over query embeddings (npz written by save_linear_model)
+ENDPOINT_CLASSIFIER_MODEL_PATH = os.getenv("ENDPOINT_CLASSIFIER_MODEL_PATH", "")
+ENDPOINT_CLASSIFIER_CACHE_SIZE = int(os.getenv("ENDPOINT_CLASSIFIER_CACHE_SIZE", "4096"))
+
+# Probabilities strictly between these two are low confidence and go to the LLM fallback
+CONFIDENT_NO = 0.2
+CONFIDENT_YES = 0.8
+
+# Questions about when endpoints are measured or how long trials follow patients up
+_TIMING_PATTERNS = [re.compile(pattern) for pattern in (
+    r"\bwhen\b.{0,60}\b(measur|assess|evaluat|observ|expect|see|report|read ?out)",
+    r"\b(time ?points?|time-points?|time ?frames?|timing|follow[- ]?ups?|schedul\w*|durations?)\b",
+    r"\bhow (long|soon|many (days|weeks|months|years))\b",
+    r"\b(primary|secondary) (end ?points?|outcomes?)\b.{0,60}\b(days?|weeks?|months?|years?|time)\b",
+)]
+# Endpoint/time vocabulary that hints at timing without asking about it
+_WEAK_TIMING_PATTERN = re.compile(r"\b(end ?points?|outcomes?|days?|weeks?|months?|years?|times?)\b")
+# Topics the endpoint predictor does not answer
+_OTHER_TOPIC_PATTERN = re.compile(
+    r"\b(eligib\w*|inclusion|exclusion|criteria|adverse|side effects?|safety|toxicit\w*|recruit\w*|"
+    r"enrol\w*|sponsors?|locations?|sites?|procedures?|background|mechanism)\b"
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for rule matching and cache lookups.
+
+    Args:
+        query: User query
+
+    Returns:
+        Lowercased query with collapsed whitespace
+    """
+    return " ".join(query.lower().split())
+
+
+def rule_probability(query: str) -> float:
+    """
+    Probability that a query needs endpoint timing prediction, from keyword rules.
+
+    Args:
+        query: Normalized user query
+
+    Returns:
+        0.9/0.1 (or lower) when the rules are decisive, 0.5 when they are ambiguous
+    """
+    timing = any(pattern.search(query) for pattern in _TIMING_PATTERNS)
+    other_topic = _OTHER_TOPIC_PATTERN.search(query) is not None
+
+    if timing:
+        # "follow-up schedule for adverse events" could go either way
+        return 0.5 if other_topic else 0.9
+    if _WEAK_TIMING_PATTERN.search(query):
+        return 0.3 if other_topic else 0.5
+    return 0.05 if other_topic else 0.1
+
+
+def train_linear_model(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    epochs: int = 500,
+    learning_rate: float = 0.5,
+    l2: float = 1e-3
+) -> Tuple[np.ndarray, float]:
+    """
+    Fit a logistic regression on labelled query embeddings.
+
+    Args:
+        embeddings: (n, dimension) query embeddings
+        labels: n labels, 1 if the query needs endpoint prediction
+        epochs: Full-batch gradient descent steps
+        learning_rate: Step size
+        l2: L2 regularization strength
+
+    Returns:
+        Tuple of (float32 weights, bias)
+    """
+    x = np.asarray(embeddings, dtype=np.float64)
+    y = np.asarray(labels, dtype=np.float64)
+    weights = np.zeros(x.shape[1])
+    bias = 0.0
+    for _ in range(epochs):
+        error = 1.0 / (1.0 + np.exp(-(x @ weights + bias))) - y
+        weights -= learning_rate * (x.T @ error / len(y) + l2 * weights)
+        bias -= learning_rate * error.mean()
+    return weights.astype(np.float32), float(bias)
+
+
+def save_linear_model(path: str, weights: np.ndarray, bias: float, embedding_model: str) -> None:
+    """
+    Save a linear model as npz (plain arrays, no pickle).
+
+    Args:
+        path: Output .npz path
+        weights: float32 weights, one per embedding dimension
+        bias: Model bias
+        embedding_model: Embedding model the weights were trained on
+    """
+    np.savez(path, weights=np.asarray(weights, dtype=np.float32), bias=np.float32(bias),
+             embedding_model=np.str_(embedding_model))
+
+
+class EndpointQueryClassifier:
+    """
+    Local classifier for queries that need endpoint timing prediction.
+
+    Keyword rules decide most queries instantly. An optional linear model over
+    the query embedding decides when the rules are ambiguous; whatever is still
+    low confidence is left to the caller (an LLM). Final decisions are cached.
+    """
+
+    def __init__(self,
+                 model_path: Optional[str] = ENDPOINT_CLASSIFIER_MODEL_PATH,
+                 cache_size: int = ENDPOINT_CLASSIFIER_CACHE_SIZE):
+        """
+        Initialize the classifier.
+
+        Args:
+            model_path: Optional .npz linear model (see save_linear_model)
+            cache_size: Number of past decisions to keep
+        """
+        self.weights = None
+        self.bias = 0.0
+        self.embedding_model = None
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # normalized query -> decision, least recent first
+        self._lock = threading.Lock()
+        self._mismatched_models = set()  # embedding models already warned about
+
+        if model_path:
+            self.load_model(model_path)
+
+    def load_model(self, model_path: str) -> bool:
+        """
+        Load a linear model saved with save_linear_model.
+
+        Args:
+            model_path: Path of the .npz file
+
+        Returns:
+            True if the model was loaded
+        """
+        try:
+            with np.load(model_path, allow_pickle=False) as model:
+                self.weights = model['weights'].astype(np.float32)
+                self.bias = float(model['bias'])
+                self.embedding_model = str(model['embedding_model'])
+            logger.info(f"Loaded endpoint query model {model_path} ({len(self.weights)} dimensions)")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading endpoint query model {model_path}: {e}")
+            self.weights = None
+            return False
+
+    def model_probability(self, query_embedding: np.ndarray) -> Optional[float]:
+        """
+        Probability from the linear model.
+
+        Args:
+            query_embedding: Embedding of the query
+
+        Returns:
+            Probability, or None if no model is loaded or the dimension differs
+        """
+        if self.weights is None or query_embedding is None:
+            return None
+        if len(query_embedding) != len(self.weights):
+            logger.warning(
+                f"Query embedding has dimension {len(query_embedding)}, "
+                f"endpoint query model expects {len(self.weights)}"
+            )
+            return None
+        return float(1.0 / (1.0 + np.exp(-(np.dot(query_embedding, self.weights) + self.bias))))
+
+    def model_matches(self, embedding_model: Optional[str]) -> bool:
+        """
+        Whether the loaded model can score embeddings of an embedding model.
+
+        Models of the same dimension from different embedding models live in
+        different spaces, so a mismatch disables the model (with one warning).
+
+        Args:
+            embedding_model: Embedding model of the query embeddings (None if unknown)
+
+        Returns:
+            True if a model is loaded and was trained on embedding_model
+        """
+        if self.weights is None:
+            return False
+        if embedding_model is None or embedding_model != self.embedding_model:
+            with self._lock:
+                if embedding_model not in self._mismatched_models:
+                    self._mismatched_models.add(embedding_model)
+                    logger.warning(
+                        f"Endpoint query model was trained on {self.embedding_model} embeddings, "
+                        f"queries use {embedding_model}; using rules only"
+                    )
+            return False
+        return True
+
+    def classify(
+        self,
+        query: str,
+        embed_query: Optional[Callable[[str], np.ndarray]] = None,
+        embedding_model: Optional[str] = None
+    ) -> Tuple[float, str]:
+        """
+        Estimate whether a query needs endpoint prediction.
+
+        Args:
+            query: User query
+            embed_query: Optional function returning the query embedding; only
+                called when the rules are ambiguous and a matching model is loaded
+            embedding_model: Embedding model behind embed_query (must match the model's)
+
+        Returns:
+            Tuple of (probability, source) where source is "cache", "rules" or "model"
+        """
+        key = normalize_query(query)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return (1.0 if self._cache[key] else 0.0), "cache"
+
+        probability = rule_probability(key)
+        if not self.is_confident(probability) and embed_query is not None and self.model_matches(embedding_model):
+            model_probability = self.model_probability(embed_query(query))
+            if model_probability is not None:
+                return model_probability, "model"
+        return probability, "rules"
+
+    @staticmethod
+    def is_confident(probability: float) -> bool:
+        """
+        Whether a probability is decisive enough to skip the LLM fallback.
+
+        Args:
+            probability: Probability from classify
+
+        Returns:
+            True if the probability is outside the low-confidence band
+        """
+        return probability <= CONFIDENT_NO or probability >= CONFIDENT_YES
+
+    def remember(self, query: str, decision: bool) -> None:
+        """
+        Cache the final decision for a query.
+
+        Args:
+            query: User query
+            decision: True if the query needs endpoint prediction
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._cache[key] = decision
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+_default_classifier = None
+_default_classifier_lock = threading.Lock()
+
+
+def get_default_classifier() -> EndpointQueryClassifier:
+    """
+    Process-wide classifier, so the model is loaded once and the cache is shared
+    by every pipeline.
+
+    Returns:
+        Shared EndpointQueryClassifier
+    """
+    global _default_classifier
+    with _default_classifier_lock:
+        if _default_classifier is None:
+            _default_classifier = EndpointQueryClassifier()
+        return _default_classifier
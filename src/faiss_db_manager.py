@@ -1,35 +1,468 @@
 # faiss_db_manager.py
 import numpy as np
 import faiss
-import pickle
+import json
 import os
 from typing import List, Dict, Any, Optional, Tuple
 import logging
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.documents import Document
+from .embedding_utils import normalize_rows
+from .document_store import DocumentStore
+from .process_stats import get_memory_usage
 
 logger = logging.getLogger(__name__)
 
+# Supported FAISS index backends
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "ivf_opq", "sq8")
+
+# Backends built on an inverted file (clustered, searched with nprobe)
+IVF_INDEX_TYPES = ("ivf_flat", "ivf_pq", "ivf_opq")
+
+# Compressed backends (the cold storage tier): product or 8-bit scalar quantization
+PQ_INDEX_TYPES = ("ivf_pq", "ivf_opq")
+COMPRESSED_INDEX_TYPES = PQ_INDEX_TYPES + ("sq8",)
+
+# Metadata value types that are indexed for filtered search
+INDEXABLE_METADATA_TYPES = (str, int, float, bool, type(None))
+
+# Filters selecting at most this many documents are scored exactly instead of via the ANN index
+EXACT_FILTER_THRESHOLD = 2048
+
+# Supported distance metrics: squared L2, or inner product over unit-normalized vectors
+METRICS = {
+    "l2": faiss.METRIC_L2,
+    "ip": faiss.METRIC_INNER_PRODUCT,
+}
+
 class FaissVectorDB:
     """FAISS vector database manager for document retrieval."""
     
-    def __init__(self, dimension: int = 1536):
+    def __init__(self, 
+                 dimension: int = 1536, 
+                 embedding_model: Optional[str] = None,
+                 index_type: str = "flat",
+                 metric: str = "l2",
+                 nlist: int = 1024,
+                 pq_m: int = 64,
+                 pq_nbits: int = 8,
+                 hnsw_m: int = 32,
+                 ef_construction: int = 200,
+                 nprobe: int = 16,
+                 ef_search: int = 64,
+                 rerank_factor: int = 4):
         """
         Initialize the FAISS vector database.
         
         Args:
             dimension: Dimension of the vectors to be stored
+            embedding_model: Name of the embedding model that produced the vectors
+            index_type: Index backend: "flat" (exact), "hnsw", "ivf_flat", or the
+                compressed "ivf_pq", "ivf_opq" (OPQ-rotated IVF-PQ) and "sq8" (8-bit scalar)
+            metric: "l2" or "ip" (vectors are normalized at insert, so inner product is cosine)
+            nlist: Number of IVF clusters (clamped to the training set size)
+            pq_m: Number of PQ sub-quantizers for "ivf_pq"/"ivf_opq" (must divide dimension)
+            pq_nbits: Bits per PQ code for "ivf_pq"/"ivf_opq"
+            hnsw_m: Graph degree for "hnsw"
+            ef_construction: HNSW build-time search depth
+            nprobe: Default number of IVF clusters visited per query
+            ef_search: Default HNSW search depth per query
+            rerank_factor: For compressed indexes with raw vectors on disk, fetch
+                rerank_factor * k candidates and re-score them exactly (<= 1 disables)
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type}, expected one of {INDEX_TYPES}")
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {tuple(METRICS)}")
+        if index_type in PQ_INDEX_TYPES and dimension % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide dimension {dimension}")
+        
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(dimension)  # L2 distance for similarity search
-        self.documents = []  # Store document metadata
+        self.embedding_model = embedding_model
+        self.index_type = index_type
+        self.metric = metric
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.rerank_factor = rerank_factor
+        self._raw_vectors = None  # float32 vectors read from disk for re-ranking compressed results
+        self._raw_vector_ids = None
+        self.index = self._create_index(nlist, pq_nbits)
+        self.documents = DocumentStore()  # Store document metadata
         self.is_populated = False
+        self.is_mmapped = False  # index vectors are views of the file on disk
+        self.next_id = 0  # stable document ids are never reused
+        self.deltas = []  # delta segments saved on top of the base files
+        self._deleted = np.zeros(0, dtype=bool)  # tombstones, aligned with document rows
+        self._track_changes = False  # record changes for save_delta once a base exists on disk
+        self._reset_pending_changes()
+        self._metadata_lock = threading.RLock()  # searches share loaded indexes across request threads
+        self._reset_metadata_index()
+    
+    def _create_index(self, nlist: int, pq_nbits: int) -> faiss.Index:
+        """
+        Create an empty FAISS index for the configured backend.
+        
+        Args:
+            nlist: Number of IVF clusters
+            pq_nbits: Bits per PQ code
+            
+        Returns:
+            Empty (possibly untrained) FAISS index
+        """
+        factory_strings = {
+            "flat": "Flat",
+            "hnsw": f"HNSW{self.hnsw_m}",
+            "ivf_flat": f"IVF{nlist},Flat",
+            "ivf_pq": f"IVF{nlist},PQ{self.pq_m}x{pq_nbits}",
+            "ivf_opq": f"OPQ{self.pq_m},IVF{nlist},PQ{self.pq_m}x{pq_nbits}",
+            "sq8": "SQ8",
+        }
+        index = faiss.index_factory(self.dimension, factory_strings[self.index_type], METRICS[self.metric])
+        
+        if self.index_type == "hnsw":
+            faiss.downcast_index(index).hnsw.efConstruction = self.ef_construction
+        
+        # IVF stores ids natively; the other backends get stable ids from an id map
+        if self.index_type not in IVF_INDEX_TYPES:
+            index = faiss.IndexIDMap2(index)
+        
+        return index
+    
+    def _base_index(self) -> faiss.Index:
+        """Get the index underneath the id map (if any)."""
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexIDMap):
+            return faiss.downcast_index(index.index)
+        return index
+    
+    def _train(self, embeddings_array: np.ndarray) -> None:
+        """
+        Train the index on the first batch of vectors (IVF and quantized backends only).
+        
+        IVF needs at least one training vector per cluster and PQ at least
+        2^nbits, so both are clamped to the available training set.
+        
+        Args:
+            embeddings_array: float32 training vectors
+        """
+        n_train = len(embeddings_array)
+        nlist = min(self.nlist, n_train) if self.index_type in IVF_INDEX_TYPES else self.nlist
+        pq_nbits = min(self.pq_nbits, max(1, int(np.log2(n_train)))) if self.index_type in PQ_INDEX_TYPES else self.pq_nbits
+        
+        if nlist != self.nlist or pq_nbits != self.pq_nbits:
+            logger.warning(
+                f"Only {n_train} training vectors: using nlist={nlist}, pq_nbits={pq_nbits} "
+                f"instead of nlist={self.nlist}, pq_nbits={self.pq_nbits}"
+            )
+            self.index = self._create_index(nlist, pq_nbits)
+        
+        self.index.train(embeddings_array)
+        logger.info(f"Trained {self.index_type} index on {n_train} vectors")
+    
+    def _search_parameters(
+        self, 
+        nprobe: Optional[int], 
+        ef_search: Optional[int],
+        selector: Optional[faiss.IDSelector] = None
+    ) -> Optional[faiss.SearchParameters]:
+        """
+        Build per-query search parameters for the index backend.
+        
+        Args:
+            nprobe: IVF clusters to visit (defaults to self.nprobe)
+            ef_search: HNSW search depth (defaults to self.ef_search)
+            selector: Optional ID selector restricting the searched vectors
+            
+        Returns:
+            FAISS search parameters, or None for unfiltered exact flat search
+        """
+        if self.index_type in IVF_INDEX_TYPES:
+            params = faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe)
+        elif self.index_type == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=ef_search or self.ef_search)
+        elif selector is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
+        
+        if selector is not None:
+            params.sel = selector
+        
+        if self.index_type == "ivf_opq":
+            # The OPQ rotation wraps the IVF index, which takes the actual parameters
+            pretransform_params = faiss.SearchParametersPreTransform()
+            pretransform_params.index_params = params
+            pretransform_params.referenced_objects = [params]  # keep the nested parameters alive
+            return pretransform_params
+        return params
+    
+    def _reset_metadata_index(self) -> None:
+        """Drop the inverted metadata index; it is rebuilt lazily on the next filtered search."""
+        with self._metadata_lock:
+            self._metadata_values = {}  # key -> value -> list of ids
+            self._metadata_keys = {}  # key -> list of ids that have the key
+            self._unindexed_keys = set()  # keys with unhashable values, filtered by scanning
+            self._metadata_indexed_count = 0
+    
+    def _update_metadata_index(self) -> None:
+        """
+        Index metadata of documents added since the last filtered search.
+        
+        Runs under a lock, so concurrent filtered searches on a shared index
+        build it once and never read a half-built index.
+        """
+        if self._metadata_indexed_count == len(self.documents):
+            return
+        
+        with self._metadata_lock:
+            for doc_id in range(self._metadata_indexed_count, len(self.documents)):
+                for key, value in self.documents.metadata_items(doc_id):
+                    self._metadata_keys.setdefault(key, []).append(doc_id)
+                    if isinstance(value, INDEXABLE_METADATA_TYPES):
+                        self._metadata_values.setdefault(key, {}).setdefault(value, []).append(doc_id)
+                    else:
+                        self._unindexed_keys.add(key)
+            
+            self._metadata_indexed_count = len(self.documents)
+    
+    def _metadata_filter_mask(self, metadata_filter: Dict[str, Any]) -> np.ndarray:
+        """
+        Compute which document ids pass a metadata filter.
+        
+        A document passes when, for every filter key, it either has the
+        requested value or does not have the key at all.
+        
+        Args:
+            metadata_filter: Mapping of metadata key to required value
+            
+        Returns:
+            Boolean mask over document ids
+        """
+        # Held throughout, so upserts or compaction can't extend or reset the index mid-read
+        with self._metadata_lock:
+            self._update_metadata_index()
+            num_documents = self._metadata_indexed_count
+            mask = np.ones(num_documents, dtype=bool)
+            
+            for key, value in metadata_filter.items():
+                # Documents without the key are kept
+                key_mask = np.ones(num_documents, dtype=bool)
+                key_mask[self._metadata_keys.get(key, [])] = False
+                key_mask[self._matching_rows(key, value)] = True
+                mask &= key_mask
+        
+        return mask
+    
+    def _matching_rows(self, key: str, value: Any) -> List[int]:
+        """
+        Find the document rows whose metadata has the given value.
+        
+        Args:
+            key: Metadata key
+            value: Required value
+            
+        Returns:
+            Matching document rows (a copy, safe to use after the lock is released)
+        """
+        with self._metadata_lock:
+            if key in self._unindexed_keys or not isinstance(value, INDEXABLE_METADATA_TYPES):
+                # Rare fallback for list/dict metadata: compare the documents that have the key
+                return [doc_id for doc_id in self._metadata_keys.get(key, []) if self.documents[doc_id][key] == value]
+            return list(self._metadata_values.get(key, {}).get(value, []))
+    
+    def _exact_search_ids(self, query_vectors: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exactly score a small set of ids against each query.
+        
+        Used for selective filters, where graph/cluster traversal restricted
+        by a selector can miss matches and return fewer than k results.
+        
+        Args:
+            query_vectors: Prepared queries of shape (n, d)
+            ids: Candidate document ids (FAISS ids)
+            k: Number of results to return per query
+            
+        Returns:
+            Tuple of (raw distances, ids), each of shape (n, min(k, len(ids))), best first
+        """
+        self._ensure_direct_map()
+        vectors = self.index.reconstruct_batch(ids)
+        
+        if self.metric == "ip":
+            distances = query_vectors @ vectors.T
+            order = np.argsort(-distances, axis=1)[:, :k]
+        else:
+            distances = (
+                np.sum(query_vectors ** 2, axis=1, keepdims=True)
+                - 2 * query_vectors @ vectors.T
+                + np.sum(vectors ** 2, axis=1)
+            )
+            order = np.argsort(distances, axis=1)[:, :k]
+        
+        return np.take_along_axis(distances, order, axis=1), ids[order]
+    
+    def _prepare_vectors(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Convert vectors to the float32 layout stored in the index.
+        
+        Args:
+            vectors: Vectors of shape (n, d)
+            
+        Returns:
+            float32 vectors, unit-normalized for the inner-product metric
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return normalize_rows(vectors) if self.metric == "ip" else vectors
     
-    def add_documents(self, documents: List[Dict[str, Any]]) -> bool:
+    def _distances_to_scores(self, distances: np.ndarray) -> np.ndarray:
+        """
+        Convert raw FAISS distances to cosine similarity scores (higher is better).
+        
+        Inner-product distances already are cosine similarities. Squared L2
+        distances are mapped with 1 - d/2, which is the cosine similarity for
+        unit-normalized vectors such as OpenAI embeddings.
+        
+        Args:
+            distances: Raw distances returned by the index
+            
+        Returns:
+            Similarity scores
+        """
+        if self.metric == "ip":
+            return distances
+        return 1.0 - distances / 2.0
+    
+    @staticmethod
+    def _detect_index_type(index: faiss.Index) -> str:
+        """
+        Infer the backend of an index read from disk.
+        
+        Args:
+            index: FAISS index
+            
+        Returns:
+            One of INDEX_TYPES
+        """
+        try:
+            ivf_index = faiss.downcast_index(faiss.extract_index_ivf(index))
+            if isinstance(faiss.downcast_index(index), faiss.IndexPreTransform):
+                return "ivf_opq"
+            return "ivf_pq" if isinstance(ivf_index, faiss.IndexIVFPQ) else "ivf_flat"
+        except RuntimeError:
+            pass
+        
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        if isinstance(index, faiss.IndexHNSW):
+            return "hnsw"
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            return "sq8"
+        return "flat"
+    
+    @staticmethod
+    def _read_index(index_path: str, mmap: bool) -> Tuple[faiss.Index, bool]:
+        """
+        Read an index from disk, optionally memory-mapping its vectors.
+        
+        Memory-mapped vectors live in the OS page cache instead of the process
+        heap, so every worker process serving the same index shares one copy.
+        
+        Args:
+            index_path: Path of the .index file
+            mmap: Try to memory-map the index
+            
+        Returns:
+            Tuple of (index, whether it is memory-mapped)
+        """
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        if mmap and mmap_flag is not None:
+            try:
+                return faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError as e:
+                logger.warning(f"Memory-mapped load not supported for {index_path}, reading into memory: {e}")
+        elif mmap:
+            logger.warning("This FAISS version cannot memory-map indexes, reading into memory")
+        
+        return faiss.read_index(index_path), False
+    
+    def _ensure_writable(self) -> None:
+        """Copy a memory-mapped index into process memory before modifying it."""
+        if self.is_mmapped:
+            logger.info("Copying memory-mapped index into memory for writing")
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self.is_mmapped = False
+    
+    def _add_vectors(self, vectors: np.ndarray, doc_ids: np.ndarray) -> None:
+        """
+        Add raw vectors to the index, training it first if needed.
+        
+        Args:
+            vectors: Vectors of shape (n, d)
+            doc_ids: Stable int64 ids of the vectors
+        """
+        # Mapped vectors are read-only views of the file
+        self._ensure_writable()
+        
+        # No-op for the float32 vectors produced by the vectorizers (normalized for "ip")
+        embeddings_array = self._prepare_vectors(vectors)
+        
+        # IVF backends learn their clusters from the first batch
+        if not self.index.is_trained:
+            self._train(embeddings_array)
+        
+        if self.index_type in IVF_INDEX_TYPES:
+            # An array direct map only supports sequential ids
+            ivf_index = faiss.extract_index_ivf(self.index)
+            if ivf_index.direct_map.type == faiss.DirectMap.Array:
+                ivf_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            self.index.add_with_ids(embeddings_array, doc_ids)
+        elif isinstance(self.index, faiss.IndexIDMap):
+            self.index.add_with_ids(embeddings_array, doc_ids)
+        else:
+            # Index saved before stable ids: ids are positions (next_id == ntotal until compaction)
+            self.index.add(embeddings_array)
+    
+    def _ensure_direct_map(self) -> None:
+        """Enable id -> vector lookups on IVF indexes (kept up to date by later adds)."""
+        if self.index_type in IVF_INDEX_TYPES:
+            ivf_index = faiss.extract_index_ivf(self.index)
+            if ivf_index.direct_map.type != faiss.DirectMap.Hashtable:
+                ivf_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    
+    def reconstruct_vectors(self) -> np.ndarray:
+        """
+        Read the vectors of all stored documents back out of the index.
+        
+        Vectors are exact for flat, HNSW and IVF-Flat indexes and approximate
+        (decoded PQ codes) for IVF-PQ.
+        
+        Returns:
+            float32 array of shape (len(documents), dimension), in document order
+        """
+        self._ensure_direct_map()
+        return self.index.reconstruct_batch(self.documents.ids)
+    
+    def add_documents(self, documents: List[Dict[str, Any]], embeddings: Optional[np.ndarray] = None) -> bool:
         """
         Add documents to the vector database.
         
+        Per-document 'embedding' arrays are stacked into one new (n, d) array.
+        Callers that already hold the embeddings as one float32 matrix (e.g.
+        from VectorizationModule.get_batch_embedding_matrix) can pass it as
+        `embeddings` instead; it is then added without a copy for the L2 metric.
+        
         Args:
             documents: List of document dictionaries with embeddings
+            embeddings: Optional (n, d) embeddings, row i for documents[i]
+                (the 'embedding' keys are then ignored)
             
         Returns:
             Success statusservice_account_credentials.json
@@ -39,37 +472,360 @@ class FaissVectorDB:
             return False
         
         try:
-            # Extract embeddings and convert to numpy array
-            embeddings = [doc['embedding'] for doc in documents if 'embedding' in doc]
-            if not embeddings:
+            if embeddings is None and not any('embedding' in doc for doc in documents):
                 logger.warning("No embeddings found in documents")
                 return False
             
-            embeddings_array = np.array(embeddings).astype('float32')
+            doc_ids = self._add_documents(documents, embeddings)
+            logger.info(f"Added {len(doc_ids)} documents to FAISS index")
+            return True
             
-            # Add to FAISS index
-            self.index.add(embeddings_array)
+        except Exception as e:
+            logger.error(f"Error adding documents to FAISS index: {e}")
+            return False
+    
+    def _add_documents(self, documents: List[Dict[str, Any]], embeddings: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Assign stable ids to documents and add them to the index.
+        
+        Args:
+            documents: List of document dictionaries with embeddings
+            embeddings: Optional (n, d) embeddings, row i for documents[i]
+            
+        Returns:
+            Ids of the added documents
+        """
+        if embeddings is not None:
+            if len(embeddings) != len(documents):
+                raise ValueError(f"Got {len(embeddings)} embeddings for {len(documents)} documents")
+            embedded = documents
+            vectors = self._prepare_vectors(embeddings)
+        else:
+            embedded = [doc for doc in documents if 'embedding' in doc]
+            if len(embedded) < len(documents):
+                logger.warning(f"Skipping {len(documents) - len(embedded)} documents without embeddings")
+            # Stacking the per-document arrays allocates one new (n, d) array
+            vectors = self._prepare_vectors(np.stack([doc['embedding'] for doc in embedded]))
+        
+        doc_ids = np.arange(self.next_id, self.next_id + len(embedded), dtype=np.int64)
+        
+        # Add to FAISS index
+        self._add_vectors(vectors, doc_ids)
+        
+        # Store document information without the embedding to save memory
+        self.documents.extend(
+            [{key: value for key, value in doc.items() if key != 'embedding'} for doc in embedded],
+            doc_ids.tolist()
+        )
+        self._deleted = np.concatenate([self._deleted, np.zeros(len(embedded), dtype=bool)])
+        self.next_id += len(embedded)
+        
+        if self._track_changes:
+            self._pending_vectors.append(vectors)
+            self._pending_ids.append(doc_ids)
+        
+        self.is_populated = True
+        return doc_ids
+    
+    def upsert_documents(self, documents: List[Dict[str, Any]], key: str) -> List[int]:
+        """
+        Add documents, replacing stored documents with the same `key` metadata value.
+        
+        Args:
+            documents: List of document dictionaries with embeddings
+            key: Metadata key identifying a document (e.g. 'chunk_id')
+            
+        Returns:
+            Stable ids of the added documents (empty on failure)
+        """
+        try:
+            self._update_metadata_index()
+            replaced_rows = [row for doc in documents if key in doc for row in self._matching_rows(key, doc[key])]
+            
+            doc_ids = self._add_documents(documents)
+            replaced = self._delete_rows(np.array(replaced_rows, dtype=np.int64))
+            
+            logger.info(f"Upserted {len(doc_ids)} documents ({replaced} replaced)")
+            return doc_ids.tolist()
+            
+        except Exception as e:
+            logger.error(f"Error upserting documents: {e}")
+            return []
+    
+    def delete_documents(self, doc_ids: List[int]) -> int:
+        """
+        Delete documents by stable id.
+        
+        Deleted documents are tombstoned and excluded from search right away;
+        their vectors are dropped by `compact` (or the next full `save`).
+        
+        Args:
+            doc_ids: Ids returned by `upsert_documents` / `get_document_ids`
+            
+        Returns:
+            Number of documents deleted
+        """
+        try:
+            rows = self.documents.rows_of(doc_ids)
+            return self._delete_rows(rows[rows != -1])
+        except Exception as e:
+            logger.error(f"Error deleting documents: {e}")
+            return 0
+    
+    def delete_by_metadata(self, metadata_filter: Dict[str, Any]) -> int:
+        """
+        Delete every document whose metadata matches all filter values.
+        
+        Unlike search filters, documents without a filtered key do not match.
+        
+        Args:
+            metadata_filter: Mapping of metadata key to value (e.g. {'source': 'paper.pdf'})
+            
+        Returns:
+            Number of documents deleted
+        """
+        if not metadata_filter:
+            return 0
+        
+        try:
+            self._update_metadata_index()
+            mask = np.ones(len(self.documents), dtype=bool)
+            for key, value in metadata_filter.items():
+                key_mask = np.zeros(len(self.documents), dtype=bool)
+                key_mask[self._matching_rows(key, value)] = True
+                mask &= key_mask
+            return self._delete_rows(np.flatnonzero(mask))
+            
+        except Exception as e:
+            logger.error(f"Error deleting documents by metadata: {e}")
+            return 0
+    
+    def _delete_rows(self, rows: np.ndarray) -> int:
+        """
+        Tombstone document rows.
+        
+        Args:
+            rows: Document rows to delete
+            
+        Returns:
+            Number of newly deleted documents
+        """
+        rows = np.unique(rows)
+        rows = rows[~self._deleted[rows]]
+        self._deleted[rows] = True
+        
+        if self._track_changes and len(rows):
+            self._pending_deleted_ids.append(self.documents.ids[rows])
+        
+        self.is_populated = not self._deleted.all()
+        return len(rows)
+    
+    def get_document_ids(self) -> np.ndarray:
+        """
+        Get the stable ids of the live (not deleted) documents.
+        
+        Returns:
+            Ascending int64 ids
+        """
+        return self.documents.ids[~self._deleted]
+    
+    def compact(self) -> bool:
+        """
+        Physically remove tombstoned documents from the index and document store.
+        
+        Flat and IVF indexes remove the vectors in place. HNSW graphs cannot
+        remove nodes, so they are rebuilt from the live vectors. Ids do not change.
+        
+        Returns:
+            Success status
+        """
+        if not self._deleted.any():
+            return True
+        
+        try:
+            self._ensure_writable()
+            live_rows = np.flatnonzero(~self._deleted)
+            dead_ids = self.documents.ids[self._deleted]
+            live_ids = self.documents.ids[live_rows]
+            
+            if self.index_type in IVF_INDEX_TYPES:
+                ivf_index = faiss.extract_index_ivf(self.index)
+                if ivf_index.direct_map.type == faiss.DirectMap.Array:
+                    ivf_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+                self.index.remove_ids(dead_ids)
+            elif self.index_type != "hnsw" and isinstance(self.index, faiss.IndexIDMap):
+                self.index.remove_ids(dead_ids)
+            else:
+                # HNSW (and flat indexes saved with positional ids) are rebuilt under an id map
+                live_vectors = self.index.reconstruct_batch(live_ids)
+                self.index = self._create_index(self.nlist, self.pq_nbits)
+                self.index.add_with_ids(live_vectors, live_ids)
             
-            # Store document information without the embedding to save memory
-            for doc in documents:
-                doc_copy = doc.copy()
-                if 'embedding' in doc_copy:
-                    del doc_copy['embedding']  # Don't store embedding twice
-                self.documents.append(doc_copy)
+            self.documents = self.documents.select(live_rows)
+            self._deleted = np.zeros(len(live_rows), dtype=bool)
+            self._reset_metadata_index()
             
-            self.is_populated = True
-            logger.info(f"Added {len(documents)} documents to FAISS index")
+            logger.info(f"Compacted index: removed {len(dead_ids)} deleted documents, {len(live_rows)} remain")
             return True
             
         except Exception as e:
-            logger.error(f"Error adding documents to FAISS index: {e}")
+            logger.error(f"Error compacting index: {e}")
             return False
     
+    def _search_ids(
+        self, 
+        query_vectors: np.ndarray, 
+        k: int, 
+        metadata_filter: Optional[Dict[str, Any]],
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        rerank_factor: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the index for a batch of prepared queries.
+        
+        Args:
+            query_vectors: Prepared queries of shape (n, d)
+            k: Number of results per query
+            metadata_filter: Optional filter for document metadata
+            nprobe: IVF clusters to visit (IVF backends only)
+            ef_search: HNSW search depth (HNSW backend only)
+            rerank_factor: Candidates per result to re-score exactly (defaults to self.rerank_factor)
+            
+        Returns:
+            Tuple of (similarity scores, ids), each of shape (n, <=k); missing results have id -1
+        """
+        # Restrict the search to matching, non-deleted ids inside FAISS instead of post-filtering
+        selector = None
+        selected_ids = None
+        row_mask = self._metadata_filter_mask(metadata_filter) if metadata_filter else None
+        if self._deleted.any():
+            row_mask = ~self._deleted if row_mask is None else row_mask & ~self._deleted
+        
+        if row_mask is not None:
+            selected_ids = self.documents.ids[row_mask]
+            if len(selected_ids) == 0:
+                return np.empty((len(query_vectors), 0), dtype=np.float32), np.empty((len(query_vectors), 0), dtype=np.int64)
+            id_mask = np.zeros(self.next_id, dtype=bool)
+            id_mask[selected_ids] = True
+            bitmap = np.packbits(id_mask, bitorder='little')
+            selector = faiss.IDSelectorBitmap(len(id_mask), faiss.swig_ptr(bitmap))
+        
+        # Compressed indexes with raw vectors on disk fetch extra candidates for exact re-ranking
+        rerank_factor = self.rerank_factor if rerank_factor is None else rerank_factor
+        search_k = k * rerank_factor if self._raw_vectors is not None and rerank_factor > 1 else k
+        
+        if selected_ids is not None and self.index_type != "flat" and len(selected_ids) <= EXACT_FILTER_THRESHOLD:
+            distances, indices = self._exact_search_ids(query_vectors, selected_ids, search_k)
+        else:
+            # One FAISS call for the whole batch (BLAS + OpenMP across queries)
+            distances, indices = self.index.search(
+                query_vectors, 
+                search_k,
+                params=self._search_parameters(nprobe, ef_search, selector)
+            )
+            
+            # ANN traversal under a selector can come back short; guarantee k results
+            if selected_ids is not None:
+                short_rows = np.flatnonzero(np.count_nonzero(indices != -1, axis=1) < min(search_k, len(selected_ids)))
+                if len(short_rows):
+                    exact_distances, exact_indices = self._exact_search_ids(query_vectors[short_rows], selected_ids, search_k)
+                    width = exact_indices.shape[1]
+                    distances[short_rows, :width] = exact_distances
+                    indices[short_rows, :width] = exact_indices
+                    indices[short_rows, width:] = -1
+        
+        if search_k > k:
+            distances, indices = self._rerank(query_vectors, distances, indices, k)
+        
+        return self._distances_to_scores(distances), indices
+    
+    def _rerank(
+        self, 
+        query_vectors: np.ndarray, 
+        distances: np.ndarray, 
+        indices: np.ndarray, 
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Re-score compressed-index candidates exactly with the raw vectors on disk.
+        
+        Only the candidate rows are read from the memory-mapped vector file.
+        Candidates without a raw vector (added after compression) keep their
+        approximate distance.
+        
+        Args:
+            query_vectors: Prepared queries of shape (n, d)
+            distances: Approximate raw distances of shape (n, m)
+            indices: Candidate ids of shape (n, m), -1 for missing
+            k: Number of results to keep per query
+            
+        Returns:
+            Tuple of (raw distances, ids), each of shape (n, min(k, m)), best first
+        """
+        raw_ids = self._raw_vector_ids
+        positions = np.minimum(np.searchsorted(raw_ids, indices), len(raw_ids) - 1)
+        has_raw = (indices != -1) & (raw_ids[positions] == indices)
+        
+        # Read each candidate vector once, in file order
+        unique_positions, inverse = np.unique(positions[has_raw], return_inverse=True)
+        candidates = np.asarray(self._raw_vectors[unique_positions], dtype=np.float32)[inverse]
+        query_rows = np.nonzero(has_raw)[0]
+        
+        exact = distances.copy()
+        if self.metric == "ip":
+            exact[has_raw] = np.einsum('ij,ij->i', query_vectors[query_rows], candidates)
+            exact[indices == -1] = -np.inf
+            order = np.argsort(-exact, axis=1)[:, :k]
+        else:
+            exact[has_raw] = np.sum((query_vectors[query_rows] - candidates) ** 2, axis=1)
+            exact[indices == -1] = np.inf
+            order = np.argsort(exact, axis=1)[:, :k]
+        
+        return np.take_along_axis(exact, order, axis=1), np.take_along_axis(indices, order, axis=1)
+    
+    def set_rerank_vectors(self, vectors: np.ndarray, doc_ids: np.ndarray) -> None:
+        """
+        Attach raw vectors used to re-rank results of a compressed index.
+        
+        Args:
+            vectors: float32 vectors as stored in the index (normalized for "ip"), e.g. a memory-mapped .npy
+            doc_ids: Ascending document ids of the vectors
+        """
+        if len(vectors) != len(doc_ids):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(doc_ids)} ids")
+        self._raw_vectors = vectors if len(doc_ids) else None
+        self._raw_vector_ids = np.asarray(doc_ids, dtype=np.int64)
+    
+    def _materialize_results(self, scores: np.ndarray, indices: np.ndarray) -> Tuple[List[Dict[str, Any]], List[float]]:
+        """
+        Turn one row of search output into documents and scores.
+        
+        Args:
+            scores: Similarity scores for one query
+            indices: Document ids for one query
+            
+        Returns:
+            Tuple of (documents, scores) for the valid ids
+        """
+        results = []
+        result_scores = []
+        
+        for score, row in zip(scores, self.documents.rows_of(indices)):
+            if row != -1:  # Valid index
+                results.append(self.documents[row])
+                result_scores.append(float(score))
+        
+        return results, result_scores
+    
     def similarity_search(
         self, 
         query_embedding: np.ndarray, 
         k: int = 5, 
-        metadata_filter: Optional[Dict[str, Any]] = None
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        rerank_factor: Optional[int] = None
     ) -> Tuple[List[Dict[str, Any]], List[float]]:
         """
         Perform similarity search in the vector database.
@@ -78,57 +834,122 @@ class FaissVectorDB:
             query_embedding: Query vector
             k: Number of results to return
             metadata_filter: Optional filter for document metadata
+            nprobe: IVF clusters to visit for this query (IVF backends only)
+            ef_search: HNSW search depth for this query (HNSW backend only)
+            rerank_factor: Candidates per result re-scored exactly (compressed indexes with raw vectors)
             
         Returns:
-            Tuple of (matching documents, similarity scores)
+            Tuple of (matching documents, cosine similarity scores, highest first)
         """
+        return self.batch_similarity_search(
+            np.reshape(query_embedding, (1, -1)), 
+            k=k, 
+            metadata_filter=metadata_filter,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            rerank_factor=rerank_factor
+        )[0]
+    
+    def batch_similarity_search(
+        self, 
+        query_embeddings: np.ndarray, 
+        k: int = 5, 
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        rerank_factor: Optional[int] = None
+    ) -> List[Tuple[List[Dict[str, Any]], List[float]]]:
+        """
+        Perform similarity search for several queries in one FAISS call.
+        
+        Args:
+            query_embeddings: Query matrix of shape (n, d)
+            k: Number of results to return per query
+            metadata_filter: Optional filter for document metadata (shared by all queries)
+            nprobe: IVF clusters to visit (IVF backends only)
+            ef_search: HNSW search depth (HNSW backend only)
+            rerank_factor: Candidates per result re-scored exactly (compressed indexes with raw vectors)
+            
+        Returns:
+            List of (matching documents, cosine similarity scores) tuples, one per query
+        """
+        num_queries = len(query_embeddings)
+        
         if not self.is_populated:
             logger.warning("Index is empty. No documents to search.")
-            return [], []
+            return [([], []) for _ in range(num_queries)]
         
         try:
-            query_vector = np.array([query_embedding]).astype('float32')
-            
-            # Search the index
-            distances, indices = self.index.search(query_vector, k * 4)  # Get more results for filtering
-            distances = distances[0]
-            indices = indices[0]
-            
-            # Filter results if needed
-            results = []
-            scores = []
-            
-            for i, idx in enumerate(indices):
-                if idx != -1 and idx < len(self.documents):  # Valid index
-                    doc = self.documents[idx]
-                    
-                    # Apply metadata filtering if specified
-                    if metadata_filter:
-                        include = True
-                        for key, value in metadata_filter.items():
-                            if key in doc and doc[key] != value:
-                                include = False
-                                break
-                        
-                        if not include:
-                            continue
-                    
-                    results.append(doc)
-                    scores.append(float(distances[i]))
-                    
-                    if len(results) >= k:
-                        break
-            
-            return results, scores
+            query_vectors = self._prepare_vectors(query_embeddings)
+            scores, indices = self._search_ids(query_vectors, k, metadata_filter, nprobe, ef_search, rerank_factor)
+            return [self._materialize_results(scores[i], indices[i]) for i in range(num_queries)]
             
         except Exception as e:
             logger.error(f"Error performing similarity search: {e}")
+            return [([], []) for _ in range(num_queries)]
+    
+    def multi_query_search(
+        self, 
+        query_embeddings: np.ndarray, 
+        k: int = 5, 
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        rerank_factor: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], List[float]]:
+        """
+        Retrieve documents for several phrasings of one question.
+        
+        All queries are searched in one batch; each document keeps its best
+        score across the queries and the overall top k are returned.
+        
+        Args:
+            query_embeddings: Query matrix of shape (n, d)
+            k: Number of results to return
+            metadata_filter: Optional filter for document metadata
+            nprobe: IVF clusters to visit (IVF backends only)
+            ef_search: HNSW search depth (HNSW backend only)
+            rerank_factor: Candidates per result re-scored exactly (compressed indexes with raw vectors)
+            
+        Returns:
+            Tuple of (matching documents, cosine similarity scores, highest first)
+        """
+        if not self.is_populated:
+            logger.warning("Index is empty. No documents to search.")
+            return [], []
+        
+        try:
+            query_vectors = self._prepare_vectors(query_embeddings)
+            scores, indices = self._search_ids(query_vectors, k, metadata_filter, nprobe, ef_search, rerank_factor)
+            
+            best_scores = {}
+            for score, idx in zip(scores.ravel(), indices.ravel()):
+                if idx != -1 and score > best_scores.get(idx, -np.inf):
+                    best_scores[idx] = score
+            
+            top_ids = sorted(best_scores, key=best_scores.get, reverse=True)[:k]
+            return self._materialize_results(
+                np.array([best_scores[idx] for idx in top_ids]), 
+                np.array(top_ids, dtype=np.int64)
+            )
+            
+        except Exception as e:
+            logger.error(f"Error performing multi-query search: {e}")
             return [], []
     
+    def _reset_pending_changes(self) -> None:
+        """Forget the changes recorded since the last save."""
+        self._pending_vectors = []
+        self._pending_ids = []
+        self._pending_deleted_ids = []
+    
     def save(self, path: str) -> bool:
         """
         Save the vector database to disk.
         
+        A full save compacts tombstoned documents and folds all delta segments
+        into the base files.
+        
         Args:
             path: Path to save the database
             
@@ -139,13 +960,34 @@ class FaissVectorDB:
             # Create directory if it doesn't exist
             os.makedirs(os.path.dirname(path), exist_ok=True)
             
-            # Save the FAISS index
-            faiss.write_index(self.index, f"{path}.index")
+            if not self.compact():
+                raise RuntimeError("Failed to compact deleted documents")
+            
+            # Save the FAISS index (via a temp file: the current file may be memory-mapped)
+            faiss.write_index(self.index, f"{path}.index.tmp")
+            os.replace(f"{path}.index.tmp", f"{path}.index")
+            
+            # Save the documents metadata (columnar, memory-mapped on load)
+            self.documents.save(f"{path}.documents")
+            
+            # Raw vectors for re-ranking are written once; extra rows of deleted ids are never matched
+            if self._raw_vectors is not None and not os.path.exists(f"{path}.vectors.npy"):
+                np.save(f"{path}.vector_ids.npy", self._raw_vector_ids)
+                np.save(f"{path}.vectors.npy", np.asarray(self._raw_vectors, dtype=np.float32))
+            
+            # The base now contains every change, so earlier delta segments are obsolete
+            for name in self.deltas:
+                for delta_path in (f"{path}.{name}.npz", f"{path}.{name}.documents"):
+                    if os.path.exists(delta_path):
+                        os.remove(delta_path)
+            self.deltas = []
             
-            # Save the documents metadata
-            with open(f"{path}.documents", 'wb') as f:
-                pickle.dump(self.documents, f)
+            # Save the index metadata so loaders can check embedding compatibility
+            with open(f"{path}.meta", 'w') as f:
+                json.dump(self.get_index_metadata(), f)
             
+            self._reset_pending_changes()
+            self._track_changes = True
             logger.info(f"Saved vector database to {path}")
             return True
             
@@ -153,32 +995,176 @@ class FaissVectorDB:
             logger.error(f"Error saving vector database: {e}")
             return False
     
-    def load(self, path: str) -> bool:
+    def save_delta(self, path: str) -> bool:
+        """
+        Save the changes since the last load/save as a delta segment.
+        
+        The segment holds only the added vectors and documents plus the
+        deleted ids, so its size is proportional to the change. It is listed
+        in the `.meta` file and replayed on top of the base files by `load`.
+        
+        Args:
+            path: Path the database was loaded from or saved to
+            
+        Returns:
+            Success status
+        """
+        try:
+            if not self._track_changes or not os.path.exists(f"{path}.meta"):
+                raise ValueError(f"No base index at {path}; use save() first")
+            
+            added_ids = np.concatenate(self._pending_ids) if self._pending_ids else np.empty(0, dtype=np.int64)
+            added_vectors = (
+                np.concatenate(self._pending_vectors) if self._pending_vectors 
+                else np.empty((0, self.dimension), dtype=np.float32)
+            )
+            deleted_ids = np.concatenate(self._pending_deleted_ids) if self._pending_deleted_ids else np.empty(0, dtype=np.int64)
+            
+            # Documents added and then compacted away are only recorded as deletions
+            rows = self.documents.rows_of(added_ids)
+            added_ids, added_vectors, rows = added_ids[rows != -1], added_vectors[rows != -1], rows[rows != -1]
+            
+            if not len(added_ids) and not len(deleted_ids):
+                logger.info("No changes to save as a delta")
+                return True
+            
+            name = f"delta{len(self.deltas) + 1}"
+            np.savez(f"{path}.{name}.npz", ids=added_ids, vectors=added_vectors, deleted_ids=deleted_ids)
+            self.documents.select(rows).save(f"{path}.{name}.documents")
+            self.deltas.append(name)
+            
+            with open(f"{path}.meta", 'w') as f:
+                json.dump(self.get_index_metadata(), f)
+            
+            self._reset_pending_changes()
+            logger.info(f"Saved {name} to {path}: {len(added_ids)} added, {len(deleted_ids)} deleted")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error saving delta segment: {e}")
+            return False
+    
+    def _apply_delta(self, path: str, name: str) -> None:
+        """
+        Replay one delta segment on top of the loaded index.
+        
+        Args:
+            path: Index path (without extension)
+            name: Delta segment name from the `.meta` file
+        """
+        with np.load(f"{path}.{name}.npz", allow_pickle=False) as delta:
+            added_ids, added_vectors, deleted_ids = delta['ids'], delta['vectors'], delta['deleted_ids']
+        
+        if len(added_ids):
+            delta_documents = DocumentStore.load(f"{path}.{name}.documents")
+            self._add_vectors(added_vectors, added_ids)
+            self.documents.extend(list(delta_documents), added_ids.tolist())
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(added_ids), dtype=bool)])
+            self.next_id = max(self.next_id, int(added_ids[-1]) + 1)
+        
+        rows = self.documents.rows_of(deleted_ids)
+        self._delete_rows(rows[rows != -1])
+    
+    def load(self, path: str, allow_legacy_pickle: Optional[bool] = None, mmap: Optional[bool] = None) -> bool:
         """
         Load the vector database from disk.
         
         Args:
             path: Path to load the database from
+            allow_legacy_pickle: Accept old pickled document files (defaults to
+                the ALLOW_LEGACY_PICKLE_DOCUMENTS environment variable)
+            mmap: Memory-map the index vectors so worker processes share them
+                (defaults to the FAISS_MMAP_INDEXES environment variable)
             
         Returns:
             Success status
         """
         try:
+            if mmap is None:
+                mmap = os.getenv("FAISS_MMAP_INDEXES", "false").lower() == "true"
+            memory_before = get_memory_usage()
+            
             # Load the FAISS index
-            self.index = faiss.read_index(f"{path}.index")
+            self.index, self.is_mmapped = self._read_index(f"{path}.index", mmap)
+            self.dimension = self.index.d
+            self.index_type = self._detect_index_type(self.index)
+            self.metric = "ip" if self.index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+            
+            if self.index_type == "hnsw":
+                self.hnsw_m = self._base_index().hnsw.nb_neighbors(1)
+            
+            # Load the index metadata (older indexes were saved without it)
+            metadata = {}
+            if os.path.exists(f"{path}.meta"):
+                with open(f"{path}.meta", 'r') as f:
+                    metadata = json.load(f)
+                if metadata.get('dimension', self.dimension) != self.dimension:
+                    raise ValueError(f"Index dimension {self.dimension} does not match metadata dimension {metadata['dimension']}")
+                self.embedding_model = metadata.get('embedding_model')
+            
+            # Load the documents metadata (materialized lazily by id)
+            if allow_legacy_pickle is None:
+                allow_legacy_pickle = os.getenv("ALLOW_LEGACY_PICKLE_DOCUMENTS", "false").lower() == "true"
+            self.documents = DocumentStore.load(f"{path}.documents", allow_legacy_pickle=allow_legacy_pickle)
+            self._deleted = np.zeros(len(self.documents), dtype=bool)
+            self.next_id = max(
+                metadata.get('next_id', 0), 
+                int(self.documents.ids[-1]) + 1 if len(self.documents) else 0
+            )
+            
+            # Raw vectors of a compressed index stay on disk; only re-ranked candidates are read
+            self._raw_vectors = self._raw_vector_ids = None
+            if os.path.exists(f"{path}.vectors.npy") and os.path.exists(f"{path}.vector_ids.npy"):
+                self.set_rerank_vectors(
+                    np.load(f"{path}.vectors.npy", mmap_mode='r'),
+                    np.load(f"{path}.vector_ids.npy")
+                )
+            
+            # Replay delta segments saved since the base
+            self._track_changes = False
+            self.deltas = metadata.get('deltas', [])
+            for name in self.deltas:
+                self._apply_delta(path, name)
+            self._reset_pending_changes()
+            self._track_changes = True
             
-            # Load the documents metadata
-            with open(f"{path}.documents", 'rb') as f:
-                self.documents = pickle.load(f)
+            self.is_populated = not self._deleted.all()
+            self._reset_metadata_index()
+            logger.info(f"Loaded vector database from {path} with {len(self.documents)} documents ({self.dimension} dimensions)")
             
-            self.is_populated = len(self.documents) > 0
-            logger.info(f"Loaded vector database from {path} with {len(self.documents)} documents")
+            memory_after = get_memory_usage()
+            if 'rss_kb' in memory_after:
+                logger.info(
+                    f"Worker {memory_after['pid']} RSS {memory_before['rss_kb']} kB -> {memory_after['rss_kb']} kB "
+                    f"(private {memory_after['rss_anon_kb']} kB, shared file-backed {memory_after['rss_file_kb']} kB, "
+                    f"mmap={self.is_mmapped})"
+                )
             return True
             
         except Exception as e:
             logger.error(f"Error loading vector database: {e}")
             return False
     
+    def get_index_metadata(self) -> Dict[str, Any]:
+        """
+        Get the metadata describing this index.
+        
+        Returns:
+            Dictionary with dimension, embedding model, index type, document counts,
+            delta segments and whether raw re-ranking vectors are stored alongside
+        """
+        return {
+            'dimension': self.dimension,
+            'embedding_model': self.embedding_model,
+            'index_type': self.index_type,
+            'metric': self.metric,
+            'count': self.index.ntotal,
+            'deleted': int(self._deleted.sum()),
+            'next_id': self.next_id,
+            'deltas': self.deltas,
+            'rerank_vectors': self._raw_vectors is not None
+        }
+    
     def get_langchain_documents(self, results: List[Dict[str, Any]]) -> List[Document]:
         """
         Convert results to LangChain document format.
@@ -200,4 +1186,179 @@ class FaissVectorDB:
                 metadata=metadata
             ))
         
-        return documents
\ No newline at end of file
+        return documents
+
+
+def migrate_index_metric(source_path: str, output_path: str, metric: str = "ip") -> bool:
+    """
+    Rebuild a saved index with a different distance metric.
+    
+    Vectors are reconstructed from the existing index (normalized on insert
+    for "ip") and re-indexed with the same backend and IVF/PQ parameters.
+    
+    Args:
+        source_path: Existing index path (without extension)
+        output_path: Path for the migrated index (without extension)
+        metric: Target metric, "ip" or "l2"
+        
+    Returns:
+        Success status
+    """
+    try:
+        source_db = FaissVectorDB()
+        if not source_db.load(source_path) or not source_db.compact():
+            return False
+        
+        index_kwargs = {}
+        if source_db.index_type in IVF_INDEX_TYPES:
+            ivf_index = faiss.downcast_index(faiss.extract_index_ivf(source_db.index))
+            index_kwargs['nlist'] = ivf_index.nlist
+            if source_db.index_type in PQ_INDEX_TYPES:
+                index_kwargs['pq_m'] = ivf_index.pq.M
+                index_kwargs['pq_nbits'] = ivf_index.pq.nbits
+        elif source_db.index_type == "hnsw":
+            index_kwargs['hnsw_m'] = source_db.hnsw_m
+        
+        if source_db.index_type in COMPRESSED_INDEX_TYPES:
+            logger.warning("Migrating a compressed index re-encodes approximate (decoded) vectors")
+        
+        target_db = FaissVectorDB(
+            dimension=source_db.dimension,
+            embedding_model=source_db.embedding_model,
+            index_type=source_db.index_type,
+            metric=metric,
+            **index_kwargs
+        )
+        target_db._add_vectors(source_db.reconstruct_vectors(), source_db.documents.ids)
+        target_db.documents = source_db.documents
+        target_db._deleted = np.zeros(len(source_db.documents), dtype=bool)
+        target_db.next_id = source_db.next_id
+        target_db.is_populated = source_db.is_populated
+        
+        logger.info(f"Migrated {target_db.index.ntotal} vectors from {source_db.metric} to {metric}")
+        return target_db.save(output_path)
+        
+    except Exception as e:
+        logger.error(f"Error migrating index metric: {e}")
+        return False
+
+
+def compress_index(
+    source_path: str, 
+    output_path: str, 
+    index_type: str = "ivf_opq", 
+    pq_m: int = 64, 
+    pq_nbits: int = 8, 
+    nlist: Optional[int] = None, 
+    keep_raw_vectors: bool = True
+) -> bool:
+    """
+    Rebuild a saved index as a compressed (OPQ/PQ or 8-bit scalar quantized) index.
+    
+    Meant for rarely queried indexes: an IVF-OPQ index with pq_m=64 stores 64
+    bytes per vector instead of 4 * dimension. With keep_raw_vectors the float32
+    vectors are also written next to the index (`.vectors.npy`); they are
+    memory-mapped on load and only the candidates are read to re-rank results exactly.
+    
+    Args:
+        source_path: Existing index path (without extension)
+        output_path: Path for the compressed index (without extension)
+        index_type: "ivf_opq", "ivf_pq" or "sq8"
+        pq_m: Number of PQ sub-quantizers (bytes per vector at 8 bits)
+        pq_nbits: Bits per PQ code
+        nlist: IVF cluster count (defaults to ~4 * sqrt(n))
+        keep_raw_vectors: Store the float32 vectors on disk for exact re-ranking
+        
+    Returns:
+        Success status
+    """
+    try:
+        if index_type not in COMPRESSED_INDEX_TYPES:
+            raise ValueError(f"Unsupported compressed index type: {index_type}. Use one of {COMPRESSED_INDEX_TYPES}")
+        
+        source_db = FaissVectorDB()
+        if not source_db.load(source_path) or not source_db.compact():
+            return False
+        
+        vectors = source_db.reconstruct_vectors()
+        doc_ids = source_db.documents.ids
+        target_db = FaissVectorDB(
+            dimension=source_db.dimension,
+            embedding_model=source_db.embedding_model,
+            index_type=index_type,
+            metric=source_db.metric,
+            nlist=nlist or max(1, int(4 * np.sqrt(len(vectors)))),
+            pq_m=pq_m,
+            pq_nbits=pq_nbits
+        )
+        target_db._add_vectors(vectors, doc_ids)
+        target_db.documents = source_db.documents
+        target_db._deleted = np.zeros(len(source_db.documents), dtype=bool)
+        target_db.next_id = source_db.next_id
+        target_db.is_populated = source_db.is_populated
+        if keep_raw_vectors:
+            target_db.set_rerank_vectors(vectors, doc_ids)
+        
+        if not target_db.save(output_path):
+            return False
+        
+        source_bytes = os.path.getsize(f"{source_path}.index")
+        target_bytes = os.path.getsize(f"{output_path}.index")
+        logger.info(
+            f"Compressed {len(vectors)} vectors from {source_db.index_type} to {index_type}: "
+            f"{source_bytes / 2**20:.1f} MB -> {target_bytes / 2**20:.1f} MB in memory"
+            f"{' (raw vectors kept on disk for re-ranking)' if keep_raw_vectors else ''}"
+        )
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error compressing index: {e}")
+        return False
+
+
+def federated_search(
+    vector_dbs: Dict[str, FaissVectorDB], 
+    query_embeddings: np.ndarray, 
+    k: int = 5, 
+    metadata_filter: Optional[Dict[str, Any]] = None,
+    max_workers: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], List[float]]:
+    """
+    Search several loaded indexes in parallel and merge their top k.
+    
+    FAISS releases the GIL while searching, so the per-index searches run
+    concurrently in a thread pool. Scores are cosine similarities for both
+    metrics, so results from different indexes are directly comparable.
+    
+    Args:
+        vector_dbs: Mapping of index name (e.g. model_id) to loaded database
+        query_embeddings: One query vector of shape (d,), or several phrasings of shape (n, d)
+        k: Number of results to return overall
+        metadata_filter: Optional filter for document metadata
+        max_workers: Thread pool size (defaults to one thread per index)
+        
+    Returns:
+        Tuple of (matching documents tagged with 'source_index', cosine similarity scores, highest first)
+    """
+    if not vector_dbs:
+        return [], []
+    
+    query_matrix = np.atleast_2d(query_embeddings)
+    dimensions = {vector_db.dimension for vector_db in vector_dbs.values()}
+    embedding_models = {vector_db.embedding_model for vector_db in vector_dbs.values()} - {None}
+    if dimensions != {query_matrix.shape[1]} or len(embedding_models) > 1:
+        raise ValueError(
+            f"Indexes are not searchable together: dimensions {sorted(dimensions)}, "
+            f"embedding models {sorted(embedding_models)}, query dimension {query_matrix.shape[1]}"
+        )
+    
+    def _search(item):
+        name, vector_db = item
+        results, scores = vector_db.multi_query_search(query_matrix, k=k, metadata_filter=metadata_filter)
+        return [(score, name, doc) for doc, score in zip(results, scores)]
+    
+    with ThreadPoolExecutor(max_workers=max_workers or len(vector_dbs)) as executor:
+        candidates = [candidate for shard in executor.map(_search, vector_dbs.items()) for candidate in shard]
+    
+    top = heapq.nlargest(k, candidates, key=lambda candidate: candidate[0])
+    return [{**doc, 'source_index': name} for _, name, doc in top], [score for score, _, _ in top]
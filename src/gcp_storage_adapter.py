@@ -1,49 +1,197 @@
 # gcp_storage_adapter.py
 import os
+import json
+import time
+import base64
+import hashlib
+import tarfile
 import tempfile
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.cloud import storage
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+
+try:
+    import zstandard # type: ignore
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Packaged transfer format: one zstd-compressed tar of the base index files plus a JSON manifest
+PACKAGE_FORMAT = "tar+zstd"
+PACKAGED_INDEX_FILES = ("index", "documents", "vectors.npy", "vector_ids.npy")
+
+# Ranged index downloads: slice size and number of slices fetched at once
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("GCS_DOWNLOAD_CHUNK_MB", "32")) * 2**20
+DOWNLOAD_WORKERS = int(os.getenv("GCS_DOWNLOAD_WORKERS", "8"))
+
+# Concurrent PDF downloads of download_pdfs_to_temp
+PDF_DOWNLOAD_WORKERS = int(os.getenv("GCS_PDF_DOWNLOAD_WORKERS", "8"))
+# Persistent per-model PDF directories (unset: a new temporary directory per download)
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "")
+
+
+def _file_md5(path: str) -> str:
+    """Base64 md5 of a local file, in the format of GCS `blob.md5_hash`."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(8 * 2**20), b""):
+            md5.update(block)
+    return base64.b64encode(md5.digest()).decode()
+
+
 class GCPStorageAdapter:
     """Adapter for using Google Cloud Storage with the RAG pipeline."""
     
-    def __init__(self, bucket_name: str, credentials_path: Optional[str] = None):
+    def __init__(
+        self, 
+        bucket_name: str, 
+        credentials_path: Optional[str] = None, 
+        client: Optional[storage.Client] = None,
+        download_chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+        download_workers: int = DOWNLOAD_WORKERS
+    ):
         """
         Initialize GCP Storage adapter.
         
         Args:
             bucket_name: GCS bucket name
             credentials_path: Path to service account credentials (optional)
+            client: Storage client to use, e.g. one pointed at a local fake GCS
+                server (defaults to storage.Client(), which also honours STORAGE_EMULATOR_HOST)
+            download_chunk_size: Byte range fetched per request by index downloads
+            download_workers: Number of byte ranges fetched concurrently
         """
         if credentials_path:
             os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
             
         self.bucket_name = bucket_name
-        self.client = storage.Client()
+        self.client = client or storage.Client()
         self.bucket = self.client.bucket(bucket_name)
+        self.download_chunk_size = download_chunk_size
+        self.download_workers = download_workers
+    
+    def _write_index_package(self, index_path: str, package_path: str, compression_level: int) -> Dict[str, Any]:
+        """
+        Write the base files of a local index into one zstd-compressed tar.
+        
+        Args:
+            index_path: Local index path (without extension)
+            package_path: Output `.pack.zst` file
+            compression_level: zstd compression level
+            
+        Returns:
+            Manifest describing the package (format, per-file size and sha256,
+            plus dimension, count and embedding model from the `.meta` file)
+        """
+        files = {}
+        compressor = zstandard.ZstdCompressor(level=compression_level, threads=-1)
+        with open(package_path, 'wb') as raw, compressor.stream_writer(raw) as compressed, \
+                tarfile.open(fileobj=compressed, mode='w|') as tar:
+            for extension in PACKAGED_INDEX_FILES:
+                path = f"{index_path}.{extension}"
+                if not os.path.exists(path):
+                    continue
+                sha256 = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(8 * 2**20), b""):
+                        sha256.update(block)
+                files[extension] = {'size': os.path.getsize(path), 'sha256': sha256.hexdigest()}
+                tar.add(path, arcname=extension)
+        
+        metadata = {}
+        if os.path.exists(f"{index_path}.meta"):
+            with open(f"{index_path}.meta", 'r') as f:
+                metadata = json.load(f)
+        
+        return {
+            'format': PACKAGE_FORMAT,
+            'version': 1,
+            'dimension': metadata.get('dimension'),
+            'count': metadata.get('count'),
+            'embedding_model': metadata.get('embedding_model'),
+            'index_type': metadata.get('index_type'),
+            'package_size': os.path.getsize(package_path),
+            'files': files
+        }
     
-    def upload_index(self, index_path: str, gcs_path: str) -> bool:
+    def upload_index(
+        self, 
+        index_path: str, 
+        gcs_path: str, 
+        packaged: Optional[bool] = None, 
+        compression_level: int = 3
+    ) -> bool:
         """
         Upload index files to GCS.
         
         Args:
             index_path: Local index path (without extension)
             gcs_path: GCS path (without extension)
+            packaged: Upload the base files as one zstd-compressed `.pack.zst`
+                with a `.manifest.json` instead of one blob per file (defaults to
+                the GCS_PACKAGED_INDEXES environment variable)
+            compression_level: zstd compression level of packaged uploads
             
         Returns:
             Success status
         """
         try:
-            # Upload index file
-            index_blob = self.bucket.blob(f"{gcs_path}.index")
-            index_blob.upload_from_filename(f"{index_path}.index")
+            if packaged is None:
+                packaged = os.getenv("GCS_PACKAGED_INDEXES", "false").lower() == "true"
+            
+            if packaged:
+                if not ZSTD_AVAILABLE:
+                    raise ImportError("zstandard is required for packaged index uploads (pip install zstandard)")
+                
+                with tempfile.TemporaryDirectory(prefix="index_package_") as temp_dir:
+                    package_path = os.path.join(temp_dir, "index.pack.zst")
+                    manifest = self._write_index_package(index_path, package_path, compression_level)
+                    self.bucket.blob(f"{gcs_path}.pack.zst").upload_from_filename(package_path)
+                
+                # The manifest marks the package as complete, so it goes after the package
+                manifest_blob = self.bucket.blob(f"{gcs_path}.manifest.json")
+                manifest_blob.upload_from_string(json.dumps(manifest), content_type="application/json")
+                
+                # Per-file blobs of an earlier upload would now be stale
+                for extension in PACKAGED_INDEX_FILES:
+                    stale_blob = self.bucket.get_blob(f"{gcs_path}.{extension}")
+                    if stale_blob is not None:
+                        stale_blob.delete()
+                
+                raw_size = sum(entry['size'] for entry in manifest['files'].values())
+                logger.info(
+                    f"Packaged index for upload: {raw_size / 2**20:.1f} MB -> "
+                    f"{manifest['package_size'] / 2**20:.1f} MB (zstd level {compression_level})"
+                )
+            else:
+                # Upload index file
+                index_blob = self.bucket.blob(f"{gcs_path}.index")
+                index_blob.upload_from_filename(f"{index_path}.index")
+                
+                # Upload documents file
+                docs_blob = self.bucket.blob(f"{gcs_path}.documents")
+                docs_blob.upload_from_filename(f"{index_path}.documents")
+                
+                # Upload the raw re-ranking vectors of a compressed index if present
+                for extension in ("vectors.npy", "vector_ids.npy"):
+                    if os.path.exists(f"{index_path}.{extension}"):
+                        vectors_blob = self.bucket.blob(f"{gcs_path}.{extension}")
+                        vectors_blob.upload_from_filename(f"{index_path}.{extension}")
+                
+                # A package of an earlier upload would now be stale (downloads prefer packages)
+                for extension in ("manifest.json", "pack.zst"):
+                    stale_blob = self.bucket.get_blob(f"{gcs_path}.{extension}")
+                    if stale_blob is not None:
+                        stale_blob.delete()
             
-            # Upload documents file
-            docs_blob = self.bucket.blob(f"{gcs_path}.documents")
-            docs_blob.upload_from_filename(f"{index_path}.documents")
+            # Upload index metadata (dimension, embedding model) if present
+            if os.path.exists(f"{index_path}.meta"):
+                meta_blob = self.bucket.blob(f"{gcs_path}.meta")
+                meta_blob.upload_from_filename(f"{index_path}.meta")
             
             logger.info(f"Uploaded index to gs://{self.bucket_name}/{gcs_path}")
             return True
@@ -52,13 +200,65 @@ class GCPStorageAdapter:
             logger.error(f"Error uploading index to GCS: {e}")
             return False
         
-    def upload_index_to_model_id(self, model_id: str, index_path: str) -> bool:
+    def upload_index_delta(self, index_path: str, gcs_path: str, delta_name: str) -> bool:
+        """
+        Upload one delta segment and the updated index metadata to GCS.
+        
+        Only the delta files and the small `.meta` file are transferred; the
+        base `.index` and `.documents` files already in the bucket are reused.
+        
+        Args:
+            index_path: Local index path (without extension)
+            gcs_path: GCS path (without extension)
+            delta_name: Delta segment name (e.g. "delta1")
+            
+        Returns:
+            Success status
+        """
+        try:
+            for extension in ("npz", "documents"):
+                delta_blob = self.bucket.blob(f"{gcs_path}.{delta_name}.{extension}")
+                delta_blob.upload_from_filename(f"{index_path}.{delta_name}.{extension}")
+            
+            # Upload the metadata last so readers never see a delta that is not there yet
+            meta_blob = self.bucket.blob(f"{gcs_path}.meta")
+            meta_blob.upload_from_filename(f"{index_path}.meta")
+            
+            logger.info(f"Uploaded {delta_name} to gs://{self.bucket_name}/{gcs_path}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error uploading index delta to GCS: {e}")
+            return False
+    
+    def upload_index_delta_to_model_id(self, model_id: str, index_path: str, delta_name: str) -> bool:
+        """
+        Upload one delta segment to GCS using model ID.
+
+        Args:
+            model_id: Model ID to construct GCS path
+            index_path: Local index path (without extension)
+            delta_name: Delta segment name (e.g. "delta1")
+        
+        Returns:
+            Success status
+        """
+        try:
+            gcs_path = f"indexes/{model_id}/{model_id}"
+            return self.upload_index_delta(index_path, gcs_path, delta_name)
+
+        except Exception as e:
+            logger.error(f"Error uploading index delta to GCS using model ID {model_id}: {e}")
+            return False
+        
+    def upload_index_to_model_id(self, model_id: str, index_path: str, packaged: Optional[bool] = None) -> bool:
         """
         Uploads the index files to GCS using model ID.
 
         Args:
             model_id: Model ID to construct GCS path
             index_path: Local index path (without extension)
+            packaged: Upload as one zstd-compressed package (defaults to GCS_PACKAGED_INDEXES)
         
         Returns:
             Success status
@@ -66,16 +266,175 @@ class GCPStorageAdapter:
         try:
             # Note: Every index will have name as <model_id>.index and <model_id>.documents
             gcs_path = f"indexes/{model_id}/{model_id}"
-            return self.upload_index(index_path, gcs_path)
+            return self.upload_index(index_path, gcs_path, packaged=packaged)
 
         except Exception as e:
             logger.error(f"Error uploading index to GCS using model ID {model_id}: {e}")
             return False
     
+    def _download_blob_parts(self, files: Dict[str, str]) -> Dict[str, str]:
+        """
+        Download several blobs as concurrent byte ranges into `.part` files.
+        
+        Every blob is split into `download_chunk_size` ranges and all ranges of
+        all blobs share one thread pool. Finished ranges are recorded in a
+        `.part.json` file next to the partial file, so a failed download resumes
+        with the missing ranges only, as long as the blob generation is unchanged.
+        
+        Args:
+            files: Mapping of blob name to local file path
+            
+        Returns:
+            Mapping of blob name to its completed `.part` file
+            
+        Raises:
+            FileNotFoundError: If a blob does not exist
+            ValueError: If a downloaded file does not match the blob checksum
+        """
+        start_time = time.perf_counter()
+        plans = {}
+        tasks = []
+        
+        for blob_name, local_file in files.items():
+            blob = self.bucket.get_blob(blob_name)
+            if blob is None:
+                raise FileNotFoundError(f"gs://{self.bucket_name}/{blob_name} does not exist")
+            
+            part_path = f"{local_file}.part"
+            progress_path = f"{local_file}.part.json"
+            num_chunks = -(-blob.size // self.download_chunk_size)
+            progress = {'generation': blob.generation, 'size': blob.size, 'chunk_size': self.download_chunk_size, 'done': []}
+            
+            # Resume only if the partial file belongs to the same object version and slicing
+            if os.path.exists(part_path) and os.path.exists(progress_path):
+                with open(progress_path, 'r') as f:
+                    saved = json.load(f)
+                if all(saved.get(key) == progress[key] for key in ('generation', 'size', 'chunk_size')):
+                    progress['done'] = saved.get('done', [])
+            if not progress['done']:
+                os.makedirs(os.path.dirname(part_path) or ".", exist_ok=True)
+                with open(part_path, 'wb') as f:
+                    f.truncate(blob.size)
+            
+            plans[blob_name] = {
+                'blob': blob, 'part_path': part_path, 'progress_path': progress_path,
+                'progress': progress, 'lock': threading.Lock()
+            }
+            done = set(progress['done'])
+            tasks.extend((blob_name, chunk) for chunk in range(num_chunks) if chunk not in done)
+        
+        def _fetch(task: Tuple[str, int]) -> int:
+            blob_name, chunk = task
+            plan = plans[blob_name]
+            start = chunk * self.download_chunk_size
+            end = min(start + self.download_chunk_size, plan['blob'].size)
+            data = plan['blob'].download_as_bytes(
+                start=start, 
+                end=end - 1, 
+                if_generation_match=plan['blob'].generation,
+                checksum=None
+            )
+            if len(data) != end - start:
+                raise IOError(f"Short read of {blob_name} bytes {start}-{end}: got {len(data)}")
+            with open(plan['part_path'], 'r+b') as f:
+                f.seek(start)
+                f.write(data)
+            
+            with plan['lock']:
+                plan['progress']['done'].append(chunk)
+                with open(f"{plan['progress_path']}.tmp", 'w') as f:
+                    json.dump(plan['progress'], f)
+                os.replace(f"{plan['progress_path']}.tmp", plan['progress_path'])
+            return len(data)
+        
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            downloaded_bytes = sum(executor.map(_fetch, tasks))
+        
+        for blob_name, plan in plans.items():
+            expected_md5 = plan['blob'].md5_hash
+            if expected_md5 and _file_md5(plan['part_path']) != expected_md5:
+                os.remove(plan['part_path'])
+                os.remove(plan['progress_path'])
+                raise ValueError(f"Checksum mismatch for gs://{self.bucket_name}/{blob_name}")
+        
+        elapsed = time.perf_counter() - start_time
+        total_bytes = sum(plan['blob'].size for plan in plans.values())
+        logger.info(
+            f"Downloaded {downloaded_bytes / 2**20:.1f} MB of {total_bytes / 2**20:.1f} MB in {len(tasks)} ranges "
+            f"({len(plans)} files) in {elapsed:.2f}s ({downloaded_bytes / 2**20 / max(elapsed, 1e-9):.1f} MB/s)"
+        )
+        return {blob_name: plan['part_path'] for blob_name, plan in plans.items()}
+    
+    def _download_index_package(self, gcs_path: str, local_path: str, manifest: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Stream a packaged index from GCS and unpack it into `.part` files.
+        
+        The package is decompressed and untarred while it downloads, so
+        neither the compressed nor the decompressed package is held in memory
+        or written to disk as a whole.
+        
+        Args:
+            gcs_path: GCS path (without extension)
+            local_path: Local index path (without extension)
+            manifest: Parsed `.manifest.json` of the package
+            
+        Returns:
+            Mapping of the equivalent per-file blob name to its completed `.part` file
+            
+        Raises:
+            ImportError: If zstandard is not installed
+            ValueError: If the package does not match its manifest
+        """
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard is required to download packaged indexes (pip install zstandard)")
+        if manifest.get('format') != PACKAGE_FORMAT:
+            raise ValueError(f"Unsupported index package format: {manifest.get('format')}")
+        
+        start_time = time.perf_counter()
+        part_files = {}
+        package_blob = self.bucket.blob(f"{gcs_path}.pack.zst")
+        with package_blob.open('rb', chunk_size=self.download_chunk_size) as remote, \
+                zstandard.ZstdDecompressor().stream_reader(remote) as decompressed, \
+                tarfile.open(fileobj=decompressed, mode='r|') as tar:
+            for member in tar:
+                expected = manifest['files'].get(member.name)
+                if expected is None or not member.isfile():
+                    raise ValueError(f"Unexpected entry {member.name} in index package")
+                
+                part_path = f"{local_path}.{member.name}.part"
+                sha256 = hashlib.sha256()
+                source = tar.extractfile(member)
+                with open(part_path, 'wb') as f:
+                    for block in iter(lambda: source.read(2**20), b""):
+                        sha256.update(block)
+                        f.write(block)
+                if sha256.hexdigest() != expected['sha256']:
+                    raise ValueError(f"Checksum mismatch for {member.name} in index package")
+                part_files[f"{gcs_path}.{member.name}"] = part_path
+        
+        missing = set(manifest['files']) - {blob_name[len(gcs_path) + 1:] for blob_name in part_files}
+        if missing:
+            raise ValueError(f"Index package is missing {sorted(missing)}")
+        
+        elapsed = time.perf_counter() - start_time
+        raw_size = sum(entry['size'] for entry in manifest['files'].values())
+        logger.info(
+            f"Downloaded {manifest['package_size'] / 2**20:.1f} MB package ({raw_size / 2**20:.1f} MB unpacked) "
+            f"in {elapsed:.2f}s ({manifest['package_size'] / 2**20 / max(elapsed, 1e-9):.1f} MB/s)"
+        )
+        return part_files
+    
     def download_index(self, gcs_path: str, local_path: str) -> bool:
         """
         Download index files from GCS.
         
+        The `.index` and `.documents` blobs (plus any delta segments and raw
+        re-ranking vectors) are fetched as concurrent byte ranges and resumed
+        after a failure; packaged indexes (`.manifest.json` + `.pack.zst`) are
+        streamed and decompressed instead. Each file is renamed into place only
+        after every file is complete, with the `.index` file last, so a partial
+        download is never mistaken for a usable index.
+        
         Args:
             gcs_path: GCS path (without extension)
             local_path: Local index path (without extension)
@@ -87,13 +446,50 @@ class GCPStorageAdapter:
             # Create directory if it doesn't exist
             os.makedirs(os.path.dirname(local_path), exist_ok=True)
             
-            # Download index file
-            index_blob = self.bucket.blob(f"{gcs_path}.index")
-            index_blob.download_to_filename(f"{local_path}.index")
+            files = {}
+            
+            # Index metadata lists the delta segments (older indexes were uploaded without it)
+            meta_blob = self.bucket.get_blob(f"{gcs_path}.meta")
+            if meta_blob is not None:
+                meta_blob.download_to_filename(f"{local_path}.meta.part")
+                files[f"{gcs_path}.meta"] = f"{local_path}.meta"
+                
+                with open(f"{local_path}.meta.part", 'r') as f:
+                    metadata = json.load(f)
+                for delta_name in metadata.get('deltas', []):
+                    for extension in ("npz", "documents"):
+                        files[f"{gcs_path}.{delta_name}.{extension}"] = f"{local_path}.{delta_name}.{extension}"
+                
+                # Raw re-ranking vectors of a compressed index
+                if metadata.get('rerank_vectors'):
+                    for extension in ("vectors.npy", "vector_ids.npy"):
+                        files[f"{gcs_path}.{extension}"] = f"{local_path}.{extension}"
             
-            # Download documents file
-            docs_blob = self.bucket.blob(f"{gcs_path}.documents")
-            docs_blob.download_to_filename(f"{local_path}.documents")
+            files[f"{gcs_path}.documents"] = f"{local_path}.documents"
+            files[f"{gcs_path}.index"] = f"{local_path}.index"
+            
+            # Base files of a packaged index come from the package
+            part_files = {}
+            manifest_blob = self.bucket.get_blob(f"{gcs_path}.manifest.json")
+            if manifest_blob is not None:
+                manifest = json.loads(manifest_blob.download_as_bytes())
+                part_files = self._download_index_package(gcs_path, local_path, manifest)
+                for blob_name, part_path in part_files.items():
+                    files.setdefault(blob_name, part_path[:-len(".part")])
+                files[f"{gcs_path}.index"] = files.pop(f"{gcs_path}.index")  # keep `.index` last
+            
+            part_files.update(self._download_blob_parts({
+                blob_name: local_file for blob_name, local_file in files.items() 
+                if not blob_name.endswith(".meta") and blob_name not in part_files
+            }))
+            if meta_blob is not None:
+                part_files[f"{gcs_path}.meta"] = f"{local_path}.meta.part"
+            
+            # Rename into place, `.index` last (dict order)
+            for blob_name, local_file in files.items():
+                os.replace(part_files[blob_name], local_file)
+                if os.path.exists(f"{local_file}.part.json"):
+                    os.remove(f"{local_file}.part.json")
             
             logger.info(f"Downloaded index from gs://{self.bucket_name}/{gcs_path}")
             return True
@@ -102,6 +498,39 @@ class GCPStorageAdapter:
             logger.error(f"Error downloading index from GCS: {e}")
             return False
         
+    def get_index_signature(self, gcs_path: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the generation and md5 of every file of an index in GCS.
+        
+        Any upload (full or delta, which rewrites `.meta`) changes the signature,
+        so comparing it with the one recorded at download time detects stale copies.
+        
+        Args:
+            gcs_path: GCS path (without extension)
+            
+        Returns:
+            Mapping of blob name to {'generation', 'md5'} (empty if the index does not exist)
+            
+        Raises:
+            Exception: If GCS cannot be reached (so callers do not mistake it for a missing index)
+        """
+        return {
+            blob.name: {'generation': blob.generation, 'md5': blob.md5_hash}
+            for blob in self.bucket.list_blobs(prefix=f"{gcs_path}.")
+        }
+    
+    def get_index_signature_using_model_id(self, model_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the generation and md5 of every file of an index in GCS using model ID.
+        
+        Args:
+            model_id: Model ID to construct GCS path
+            
+        Returns:
+            Mapping of blob name to {'generation', 'md5'}
+        """
+        return self.get_index_signature(f"indexes/{model_id}/{model_id}")
+    
     def download_index_using_model_id(self, model_id: str, local_path: str) -> bool:
         """
         Download index files from GCS using model ID.
@@ -121,6 +550,11 @@ class GCPStorageAdapter:
             logger.error(f"Error downloading index from GCS using model ID {model_id}: {e}")
             return False
     
+    def _list_pdf_blobs(self, prefix: str) -> List[storage.Blob]:
+        """List the PDF blobs (with their size and md5) under a GCS prefix."""
+        logger.info(f"Listing blobs in GCS bucket {self.bucket_name} with prefix {prefix}")
+        return [blob for blob in self.bucket.list_blobs(prefix=prefix) if blob.name.endswith('.pdf')]
+    
     def list_pdfs(self, prefix: str) -> List[str]:
         """
         List PDF files in a GCS directory.
@@ -132,35 +566,194 @@ class GCPStorageAdapter:
             List of PDF blob names
         """
         try:
-            logger.info(f"Listing blobs in GCS bucket {self.bucket_name} with prefix {prefix}")
-            blobs = self.bucket.list_blobs(prefix=prefix)
-            return [blob.name for blob in blobs if blob.name.endswith('.pdf')]
+            return [blob.name for blob in self._list_pdf_blobs(prefix)]
             
         except Exception as e:
             logger.error(f"Error listing PDFs in GCS: {e}")
             return []
     
-    def download_pdfs_to_temp(self, gcs_prefix: str) -> str:
+    @staticmethod
+    def _pdf_local_paths(local_dir: str, blob_names: List[str]) -> Dict[str, str]:
+        """
+        Flat local paths of PDF blobs, with file name collisions disambiguated.
+        
+        Each PDF keeps its file name directly in local_dir. When PDFs in
+        different sub-prefixes share a file name, the first blob name (in
+        sorted order) keeps it and the others get a short hash of their blob
+        name appended, so the mapping is stable across downloads.
+        
+        Args:
+            local_dir: Local directory to download into
+            blob_names: Full blob names
+            
+        Returns:
+            Dictionary of blob name -> local file path inside local_dir
+        """
+        local_paths = {}
+        used_names = set()
+        for blob_name in sorted(blob_names):
+            file_name = os.path.basename(blob_name)
+            if file_name in used_names:
+                stem, extension = os.path.splitext(file_name)
+                file_name = f"{stem}-{hashlib.sha1(blob_name.encode()).hexdigest()[:8]}{extension}"
+            used_names.add(file_name)
+            local_paths[blob_name] = os.path.join(local_dir, file_name)
+        return local_paths
+    
+    def _download_pdf(self, blob: storage.Blob, local_path: str, max_retries: int, base_wait: float) -> bool:
+        """
+        Download one PDF unless an identical local copy exists, retrying with exponential backoff.
+        
+        Args:
+            blob: PDF blob (as listed, with its md5)
+            local_path: Local file path
+            max_retries: Maximum number of download attempts
+            base_wait: Base wait time for exponential backoff
+            
+        Returns:
+            True if the file was downloaded, False if the local copy was unchanged
+        """
+        if blob.md5_hash and os.path.exists(local_path) and _file_md5(local_path) == blob.md5_hash:
+            return False
+        
+        for attempt in range(max_retries):
+            try:
+                # Via a temp name so a failed attempt never leaves a truncated PDF behind
+                blob.download_to_filename(f"{local_path}.part")
+                os.replace(f"{local_path}.part", local_path)
+                return True
+            except Exception as e:
+                logger.warning(f"Download of {blob.name} failed (attempt {attempt + 1}/{max_retries}): {e}")
+                if attempt == max_retries - 1:
+                    raise
+                time.sleep(base_wait * (2 ** attempt))
+    
+    def iter_pdf_downloads(
+        self, 
+        gcs_prefix: str, 
+        local_dir: str, 
+        max_workers: int = PDF_DOWNLOAD_WORKERS, 
+        max_retries: int = 3, 
+        base_wait: float = 1.0,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Iterator[str]:
+        """
+        Download the PDFs under a GCS prefix concurrently, yielding each as soon as it is ready.
+        
+        Callers can start processing the first PDFs while the rest are still
+        downloading. PDFs whose local copy already has the blob's md5 are not
+        downloaded again; PDFs that still fail after max_retries are logged, reported
+        to progress_callback as "failed" and not yielded. All PDFs are stored flat
+        in local_dir (see _pdf_local_paths for same-named PDFs).
+        
+        Args:
+            gcs_prefix: GCS prefix/directory
+            local_dir: Local directory to download into
+            max_workers: Number of concurrent downloads
+            max_retries: Maximum number of attempts per PDF
+            base_wait: Base wait time for exponential backoff
+            progress_callback: Called after every PDF with a dict of name, path,
+                status ("downloaded", "unchanged" or "failed"), completed and total
+            
+        Returns:
+            Iterator of local PDF paths, in completion order
+        """
+        blobs = self._list_pdf_blobs(gcs_prefix)
+        os.makedirs(local_dir, exist_ok=True)
+        local_paths = self._pdf_local_paths(local_dir, [blob.name for blob in blobs])
+        
+        counts = {'downloaded': 0, 'unchanged': 0, 'failed': 0}
+        start_time = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {
+                executor.submit(self._download_pdf, blob, local_paths[blob.name], max_retries, base_wait): blob
+                for blob in blobs
+            }
+            for completed, future in enumerate(as_completed(futures), start=1):
+                blob = futures[future]
+                local_path = local_paths[blob.name]
+                try:
+                    status = "downloaded" if future.result() else "unchanged"
+                except Exception as e:
+                    logger.error(f"Error downloading PDF {blob.name}: {e}")
+                    status = "failed"
+                counts[status] += 1
+                
+                if progress_callback:
+                    progress_callback({
+                        'name': blob.name, 
+                        'path': local_path, 
+                        'status': status, 
+                        'completed': completed, 
+                        'total': len(blobs)
+                    })
+                if status != "failed":
+                    yield local_path
+        finally:
+            # Stop queued downloads if the caller stops iterating early
+            executor.shutdown(wait=True, cancel_futures=True)
+        
+        logger.info(
+            f"PDFs under {gcs_prefix}: {counts['downloaded']} downloaded, {counts['unchanged']} unchanged, "
+            f"{counts['failed']} failed in {time.perf_counter() - start_time:.2f}s"
+        )
+    
+    def download_pdfs_to_temp(
+        self, 
+        gcs_prefix: str, 
+        local_dir: Optional[str] = None, 
+        max_workers: int = PDF_DOWNLOAD_WORKERS,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> str:
         """
         Download PDFs from GCS to a temporary directory.
         
+        The PDFs are stored flat in the directory. If any PDF fails to
+        download, the whole call fails, so callers never index a partial dataset.
+        
         Args:
             gcs_prefix: GCS prefix/directory
+            local_dir: Cache directory to reuse instead of a new temporary one;
+                PDFs that are unchanged there are not downloaded again and PDFs
+                no longer under the prefix are removed
+            max_workers: Number of concurrent downloads
+            progress_callback: Called after every PDF (see iter_pdf_downloads)
             
         Returns:
-            Path to temporary directory
+            Path to the directory, or "" if any PDF failed
         """
         try:
             # Create temporary directory
-            temp_dir = tempfile.mkdtemp(prefix="rag_pdfs_")
+            temp_dir = local_dir or tempfile.mkdtemp(prefix="rag_pdfs_")
+            
+            failed = []
+            def _track(status: Dict[str, Any]) -> None:
+                if status['status'] == "failed":
+                    failed.append(status['name'])
+                if progress_callback:
+                    progress_callback(status)
             
             # List and download PDFs
-            pdf_blobs = self.list_pdfs(gcs_prefix)
-            for blob_name in pdf_blobs:
-                local_path = os.path.join(temp_dir, os.path.basename(blob_name))
-                self.bucket.blob(blob_name).download_to_filename(local_path)
+            pdf_paths = list(self.iter_pdf_downloads(
+                gcs_prefix, 
+                temp_dir, 
+                max_workers=max_workers, 
+                progress_callback=_track
+            ))
+            if failed:
+                logger.error(f"Failed to download {len(failed)} PDFs from {gcs_prefix}: {failed}")
+                return ""
             
-            logger.info(f"Downloaded {len(pdf_blobs)} PDFs to {temp_dir}")
+            # A reused directory may still hold PDFs deleted from the bucket since
+            if local_dir:
+                current = set(pdf_paths)
+                for name in os.listdir(temp_dir):
+                    path = os.path.join(temp_dir, name)
+                    if name.endswith('.pdf') and path not in current:
+                        os.remove(path)
+            
+            logger.info(f"Downloaded {len(pdf_paths)} PDFs to {temp_dir}")
             return temp_dir
             
         except Exception as e:
@@ -171,18 +764,22 @@ class GCPStorageAdapter:
         """
         Download PDFs from GCS to a temporary directory using model ID.
         
+        With PDF_CACHE_DIR set, the PDFs are kept in a per-model directory
+        below it and only new or changed PDFs are downloaded on later calls.
+        
         Args:
             model_id: Model ID to construct GCS prefix
             
         Returns:
-            Path to temporary directory
+            Path to temporary (or cache) directory
         """
         try:
             logger.info(f"Downloading PDFs for model ID {model_id}")
 
 
             gcs_prefix = f"localDatasets/{model_id}/"
-            local_folder = self.download_pdfs_to_temp(gcs_prefix)
+            local_dir = os.path.join(PDF_CACHE_DIR, model_id) if PDF_CACHE_DIR else None
+            local_folder = self.download_pdfs_to_temp(gcs_prefix, local_dir=local_dir)
 
             if not local_folder:
                 logger.error(f"Failed to download PDFs for model ID {model_id}")
@@ -0,0 +1,644 @@
+# index_cache.py
+import glob
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: downloads are only coalesced within one process
+    fcntl = None
+
+from .faiss_db_manager import FaissVectorDB
+from .gcp_storage_adapter import GCPStorageAdapter
+
+logger = logging.getLogger(__name__)
+
+# Local directory holding the downloaded tenant indexes
+INDEX_CACHE_DIR = "gcp-indexes"
+
+# Suffix of the per-index cache state file (GCS signature and last access time)
+_STATE_SUFFIX = ".cache.json"
+
+
+def _prefetch_window_seconds() -> float:
+    """Access log window used for prefetching and kept by compaction (INDEX_PREFETCH_WINDOW_DAYS, 7 days)."""
+    return float(os.getenv("INDEX_PREFETCH_WINDOW_DAYS", "7")) * 86400
+
+
+class IndexCacheManager:
+    """
+    Local cache of the per-model_id FAISS indexes stored in GCS.
+
+    Every downloaded index is recorded with the generation/md5 of its GCS
+    files and its last access time (in `<model_id>.cache.json`, so the state
+    survives restarts and is shared by worker processes). Indexes whose GCS
+    files changed are re-downloaded into a staging directory and swapped in
+    under the model's exclusive lock, and the least recently used indexes are
+    evicted when the cache grows beyond its disk quota.
+
+    Downloads are single-flight per model_id: concurrent requests for an
+    uncached index (threads of one worker, or several workers sharing the
+    cache directory) wait for one download instead of racing on the same files.
+
+    Loaded indexes are kept in an in-memory registry (bounded, LRU) and every
+    access is appended to an access log, from which the most used indexes are
+    prefetched and loaded at startup. The log is compacted to per-day counts
+    within the prefetch window at startup and on every background refresh.
+    """
+
+    def __init__(
+        self,
+        storage: GCPStorageAdapter,
+        cache_dir: str = INDEX_CACHE_DIR,
+        max_disk_bytes: Optional[int] = None,
+        refresh_interval: Optional[float] = None,
+        max_loaded: Optional[int] = None,
+        access_log_path: Optional[str] = None
+    ):
+        """
+        Initialize the index cache.
+
+        Args:
+            storage: GCS adapter the indexes are downloaded with
+            cache_dir: Local cache directory
+            max_disk_bytes: Disk quota for cached indexes (defaults to the
+                INDEX_CACHE_MAX_GB environment variable; 0 or unset = unlimited)
+            refresh_interval: Seconds between background freshness checks (defaults
+                to the INDEX_CACHE_REFRESH_SECONDS environment variable; 0 = disabled)
+            max_loaded: Loaded indexes kept in memory (defaults to the
+                INDEX_CACHE_MAX_LOADED environment variable, 8)
+            access_log_path: JSON-lines log of index accesses (defaults to
+                INDEX_ACCESS_LOG, or `.access_log.jsonl` in the cache directory)
+        """
+        if max_disk_bytes is None:
+            max_disk_bytes = int(float(os.getenv("INDEX_CACHE_MAX_GB", "0")) * 2**30)
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv("INDEX_CACHE_REFRESH_SECONDS", "0"))
+
+        self.storage = storage
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes or None
+        self.refresh_interval = refresh_interval
+        self.max_loaded = max_loaded or int(os.getenv("INDEX_CACHE_MAX_LOADED", "8"))
+        self.access_log_path = access_log_path or os.getenv("INDEX_ACCESS_LOG") or os.path.join(cache_dir, ".access_log.jsonl")
+
+        self._entries = {}  # model_id -> cache state, mirrored in <model_id>.cache.json
+        self._lock = threading.RLock()
+        self._model_locks = {}  # model_id -> thread lock of its single-flight section
+        self._stop_event = threading.Event()
+        self._refresh_thread = None
+        self._loaded = OrderedDict()  # model_id -> (index file identity, loaded FaissVectorDB), least recent first
+        self.prefetch_complete = threading.Event()
+
+    def index_path(self, model_id: str) -> str:
+        """Local index path (without extension) of a model_id."""
+        return os.path.join(self.cache_dir, model_id)
+
+    def _state_path(self, model_id: str) -> str:
+        return f"{self.index_path(model_id)}{_STATE_SUFFIX}"
+
+    def _entry(self, model_id: str) -> Dict[str, Any]:
+        """
+        Get the cache state of a model_id from the registry or its state file.
+
+        Args:
+            model_id: Model ID of the index
+
+        Returns:
+            Cache state (empty for indexes downloaded before the cache existed)
+        """
+        with self._lock:
+            if model_id not in self._entries:
+                state = {}
+                if os.path.exists(self._state_path(model_id)):
+                    try:
+                        with open(self._state_path(model_id), 'r') as f:
+                            state = json.load(f)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Ignoring unreadable cache state of {model_id}: {e}")
+                self._entries[model_id] = state
+            return self._entries[model_id]
+
+    def _save_entry(self, model_id: str, **updates: Any) -> None:
+        """Update the cache state of a model_id and write it to its state file."""
+        with self._lock:
+            entry = self._entry(model_id)
+            entry.update(updates)
+            tmp_path = f"{self._state_path(model_id)}.{os.getpid()}.tmp"  # workers may write concurrently
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._state_path(model_id))
+
+    @contextmanager
+    def _model_lock(self, model_id: str, blocking: bool = True, shared: bool = False) -> Iterator[bool]:
+        """
+        Hold the lock of one model_id's files.
+        
+        Exclusive holders (download, refresh, eviction) are serialized by a
+        per-model thread lock within this process and an exclusive flock on
+        `.locks/<model_id>.lock` across the worker processes sharing the cache
+        directory. Shared holders (loads) only take a shared flock, so loads run
+        concurrently with each other but never see a half-swapped set of files.
+
+        Args:
+            model_id: Model ID of the index
+            blocking: Wait for the lock (otherwise give up if it is held)
+            shared: Take the lock for reading the files instead of changing them
+
+        Returns:
+            Context manager yielding whether the lock was acquired
+        """
+        # Without flock, shared holders fall back to the exclusive thread lock
+        use_thread_lock = not shared or fcntl is None
+        if use_thread_lock:
+            with self._lock:
+                thread_lock = self._model_locks.setdefault(model_id, threading.Lock())
+            if not thread_lock.acquire(blocking):
+                yield False
+                return
+
+        try:
+            if fcntl is None:
+                yield True
+                return
+
+            lock_dir = os.path.join(self.cache_dir, ".locks")
+            os.makedirs(lock_dir, exist_ok=True)
+            # A separate open file per holder, so flock also orders the threads of this process
+            with open(os.path.join(lock_dir, f"{model_id}.lock"), 'a') as lock_file:
+                operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+                try:
+                    fcntl.flock(lock_file, operation if blocking else operation | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            if use_thread_lock:
+                thread_lock.release()
+
+    def _index_files(self, model_id: str) -> List[str]:
+        """Local files of a cached index, excluding its cache state."""
+        prefix = f"{glob.escape(self.index_path(model_id))}."
+        return [
+            path for path in glob.glob(f"{prefix}*")
+            if _STATE_SUFFIX not in path
+        ]
+
+    def cached_model_ids(self) -> List[str]:
+        """
+        List the model_ids with an index in the cache directory.
+
+        Returns:
+            Model IDs, in no particular order
+        """
+        return [
+            os.path.basename(path)[:-len(".index")]
+            for path in glob.glob(os.path.join(glob.escape(self.cache_dir), "*.index"))
+        ]
+
+    def get_index_path(self, model_id: str, record_access: bool = True) -> str:
+        """
+        Make sure the index of a model_id is cached locally and mark it as used.
+
+        Args:
+            model_id: Model ID of the index
+            record_access: Append the access to the access log (off for prefetching)
+
+        Returns:
+            Local index path (without extension) to pass to FaissVectorDB.load
+
+        Raises:
+            ValueError: If the index is not cached and cannot be downloaded
+        """
+        index_path = self.index_path(model_id)
+
+        if not os.path.exists(f"{index_path}.index"):
+            with self._model_lock(model_id):
+                if os.path.exists(f"{index_path}.index"):
+                    # Downloaded by a concurrent request while we waited; pick up the state it recorded
+                    with self._lock:
+                        self._entries.pop(model_id, None)
+                    logger.info(f"Index {model_id} was downloaded by a concurrent request")
+                else:
+                    signature = self._download(model_id, index_path)
+                    if signature is None:
+                        raise ValueError(f"Failed to download index: {model_id}")
+                    self._save_entry(model_id, signature=signature, checked_at=time.time())
+
+        self._save_entry(model_id, last_access=time.time())
+        if record_access:
+            self._record_access(model_id)
+        self.evict(protect=[model_id])
+        return index_path
+
+    def load_vector_db(self, model_id: str, record_access: bool = True) -> FaissVectorDB:
+        """
+        Get the loaded index of a model_id, downloading and loading it if needed.
+
+        Loaded indexes are shared and must only be searched, not modified. An
+        index is reloaded when its `.index` file was replaced by a refresh. The
+        files are read under the model's shared lock, so a load never mixes the
+        files of two versions and eviction skips indexes that are being loaded.
+        A cached copy that fails to load is re-downloaded once if its GCS
+        files changed since.
+
+        Args:
+            model_id: Model ID of the index
+            record_access: Append the access to the access log (off for prefetching)
+
+        Returns:
+            Loaded vector database
+
+        Raises:
+            ValueError: If the index cannot be downloaded or loaded
+        """
+        for attempt in range(2):
+            index_path = self.get_index_path(model_id, record_access=record_access and attempt == 0)
+
+            # Hold the shared lock while reading the files, so a refresh or eviction can't swap or delete them mid-load
+            with self._model_lock(model_id, shared=True):
+                if not os.path.exists(f"{index_path}.index"):
+                    logger.warning(f"Index {model_id} was evicted before it could be loaded")
+                    continue
+                stat = os.stat(f"{index_path}.index")
+                identity = (stat.st_ino, stat.st_mtime_ns)
+
+                with self._lock:
+                    loaded = self._loaded.get(model_id)
+                    if loaded is not None and loaded[0] == identity:
+                        self._loaded.move_to_end(model_id)
+                        return loaded[1]
+
+                vector_db = FaissVectorDB()
+                if vector_db.load(index_path):
+                    break
+
+            # A copy that no longer loads (e.g. legacy documents converted in GCS since) is replaced by the new version
+            if attempt == 0 and self._is_stale_quietly(model_id) and self.refresh(model_id):
+                logger.warning(f"Cached index {model_id} failed to load; re-downloaded the changed GCS version")
+                continue
+            raise ValueError(f"Failed to load index: {model_id}")
+        else:
+            raise ValueError(f"Failed to load index: {model_id}")
+
+        with self._lock:
+            self._loaded[model_id] = (identity, vector_db)
+            self._loaded.move_to_end(model_id)
+            while len(self._loaded) > self.max_loaded:
+                unloaded_id, _ = self._loaded.popitem(last=False)
+                logger.info(f"Unloaded index {unloaded_id} (keeping {self.max_loaded} loaded)")
+        return vector_db
+
+    def loaded_model_ids(self) -> List[str]:
+        """Model IDs currently loaded in memory, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
+
+    def _record_access(self, model_id: str) -> None:
+        """Append one access to the access log (single small appends are atomic across workers)."""
+        try:
+            with open(self.access_log_path, 'a') as f:
+                f.write(json.dumps({'model_id': model_id, 'ts': time.time()}) + "\n")
+        except OSError as e:
+            logger.debug(f"Could not record index access: {e}")
+
+    def _read_access_log(self) -> Iterator[Dict[str, Any]]:
+        """
+        Read the access log.
+
+        Returns:
+            Iterator of {'model_id', 'ts', 'count'} entries; single accesses have count 1,
+            compacted entries count all accesses of one model_id on one day (ts = latest)
+        """
+        if not os.path.exists(self.access_log_path):
+            return
+        with open(self.access_log_path, 'r') as f:
+            for line in f:
+                try:
+                    access = json.loads(line)
+                except ValueError:
+                    continue  # partially written line
+                if access.get('model_id'):
+                    yield {'model_id': access['model_id'], 'ts': access.get('ts', 0), 'count': access.get('count', 1)}
+
+    def compact_access_log(self, window_seconds: Optional[float] = None) -> int:
+        """
+        Rewrite the access log as per-day counts, dropping entries outside the prefetch window.
+
+        Keeps the log to at most one line per model_id and day. Accesses
+        appended by other workers while the log is rewritten are lost, which
+        only slightly undercounts them.
+
+        Args:
+            window_seconds: Entries older than this are dropped (defaults to INDEX_PREFETCH_WINDOW_DAYS)
+
+        Returns:
+            Number of lines in the compacted log
+        """
+        if window_seconds is None:
+            window_seconds = _prefetch_window_seconds()
+
+        since = time.time() - window_seconds
+        days = {}  # (day, model_id) -> compacted entry
+        for access in self._read_access_log():
+            if access['ts'] < since:
+                continue
+            key = (int(access['ts'] // 86400), access['model_id'])
+            entry = days.setdefault(key, {'model_id': access['model_id'], 'ts': 0, 'count': 0})
+            entry['ts'] = max(entry['ts'], access['ts'])
+            entry['count'] += access['count']
+
+        tmp_path = f"{self.access_log_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                for entry in days.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.access_log_path)
+        except OSError as e:
+            logger.warning(f"Could not compact the index access log: {e}")
+        return len(days)
+
+    def top_model_ids(self, top_n: int, window_seconds: float) -> List[str]:
+        """
+        Find the most frequently accessed model_ids in the access log.
+
+        Args:
+            top_n: Number of model_ids to return
+            window_seconds: Only count accesses this recent
+
+        Returns:
+            Model IDs, most accessed first
+        """
+        since = time.time() - window_seconds
+        counts = Counter()
+        for access in self._read_access_log():
+            if access['ts'] >= since:
+                counts[access['model_id']] += access['count']
+        return [model_id for model_id, _ in counts.most_common(top_n)]
+
+    def prefetch(self, top_n: Optional[int] = None, window_seconds: Optional[float] = None) -> List[str]:
+        """
+        Download and load the most used indexes before traffic arrives.
+
+        `prefetch_complete` is set when this returns, also on failure, so
+        readiness never blocks on an index that cannot be fetched.
+
+        Args:
+            top_n: Number of indexes (defaults to INDEX_PREFETCH_TOP_N; 0 = none)
+            window_seconds: Access log window (defaults to INDEX_PREFETCH_WINDOW_DAYS, 7 days)
+
+        Returns:
+            Model IDs that were loaded
+        """
+        if top_n is None:
+            top_n = int(os.getenv("INDEX_PREFETCH_TOP_N", "0"))
+        if window_seconds is None:
+            window_seconds = _prefetch_window_seconds()
+
+        start_time = time.perf_counter()
+        prefetched = []
+        try:
+            # Startup is the natural point to shrink the log before reading it
+            self.compact_access_log(window_seconds)
+            # Never prefetch more indexes than the registry keeps loaded
+            for model_id in self.top_model_ids(min(top_n, self.max_loaded), window_seconds):
+                try:
+                    self.load_vector_db(model_id, record_access=False)
+                    prefetched.append(model_id)
+                except Exception as e:
+                    logger.error(f"Error prefetching index {model_id}: {e}")
+        finally:
+            self.prefetch_complete.set()
+
+        if top_n:
+            logger.info(f"Prefetched {len(prefetched)} indexes in {time.perf_counter() - start_time:.2f}s: {prefetched}")
+        return prefetched
+
+    def _download(self, model_id: str, local_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Download an index together with the signature of its GCS files.
+
+        Args:
+            model_id: Model ID of the index
+            local_path: Local index path (without extension)
+
+        Returns:
+            GCS signature of the downloaded index, or None on failure
+        """
+        try:
+            # Read the signature first: if the index changes during the download, the next check sees it as stale
+            signature = self.storage.get_index_signature_using_model_id(model_id)
+            if not self.storage.download_index_using_model_id(model_id, local_path):
+                return None
+            return signature
+
+        except Exception as e:
+            logger.error(f"Error downloading index {model_id} into the cache: {e}")
+            return None
+
+    def is_stale(self, model_id: str) -> bool:
+        """
+        Check whether the GCS files of a cached index changed since it was downloaded.
+
+        Indexes downloaded before the cache recorded signatures count as stale.
+
+        Args:
+            model_id: Model ID of the index
+
+        Returns:
+            True if the index should be refreshed
+        """
+        signature = self.storage.get_index_signature_using_model_id(model_id)
+        self._save_entry(model_id, checked_at=time.time())
+        if not signature:
+            logger.warning(f"Index {model_id} no longer exists in GCS; keeping the cached copy")
+            return False
+        return signature != self._entry(model_id).get('signature')
+
+    def _is_stale_quietly(self, model_id: str) -> bool:
+        """is_stale, treating an unreachable GCS as not stale."""
+        try:
+            return self.is_stale(model_id)
+        except Exception as e:
+            logger.error(f"Error checking cached index {model_id} for changes: {e}")
+            return False
+
+    def refresh(self, model_id: str) -> bool:
+        """
+        Re-download an index and swap it in place.
+
+        The new files are downloaded into a staging directory first, then
+        renamed over the cached files with the `.index` file last while holding
+        the model's exclusive lock, so no load sees a mix of old and new files.
+        Processes that already loaded (or memory-mapped) the old files keep
+        reading them.
+
+        Args:
+            model_id: Model ID of the index
+
+        Returns:
+            Success status
+        """
+        with self._model_lock(model_id):
+            return self._refresh(model_id)
+
+    def _refresh(self, model_id: str) -> bool:
+        """Re-download an index and swap it in place (caller holds its single-flight lock)."""
+        staging_dir = os.path.join(self.cache_dir, ".staging", model_id)
+        try:
+            staging_path = os.path.join(staging_dir, model_id)
+            signature = self._download(model_id, staging_path)
+            if signature is None:
+                return False
+
+            new_files = sorted(glob.glob(f"{glob.escape(staging_path)}.*"), key=lambda path: path.endswith(".index"))
+            new_names = {os.path.basename(path) for path in new_files}
+
+            with self._lock:
+                for path in new_files:
+                    os.replace(path, os.path.join(self.cache_dir, os.path.basename(path)))
+
+                # Drop files of the old version that are not part of the new one (e.g. old delta segments)
+                for path in self._index_files(model_id):
+                    if os.path.basename(path) not in new_names:
+                        os.remove(path)
+
+                self._save_entry(model_id, signature=signature, checked_at=time.time())
+
+            logger.info(f"Refreshed cached index {model_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error refreshing cached index {model_id}: {e}")
+            return False
+
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def refresh_stale(self) -> List[str]:
+        """
+        Check every cached index and refresh the ones that changed in GCS.
+
+        Returns:
+            Model IDs that were refreshed
+        """
+        refreshed = []
+        for model_id in self.cached_model_ids():
+            try:
+                with self._model_lock(model_id, blocking=False) as acquired:
+                    if not acquired:
+                        continue  # being downloaded or refreshed by another request/worker
+
+                    # Re-read the state: another worker may have refreshed it already
+                    with self._lock:
+                        self._entries.pop(model_id, None)
+                    if self.is_stale(model_id) and self._refresh(model_id):
+                        refreshed.append(model_id)
+            except Exception as e:
+                logger.error(f"Error checking freshness of cached index {model_id}: {e}")
+        return refreshed
+
+    def start_background_refresh(self, interval: Optional[float] = None) -> bool:
+        """
+        Start a daemon thread that periodically refreshes stale indexes.
+
+        Args:
+            interval: Seconds between checks (defaults to refresh_interval)
+
+        Returns:
+            True if the thread was started
+        """
+        interval = interval or self.refresh_interval
+        if not interval or (self._refresh_thread is not None and self._refresh_thread.is_alive()):
+            return False
+
+        def _run():
+            while not self._stop_event.wait(interval):
+                refreshed = self.refresh_stale()
+                if refreshed:
+                    logger.info(f"Background refresh updated {len(refreshed)} indexes: {refreshed}")
+                self.compact_access_log()
+
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(target=_run, name="index-cache-refresh", daemon=True)
+        self._refresh_thread.start()
+        logger.info(f"Refreshing cached indexes every {interval:g}s")
+        return True
+
+    def stop_background_refresh(self) -> None:
+        """Stop the background refresh thread."""
+        self._stop_event.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def disk_usage(self, model_id: str) -> int:
+        """
+        Get the disk space used by a cached index.
+
+        Args:
+            model_id: Model ID of the index
+
+        Returns:
+            Size in bytes of all its files
+        """
+        total = 0
+        for path in self._index_files(model_id):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass  # removed concurrently
+        return total
+
+    def evict(self, protect: Iterable[str] = ()) -> List[str]:
+        """
+        Remove least recently used indexes until the cache fits its disk quota.
+
+        Args:
+            protect: Model IDs that must not be evicted (e.g. the one being served)
+
+        Returns:
+            Model IDs that were evicted
+        """
+        if self.max_disk_bytes is None:
+            return []
+
+        with self._lock:
+            protected = set(protect)
+            sizes = {model_id: self.disk_usage(model_id) for model_id in self.cached_model_ids()}
+            total = sum(sizes.values())
+            if total <= self.max_disk_bytes:
+                return []
+
+            def _last_access(model_id: str) -> float:
+                last_access = self._entry(model_id).get('last_access')
+                return last_access if last_access is not None else os.path.getmtime(f"{self.index_path(model_id)}.index")
+
+            evicted = []
+            for model_id in sorted(set(sizes) - protected, key=_last_access):
+                if total <= self.max_disk_bytes:
+                    break
+                with self._model_lock(model_id, blocking=False) as acquired:
+                    if not acquired:
+                        continue  # being downloaded, refreshed or loaded right now
+                    for path in self._index_files(model_id) + [self._state_path(model_id)]:
+                        if os.path.exists(path):
+                            os.remove(path)
+                self._entries.pop(model_id, None)
+                self._loaded.pop(model_id, None)
+                total -= sizes[model_id]
+                evicted.append(model_id)
+
+            logger.info(f"Evicted {len(evicted)} cached indexes {evicted}; cache now {total / 2**30:.2f} GB")
+            return evicted
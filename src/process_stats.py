@@ -0,0 +1,36 @@
+# process_stats.py
+import logging
+import os
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# /proc/self/status fields reported by get_memory_usage (values are in kB)
+_MEMORY_FIELDS = {
+    "VmRSS": "rss_kb",
+    "RssAnon": "rss_anon_kb",  # private heap: grows per worker with read_index
+    "RssFile": "rss_file_kb",  # file-backed pages: shared between workers for mmapped indexes
+    "RssShmem": "rss_shmem_kb",
+}
+
+
+def get_memory_usage() -> Dict[str, int]:
+    """
+    Get the resident memory of the current process.
+
+    Returns:
+        Dictionary with pid and rss/rss_anon/rss_file/rss_shmem in kB
+        (only pid on platforms without /proc)
+    """
+    usage = {'pid': os.getpid()}
+
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in _MEMORY_FIELDS:
+                    usage[_MEMORY_FIELDS[field]] = int(value.split()[0])
+    except OSError as e:
+        logger.debug(f"Memory usage not available: {e}")
+
+    return usage
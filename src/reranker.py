@@ -0,0 +1,125 @@
+# reranker.py
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np # type: ignore
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Standard BM25 parameters and the RRF constant from the original paper
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase alphanumeric terms.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of terms
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def bm25_scores(query: str, texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    """
+    Score candidate texts against a query with BM25.
+
+    Document frequencies are computed over the candidates themselves, so no
+    corpus statistics are needed. Only the query terms are counted, into one
+    (candidates x query terms) matrix that is scored in a single NumPy pass.
+
+    Args:
+        query: Query text
+        texts: Candidate texts
+        k1: Term frequency saturation
+        b: Document length normalization
+
+    Returns:
+        float64 array of len(texts) BM25 scores
+    """
+    query_terms = list(dict.fromkeys(tokenize(query)))
+    num_texts = len(texts)
+    if not query_terms or not num_texts:
+        return np.zeros(num_texts)
+
+    term_frequencies = np.empty((num_texts, len(query_terms)))
+    doc_lengths = np.empty(num_texts)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text or "")
+        doc_lengths[row] = len(tokens)
+        # list.count runs in C; far cheaper than a Python loop over every token
+        term_frequencies[row] = [tokens.count(term) for term in query_terms]
+
+    document_frequencies = np.count_nonzero(term_frequencies, axis=0)
+    idf = np.log1p((num_texts - document_frequencies + 0.5) / (document_frequencies + 0.5))
+    length_norm = k1 * (1 - b + b * doc_lengths / max(doc_lengths.mean(), 1.0))
+    return (term_frequencies * (k1 + 1) / (term_frequencies + length_norm[:, None])) @ idf
+
+
+def reciprocal_rank_fusion(
+    score_lists: Sequence[np.ndarray],
+    weights: Optional[Sequence[float]] = None,
+    k: int = RRF_K
+) -> np.ndarray:
+    """
+    Fuse several scorings of the same candidates by reciprocal rank.
+
+    Each candidate gets sum(weight / (k + rank)) over the scorings, with
+    rank 1 for the highest score. Only ranks are used, so scores on
+    different scales (cosine, BM25) can be combined directly.
+
+    Args:
+        score_lists: Arrays of scores for the same n candidates (higher is better)
+        weights: Optional weight per scoring (defaults to 1.0 each)
+        k: RRF constant; larger values flatten the contribution of top ranks
+
+    Returns:
+        float64 array of n fused scores
+    """
+    scores = np.atleast_2d(np.asarray(score_lists, dtype=np.float64))
+    weights = np.ones(len(scores)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    # Rank of every candidate within each scoring (stable, so ties keep retrieval order)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, scores.shape[1] + 1)[None, :], axis=1)
+    return (weights[:, None] / (k + ranks)).sum(axis=0)
+
+
+def rerank_results(
+    query: str,
+    results: List[Dict[str, Any]],
+    scores: Sequence[float],
+    top_k: int,
+    lexical_weight: float = 1.0,
+    text_key: str = 'text'
+) -> Tuple[List[Dict[str, Any]], List[float]]:
+    """
+    Re-rank vector search candidates by fusing vector and BM25 scores.
+
+    Args:
+        query: Query text
+        results: Candidate documents from a vector search, best first
+        scores: Vector similarity score per candidate
+        top_k: Number of results to keep
+        lexical_weight: Weight of the BM25 ranking relative to the vector ranking
+        text_key: Document field holding the text
+
+    Returns:
+        Tuple of (top_k documents, fused RRF scores), highest first
+    """
+    if len(results) <= 1:
+        return results[:top_k], list(scores[:top_k])
+
+    lexical_scores = bm25_scores(query, [doc.get(text_key, "") for doc in results])
+    fused = reciprocal_rank_fusion([np.asarray(scores), lexical_scores], weights=[1.0, lexical_weight])
+    top = np.argsort(-fused, kind="stable")[:top_k]
+    logger.debug(f"Re-ranked {len(results)} candidates to {len(top)}")
+    return [results[i] for i in top], fused[top].tolist()
@@ -3,27 +3,43 @@ import os
 import time
 import logging
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import backoff
 from dotenv import load_dotenv
 import openai  # Updated import
+from .embedding_utils import (
+    EMBEDDING_DTYPE,
+    resolve_embedding_dimension,
+    embedding_request_kwargs,
+    decode_embedding_into,
+    decode_embeddings_into,
+    deduplicate_texts,
+    dedup_stats,
+    zero_embedding,
+)
 
 logger = logging.getLogger(__name__)
 
 class VectorizationModule:
     """Module for embedding document content and queries using OpenAI embeddings."""
     
-    def __init__(self, openai_api_key: str = None, model_name: str = "text-embedding-ada-002"):
+    def __init__(self, openai_api_key: str = None, model_name: str = "text-embedding-ada-002",
+                 dimensions: Optional[int] = None, encoding_format: str = "base64"):
         """
         Initialize the vectorization module.
         
         Args:
             openai_api_key: OpenAI API key (will use environment variable if not provided)
             model_name: Embedding model name
+            dimensions: Reduced output dimension for models that support it (e.g. 256/512)
+            encoding_format: Embedding transport format, "base64" (compact) or "float" (JSON lists)
         """
         load_dotenv()
         self.model_name = model_name
-        self.embedding_dim = 1536  # text-embedding-ada-002 returns 1536-dimensional embeddings
+        self.dimensions = dimensions
+        self.encoding_format = encoding_format
+        self.embedding_dim = resolve_embedding_dimension(model_name, dimensions)
+        self.last_dedup_stats = dedup_stats(0, 0)
         
         
 
@@ -34,7 +50,7 @@ class VectorizationModule:
         
         # Initialize OpenAI client
         self.client = openai.OpenAI(api_key=self.api_key)
-        logger.info(f"Using OpenAI embedding model: {self.model_name}")
+        logger.info(f"Using OpenAI embedding model: {self.model_name} ({self.embedding_dim} dimensions)")
     
     @backoff.on_exception(
         backoff.expo,
@@ -50,14 +66,17 @@ class VectorizationModule:
             text: Text to embed
             
         Returns:
-            Embedding as numpy array
+            Embedding as float32 numpy array
         """
         response = self.client.embeddings.create(
             input=[text],
-            model=self.model_name
+            model=self.model_name,
+            encoding_format=self.encoding_format,
+            **embedding_request_kwargs(self.model_name, self.dimensions)
         )
-        embedding = response.data[0].embedding
-        return np.array(embedding)
+        embedding = np.empty(self.embedding_dim, dtype=EMBEDDING_DTYPE)
+        decode_embedding_into(response.data[0].embedding, embedding)
+        return embedding
     
     @backoff.on_exception(
         backoff.expo,
@@ -65,37 +84,52 @@ class VectorizationModule:
         max_tries=5,
         factor=2
     )
-    def get_batch_embeddings(self, texts: List[str], batch_size: int = 10) -> List[np.ndarray]:
+    def get_batch_embedding_matrix(self, texts: List[str], batch_size: int = 10) -> np.ndarray:
         """
-        Get embeddings for a batch of texts.
+        Get embeddings for a batch of texts as one contiguous matrix.
         
         Args:
             texts: List of text strings to embed
             batch_size: Number of texts to process per API call
             
         Returns:
-            List of numpy arrays, each representing a text embedding
+            float32 array of shape (len(texts), embedding_dim)
         """
-        all_embeddings = []
+        # Decode every batch straight into one preallocated float32 matrix
+        all_embeddings = np.empty((len(texts), self.embedding_dim), dtype=EMBEDDING_DTYPE)
         for i in range(0, len(texts), batch_size):
             batch = texts[i:i + batch_size]
             
             response = self.client.embeddings.create(
                 input=batch,
-                model=self.model_name
+                model=self.model_name,
+                encoding_format=self.encoding_format,
+                **embedding_request_kwargs(self.model_name, self.dimensions)
             )
             
-            batch_embeddings = [np.array(item.embedding) for item in response.data]
-            all_embeddings.extend(batch_embeddings)
+            decode_embeddings_into(response.data, all_embeddings[i:i + len(batch)])
             
             if i + batch_size < len(texts):
                 time.sleep(0.5)  # Brief pause between batches to respect rate limits
         
         return all_embeddings
     
+    def get_batch_embeddings(self, texts: List[str], batch_size: int = 10) -> List[np.ndarray]:
+        """
+        Get embeddings for a batch of texts.
+        
+        Args:
+            texts: List of text strings to embed
+            batch_size: Number of texts to process per API call
+            
+        Returns:
+            List of float32 numpy arrays (row views of one contiguous matrix)
+        """
+        return list(self.get_batch_embedding_matrix(texts, batch_size))
+    
     def embed_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Embed a list of document chunks.
+        Embed a list of document chunks, embedding identical texts only once.
         
         Args:
             chunks: List of document chunk dictionaries
@@ -108,12 +142,17 @@ class VectorizationModule:
             return []
         
         try:
-            embeddings = self.get_batch_embeddings(texts)
+            unique_texts, inverse = deduplicate_texts(texts)
+            unique_embeddings = self.get_batch_embedding_matrix(unique_texts)
+            self.last_dedup_stats = dedup_stats(len(texts), len(unique_texts))
             
-            for i, embedding in enumerate(embeddings):
-                chunks[i]['embedding'] = embedding
+            for i, position in enumerate(inverse):
+                chunks[i]['embedding'] = unique_embeddings[position]
             
-            logger.info(f"Successfully embedded {len(chunks)} document chunks")
+            logger.info(
+                f"Successfully embedded {len(chunks)} document chunks "
+                f"({len(unique_texts)} unique, dedup ratio {self.last_dedup_stats['dedup_ratio']:.1%})"
+            )
             return chunks
         
         except Exception as e:
@@ -128,10 +167,26 @@ class VectorizationModule:
             query: Query string to embed
             
         Returns:
-            Query embedding as numpy array
+            Query embedding as float32 numpy array
         """
         try:
             return self.get_embedding(query)
         except Exception as e:
             logger.error(f"Error embedding query: {e}")
-            return np.zeros(self.embedding_dim)
\ No newline at end of file
+            return zero_embedding(self.embedding_dim)
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed several query strings in one API call.
+        
+        Args:
+            queries: Query strings to embed
+            
+        Returns:
+            float32 matrix of shape (len(queries), embedding_dim); zero rows on failure
+        """
+        try:
+            return self.get_batch_embedding_matrix(queries, batch_size=max(len(queries), 1))
+        except Exception as e:
+            logger.error(f"Error embedding queries: {e}")
+            return np.zeros((len(queries), self.embedding_dim), dtype=EMBEDDING_DTYPE)
@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# Tests import the application modules the same way the entry points do (src.*, main, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,78 @@
+# fake_gcs.py
+import base64
+import hashlib
+import io
+import itertools
+
+
+class FakeBlob:
+    """In-memory stand-in for google.cloud.storage.Blob."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.data = b""
+        self.generation = None
+        self.md5_hash = None
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def _set(self, data):
+        self.data = data
+        self.generation = next(self.bucket.generations)
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode()
+        self.bucket.blobs[self.name] = self
+
+    def upload_from_string(self, data, content_type=None):
+        self._set(data.encode() if isinstance(data, str) else data)
+
+    def upload_from_filename(self, path):
+        with open(path, 'rb') as f:
+            self._set(f.read())
+
+    def download_as_bytes(self, start=None, end=None, if_generation_match=None, checksum=None):
+        self.bucket.range_requests.append((self.name, start, end))
+        if self.bucket.fail_ranges and start in self.bucket.fail_ranges.get(self.name, ()):
+            raise IOError(f"Injected failure for {self.name} at {start}")
+        if if_generation_match is not None and if_generation_match != self.generation:
+            raise ValueError("Generation mismatch")
+        return self.data[start or 0:None if end is None else end + 1]
+
+    def download_to_filename(self, path):
+        if None in self.bucket.fail_ranges.get(self.name, ()):
+            raise IOError(f"Injected failure for {self.name}")
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+    def open(self, mode='rb', chunk_size=None):
+        return io.BytesIO(self.data)
+
+    def delete(self):
+        self.bucket.blobs.pop(self.name, None)
+
+
+class FakeBucket:
+    def __init__(self):
+        self.blobs = {}
+        self.generations = itertools.count(1)
+        self.range_requests = []
+        self.fail_ranges = {}  # blob name -> range starts that raise (None: whole downloads)
+
+    def blob(self, name):
+        return self.blobs.get(name) or FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return self.blobs.get(name)
+
+    def list_blobs(self, prefix=""):
+        return [blob for name, blob in sorted(self.blobs.items()) if name.startswith(prefix)]
+
+
+class FakeClient:
+    def __init__(self):
+        self.fake_bucket = FakeBucket()
+
+    def bucket(self, name):
+        return self.fake_bucket
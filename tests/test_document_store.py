@@ -0,0 +1,114 @@
+# test_document_store.py
+import pickle
+import sys
+
+import numpy as np
+import pytest
+
+import index_tools
+from fake_gcs import FakeClient
+from src.document_store import DOCUMENT_STORE_MAGIC, DocumentStore, convert_documents_file, is_legacy_documents_file
+from src.faiss_db_manager import FaissVectorDB
+from src.gcp_storage_adapter import GCPStorageAdapter
+
+
+def test_columnar_round_trip(tmp_path):
+    documents = [
+        {'text': "first", 'year': 2020, 'score': 0.5, 'open': True, 'tags': ["a", "b"]},
+        {'text': "second", 'year': 2021, 'open': False},
+        {'text': "third", 'score': 1.5, 'tags': {"nested": 1}},
+    ]
+    path = str(tmp_path / "index.documents")
+    DocumentStore(documents, doc_ids=[3, 7, 11]).save(path)
+
+    store = DocumentStore.load(path)
+    assert list(store) == documents
+    assert store.ids.tolist() == [3, 7, 11]
+    assert store.rows_of(np.array([7, 8])).tolist() == [1, -1]
+    assert dict(store.metadata_items(0)) == {'year': 2020, 'score': 0.5, 'open': True, 'tags': ["a", "b"]}
+
+
+def test_numpy_metadata_is_typed(tmp_path):
+    documents = [
+        {'text': "a", 'year': np.int64(2020), 'score': np.float32(0.25), 'open': np.bool_(True), 'mixed': np.int32(1)},
+        {'text': "b", 'year': np.int64(2021), 'score': np.float32(0.5), 'open': np.bool_(False), 'mixed': "x"},
+    ]
+    path = str(tmp_path / "index.documents")
+    DocumentStore(documents).save(path)
+
+    loaded = list(DocumentStore.load(path))
+    assert loaded == [
+        {'text': "a", 'year': 2020, 'score': 0.25, 'open': True, 'mixed': 1},
+        {'text': "b", 'year': 2021, 'score': 0.5, 'open': False, 'mixed': "x"},
+    ]
+    assert type(loaded[0]['year']) is int
+
+
+def test_unstorable_metadata_names_key(tmp_path):
+    with pytest.raises(ValueError, match="'blob'"):
+        DocumentStore([{'text': "a", 'blob': object()}]).save(str(tmp_path / "index.documents"))
+
+
+def test_legacy_pickle_requires_opt_in(tmp_path):
+    path = tmp_path / "index.documents"
+    path.write_bytes(pickle.dumps([{'text': "a"}]))
+
+    with pytest.raises(ValueError, match="legacy"):
+        DocumentStore.load(str(path))
+    assert list(DocumentStore.load(str(path), allow_legacy_pickle=True)) == [{'text': "a"}]
+
+
+def test_convert_documents_with_numpy_metadata(tmp_path, monkeypatch):
+    documents = [
+        {'text': f"doc {i}", 'page': np.int64(i), 'similarity': np.float32(i / 4), 'shape': np.arange(2)}
+        for i in range(4)
+    ]
+    (tmp_path / "index.documents").write_bytes(pickle.dumps(documents))
+
+    monkeypatch.setattr(sys, "argv", ["index_tools.py", "convert-documents", str(tmp_path / "index")])
+    assert index_tools.main() == 0
+
+    path = str(tmp_path / "index.documents")
+    with open(path, 'rb') as f:
+        assert f.read(len(DOCUMENT_STORE_MAGIC)) == DOCUMENT_STORE_MAGIC
+    assert list(DocumentStore.load(path)) == [
+        {'text': f"doc {i}", 'page': i, 'similarity': i / 4, 'shape': [0, 1]} for i in range(4)
+    ]
+
+
+def test_convert_documents_reports_failure(tmp_path):
+    (tmp_path / "index.documents").write_bytes(pickle.dumps([{'text': "a", 'blob': object()}]))
+    assert convert_documents_file(str(tmp_path / "index.documents")) is False
+
+
+def save_legacy_index(path, num_documents=5):
+    vector_db = FaissVectorDB(dimension=4)
+    vector_db.add_documents([
+        {'text': f"doc {i}", 'embedding': np.full(4, i, dtype=np.float32)} for i in range(num_documents)
+    ])
+    assert vector_db.save(path)
+    with open(f"{path}.documents", 'wb') as f:
+        pickle.dump([{'text': f"doc {i}"} for i in range(num_documents)], f)
+
+
+@pytest.mark.parametrize("packaged", [False, True])
+def test_convert_gcs_documents(tmp_path, packaged):
+    storage = GCPStorageAdapter("bucket", client=FakeClient())
+    save_legacy_index(str(tmp_path / "m"))
+    assert storage.upload_index(str(tmp_path / "m"), "indexes/m/m", packaged=packaged)
+    signature = storage.get_index_signature_using_model_id("m")
+
+    assert index_tools.convert_gcs_documents(storage, "m")
+    converted_signature = storage.get_index_signature_using_model_id("m")
+    assert converted_signature != signature
+    assert (storage.bucket.get_blob("indexes/m/m.manifest.json") is not None) == packaged
+
+    assert storage.download_index_using_model_id("m", str(tmp_path / "download" / "m"))
+    assert not is_legacy_documents_file(str(tmp_path / "download" / "m.documents"))
+    vector_db = FaissVectorDB()
+    assert vector_db.load(str(tmp_path / "download" / "m"))
+    assert [doc['text'] for doc in vector_db.documents] == [f"doc {i}" for i in range(5)]
+
+    # Converted indexes are not uploaded again
+    assert index_tools.convert_gcs_documents(storage, "m")
+    assert storage.get_index_signature_using_model_id("m") == converted_signature
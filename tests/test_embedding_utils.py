@@ -0,0 +1,28 @@
+# test_embedding_utils.py
+import base64
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.embedding_utils import decode_embeddings_into
+
+
+def api_item(vector, encoding):
+    if encoding == "base64":
+        return SimpleNamespace(embedding=base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode())
+    return SimpleNamespace(embedding=[float(value) for value in vector])
+
+
+@pytest.mark.parametrize("encoding", ["base64", "float"])
+def test_decode_embeddings_into_rows(encoding):
+    vectors = np.random.default_rng(0).random((3, 5), dtype=np.float32)
+    out = np.zeros((4, 5), dtype=np.float32)
+    decode_embeddings_into([api_item(vector, encoding) for vector in vectors], out[1:])
+    assert np.array_equal(out[1:], vectors)
+    assert not out[0].any()
+
+
+def test_decode_embeddings_into_rejects_row_mismatch():
+    with pytest.raises(ValueError):
+        decode_embeddings_into([api_item(np.zeros(5), "base64")], np.zeros((2, 5), dtype=np.float32))
@@ -0,0 +1,126 @@
+# test_endpoint_prediction_integration.py
+import time
+
+import pytest
+import requests
+
+from src.endpoint_prediction_integration import (
+    CircuitBreaker,
+    EndpointPredictionAPIIntegration,
+    PREDICTION_CONNECT_TIMEOUT_SECONDS,
+    PREDICTION_READ_TIMEOUT_SECONDS,
+    get_endpoint_api_metrics,
+)
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_seconds=60)
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    # A success resets the consecutive count
+    assert breaker.allow_request()
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert not breaker.allow_request()
+    metrics = breaker.get_metrics()
+    assert metrics['failures'] == 5 and metrics['successes'] == 1
+    assert metrics['short_circuited'] == 2 and metrics['opened'] == 1
+
+
+def test_half_open_trial_closes_or_reopens_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_seconds=60)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    # After the recovery period exactly one trial request is let through
+    breaker.opened_at -= 60
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    breaker.opened_at -= 60
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+    metrics = breaker.get_metrics()
+    assert (metrics['opened'], metrics['half_opened'], metrics['closed']) == (2, 2, 1)
+    assert metrics['open_for_seconds'] == 0.0
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.text = str(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.timeouts = []
+
+    def post(self, url, json=None, timeout=None):
+        self.timeouts.append(timeout)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def integration(monkeypatch, request):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    # A URL per test, so every test gets its own shared circuit breaker
+    return EndpointPredictionAPIIntegration(api_base_url=f"http://predictor-{request.node.name}")
+
+
+def test_prediction_timeouts_are_capped_by_deadline(integration):
+    integration.session = FakeSession([FakeResponse(200, {'ok': True})] * 2)
+    assert integration.get_endpoint_prediction("query") == {'ok': True}
+    assert integration.session.timeouts[0] == (PREDICTION_CONNECT_TIMEOUT_SECONDS, PREDICTION_READ_TIMEOUT_SECONDS)
+
+    assert integration.get_endpoint_prediction("query", deadline=time.monotonic() + 1) == {'ok': True}
+    connect_timeout, read_timeout = integration.session.timeouts[1]
+    assert 0 < connect_timeout <= 1 and 0 < read_timeout <= 1
+
+
+def test_expired_deadline_skips_request(integration):
+    integration.session = FakeSession([])
+    assert integration.get_endpoint_prediction("query", deadline=time.monotonic() - 1) == {}
+    assert integration.session.timeouts == []
+    assert integration.circuit_breaker.get_metrics()['failures'] == 0
+
+
+def test_server_errors_open_circuit_but_client_errors_do_not(integration):
+    breaker = integration.circuit_breaker
+    integration.session = FakeSession(
+        [FakeResponse(400)] * 10 + [FakeResponse(503)] * 2 + [requests.ConnectionError("down")] * 3
+    )
+    for _ in range(10):
+        assert integration.get_endpoint_prediction("query") == {}
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.get_metrics()['successes'] == 10
+
+    for _ in range(5):
+        integration.get_endpoint_prediction("query")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open circuit: nothing is sent
+    integration.get_endpoint_prediction("query")
+    assert len(integration.session.timeouts) == 15
+    metrics = get_endpoint_api_metrics()[integration.api_base_url]
+    assert metrics['failures'] == 5 and metrics['short_circuited'] == 1
@@ -0,0 +1,95 @@
+# test_endpoint_query_classifier.py
+import numpy as np
+import pytest
+
+from src.endpoint_query_classifier import (
+    EndpointQueryClassifier,
+    normalize_query,
+    rule_probability,
+    save_linear_model,
+    train_linear_model,
+)
+from src.endpoint_prediction_integration import EndpointPredictionAPIIntegration
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("When should the primary endpoint be measured in a psoriasis trial?", 0.9),
+    ("How long is follow-up in CAR-T lymphoma trials?", 0.9),
+    ("What are the eligibility criteria for NCT01234567?", 0.05),
+    ("Summarize pembrolizumab trials in NSCLC", 0.1),
+    ("What efficacy outcomes were reported for semaglutide?", 0.5),
+    ("Follow-up schedule for adverse events in gene therapy", 0.5),
+])
+def test_rule_probability(query, expected):
+    assert rule_probability(normalize_query(query)) == expected
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(200, 8))
+    weights, bias = train_linear_model(embeddings, embeddings[:, 0] > 0)
+    path = str(tmp_path / "endpoint_model.npz")
+    save_linear_model(path, weights, bias, "text-embedding-3-small")
+    return path
+
+
+def test_model_decides_ambiguous_queries(model_path):
+    classifier = EndpointQueryClassifier(model_path)
+    calls = []
+
+    def embed(query):
+        calls.append(query)
+        return np.eye(8)[0] * 3
+
+    probability, source = classifier.classify("what outcomes?", embed, "text-embedding-3-small")
+    assert source == "model" and probability > 0.9
+    # Decisive rules never need the embedding
+    assert classifier.classify("eligibility criteria?", embed, "text-embedding-3-small")[1] == "rules"
+    assert calls == ["what outcomes?"]
+
+
+def test_model_of_other_embedding_model_is_skipped(model_path):
+    classifier = EndpointQueryClassifier(model_path)
+    embed = lambda query: pytest.fail("embedding must not be computed")
+    assert classifier.classify("what outcomes?", embed, "text-embedding-ada-002") == (0.5, "rules")
+    assert classifier.classify("what outcomes?", embed, None) == (0.5, "rules")
+
+
+def test_decision_cache_is_lru_bounded():
+    classifier = EndpointQueryClassifier(None, cache_size=2)
+    classifier.remember("Outcomes  A", True)
+    classifier.remember("outcomes b", False)
+    assert classifier.classify("outcomes a") == (1.0, "cache")
+    classifier.remember("outcomes c", True)
+    assert classifier.classify("outcomes b") == (0.5, "rules")  # evicted
+    assert classifier.classify("outcomes a")[1] == "cache"
+
+
+def test_llm_is_only_asked_for_low_confidence_queries(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    integration = EndpointPredictionAPIIntegration(
+        api_base_url="http://classifier-test", classifier=EndpointQueryClassifier(None)
+    )
+    llm_calls = []
+    monkeypatch.setattr(
+        integration, "_llm_requires_endpoint_prediction", lambda query, deadline=None: llm_calls.append(query) or True
+    )
+
+    assert integration.requires_endpoint_prediction("How long is follow-up in these trials?")
+    assert not integration.requires_endpoint_prediction("Summarize these trials")
+    assert llm_calls == []
+
+    assert integration.requires_endpoint_prediction("What outcomes were reported?")
+    assert integration.requires_endpoint_prediction("what  outcomes were reported?")
+    assert llm_calls == ["What outcomes were reported?"]
+
+
+def test_failed_llm_falls_back_to_local_estimate_uncached(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    classifier = EndpointQueryClassifier(None)
+    integration = EndpointPredictionAPIIntegration(api_base_url="http://classifier-test", classifier=classifier)
+    monkeypatch.setattr(integration, "_llm_requires_endpoint_prediction", lambda query, deadline=None: None)
+
+    assert integration.requires_endpoint_prediction("What outcomes were reported?")  # p = 0.5
+    assert classifier.classify("What outcomes were reported?")[1] == "rules"
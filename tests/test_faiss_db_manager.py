@@ -0,0 +1,152 @@
+# test_faiss_db_manager.py
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from src.faiss_db_manager import FaissVectorDB
+
+DIMENSION = 8
+
+
+def make_documents(count, start=0, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {'text': f"doc {i}", 'chunk_id': f"c{i}", 'year': 2000 + i % 5, 'embedding': rng.random(DIMENSION, dtype=np.float32)}
+        for i in range(start, start + count)
+    ]
+
+
+def test_concurrent_filtered_searches_build_metadata_index_once():
+    vector_db = FaissVectorDB(dimension=DIMENSION)
+    vector_db.add_documents(make_documents(5000))
+    query = np.random.default_rng(1).random(DIMENSION, dtype=np.float32)
+
+    results = []
+    barrier = threading.Barrier(8)
+
+    def search():
+        barrier.wait()
+        results.append(vector_db.similarity_search(query, k=5, metadata_filter={'year': 2003})[0])
+
+    threads = [threading.Thread(target=search) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(len(docs) == 5 and all(doc['year'] == 2003 for doc in docs) for docs in results)
+    assert len(vector_db._metadata_keys['year']) == 5000
+    assert sorted(vector_db._metadata_values['year'][2003]) == list(range(3, 5000, 5))
+
+
+def test_filtered_search_reads_metadata_index_under_lock():
+    vector_db = FaissVectorDB(dimension=DIMENSION)
+    vector_db.add_documents(make_documents(100))
+    query = np.random.default_rng(1).random(DIMENSION, dtype=np.float32)
+    results = []
+    search = threading.Thread(
+        target=lambda: results.append(vector_db.similarity_search(query, k=5, metadata_filter={'year': 2003})[0])
+    )
+
+    # While a writer holds the lock (as compact/upsert do), the search must wait instead of reading
+    with vector_db._metadata_lock:
+        search.start()
+        search.join(timeout=0.2)
+        assert search.is_alive() and not results
+        vector_db._reset_metadata_index()
+    search.join()
+    assert len(results[0]) == 5 and all(doc['year'] == 2003 for doc in results[0])
+
+
+@pytest.fixture
+def saved_index(tmp_path):
+    vector_db = FaissVectorDB(dimension=DIMENSION, embedding_model="text-embedding-3-small")
+    vector_db.add_documents(make_documents(50))
+    path = str(tmp_path / "index" / "model")
+    assert vector_db.save(path)
+    return path, vector_db
+
+
+def test_save_and_load_round_trip(saved_index):
+    path, original = saved_index
+    query = np.random.default_rng(1).random(DIMENSION, dtype=np.float32)
+
+    vector_db = FaissVectorDB()
+    assert vector_db.load(path)
+    assert vector_db.dimension == DIMENSION
+    assert vector_db.embedding_model == "text-embedding-3-small"
+    assert vector_db.similarity_search(query, k=5) == original.similarity_search(query, k=5)
+
+
+def test_memory_mapped_load_searches_and_stays_writable(saved_index):
+    path, original = saved_index
+    query = np.random.default_rng(1).random(DIMENSION, dtype=np.float32)
+
+    vector_db = FaissVectorDB()
+    assert vector_db.load(path, mmap=True)
+    assert vector_db.similarity_search(query, k=5) == original.similarity_search(query, k=5)
+
+    # Writing copies the mapped index first; saving over the mapped file replaces it
+    assert vector_db.add_documents(make_documents(5, start=50, seed=2))
+    assert not vector_db.is_mmapped
+    assert vector_db.save(path)
+
+    reloaded = FaissVectorDB()
+    assert reloaded.load(path, mmap=True)
+    assert len(reloaded.documents) == 55
+
+
+def test_delta_segments_replay_upserts_and_deletes(saved_index, tmp_path):
+    path, _ = saved_index
+    vector_db = FaissVectorDB()
+    assert vector_db.load(path)
+
+    [new_id] = vector_db.upsert_documents(make_documents(1, start=7, seed=3), key='chunk_id')
+    assert vector_db.delete_by_metadata({'chunk_id': "c9"}) == 1
+    assert vector_db.delete_documents([0, 1]) == 2
+    assert vector_db.save_delta(path)
+    assert os.path.exists(f"{path}.delta1.npz")
+
+    reloaded = FaissVectorDB()
+    assert reloaded.load(path)
+    live_ids = reloaded.get_document_ids().tolist()
+    assert new_id == 50 and new_id in live_ids
+    assert not {0, 1, 7, 9} & set(live_ids)
+    assert len(live_ids) == 47
+    assert reloaded.next_id == 51
+
+    # A full save folds the delta into the base files
+    assert reloaded.save(path)
+    assert not os.path.exists(f"{path}.delta1.npz")
+    compacted = FaissVectorDB()
+    assert compacted.load(path)
+    assert compacted.get_document_ids().tolist() == live_ids
+    assert compacted.deltas == []
+
+
+def test_upsert_replaces_documents_with_same_key(saved_index):
+    path, _ = saved_index
+    vector_db = FaissVectorDB()
+    assert vector_db.load(path)
+
+    [new_id] = vector_db.upsert_documents(make_documents(1, start=3, seed=4), key='chunk_id')
+    live_ids = vector_db.get_document_ids().tolist()
+    assert new_id in live_ids and 3 not in live_ids
+    assert len(live_ids) == 50
+
+
+def test_add_documents_accepts_embedding_matrix():
+    documents = make_documents(20)
+    embeddings = np.stack([doc.pop('embedding') for doc in documents])
+    stacked = FaissVectorDB(dimension=DIMENSION)
+    assert stacked.add_documents(documents, embeddings=embeddings)
+
+    per_document = FaissVectorDB(dimension=DIMENSION)
+    assert per_document.add_documents([{**doc, 'embedding': vector} for doc, vector in zip(documents, embeddings)])
+    assert list(stacked.documents) == list(per_document.documents)
+    assert np.array_equal(stacked.reconstruct_vectors(), per_document.reconstruct_vectors())
+
+    assert not stacked.add_documents(documents, embeddings=embeddings[:5])
+    assert len(stacked.documents) == 20
@@ -0,0 +1,179 @@
+# test_gcp_storage_adapter.py
+import json
+import os
+
+import numpy as np
+import pytest
+
+from fake_gcs import FakeClient
+from src.faiss_db_manager import FaissVectorDB
+from src.gcp_storage_adapter import GCPStorageAdapter
+
+
+@pytest.fixture
+def adapter():
+    return GCPStorageAdapter("bucket", client=FakeClient(), download_chunk_size=16, download_workers=4)
+
+
+def put(adapter, name, data):
+    adapter.bucket.blob(name).upload_from_string(data)
+
+
+def test_pdfs_are_stored_flat_with_colliding_names_disambiguated(adapter, tmp_path):
+    put(adapter, "localDatasets/m/a/report.pdf", b"first")
+    put(adapter, "localDatasets/m/b/report.pdf", b"second")
+    put(adapter, "localDatasets/m/summary.pdf", b"third")
+    put(adapter, "localDatasets/m/notes.txt", b"skipped")
+
+    paths = set(adapter.iter_pdf_downloads("localDatasets/m/", str(tmp_path), base_wait=0))
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+    assert len(paths) == 3
+    assert (tmp_path / "report.pdf").read_bytes() == b"first"
+    assert (tmp_path / "summary.pdf").read_bytes() == b"third"
+    [renamed] = [path for path in paths if os.path.basename(path) not in ("report.pdf", "summary.pdf")]
+    assert os.path.basename(renamed).startswith("report-") and open(renamed, 'rb').read() == b"second"
+
+    # The mapping is stable, so unchanged PDFs are not downloaded again
+    statuses = []
+    list(adapter.iter_pdf_downloads("localDatasets/m/", str(tmp_path), progress_callback=statuses.append))
+    assert {status['status'] for status in statuses} == {"unchanged"}
+
+
+def test_pdf_download_fails_if_any_pdf_fails(adapter, monkeypatch):
+    monkeypatch.setattr("src.gcp_storage_adapter.time.sleep", lambda seconds: None)  # skip retry backoff
+    put(adapter, "localDatasets/m/a.pdf", b"first")
+    put(adapter, "localDatasets/m/b.pdf", b"second")
+    adapter.bucket.fail_ranges = {"localDatasets/m/b.pdf": {None}}
+    statuses = []
+    assert adapter.download_pdfs_to_temp("localDatasets/m/", max_workers=2, progress_callback=statuses.append) == ""
+    assert sorted(status['status'] for status in statuses) == ["downloaded", "failed"]
+
+
+def test_pdf_cache_dir_is_reused_and_pruned(adapter, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.gcp_storage_adapter.PDF_CACHE_DIR", str(tmp_path))
+    put(adapter, "localDatasets/m/a.pdf", b"first")
+    put(adapter, "localDatasets/m/b.pdf", b"second")
+    assert adapter.download_pdfs_to_temp_using_model_id("m") == str(tmp_path / "m")
+
+    adapter.bucket.get_blob("localDatasets/m/b.pdf").delete()
+    put(adapter, "localDatasets/m/c.pdf", b"third")
+    statuses = []
+    assert adapter.download_pdfs_to_temp("localDatasets/m/", str(tmp_path / "m"), progress_callback=statuses.append)
+    assert {status['name']: status['status'] for status in statuses} == {
+        "localDatasets/m/a.pdf": "unchanged", "localDatasets/m/c.pdf": "downloaded"
+    }
+    assert sorted(os.listdir(tmp_path / "m")) == ["a.pdf", "c.pdf"]
+
+
+@pytest.fixture
+def local_index(tmp_path):
+    vector_db = FaissVectorDB(dimension=8)
+    rng = np.random.default_rng(0)
+    vector_db.add_documents([{'text': f"doc {i}", 'embedding': rng.random(8, dtype=np.float32)} for i in range(40)])
+    path = str(tmp_path / "source" / "model")
+    assert vector_db.save(path)
+    return path
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_index_download_resumes_missing_ranges(adapter, local_index, tmp_path):
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=False)
+    bucket = adapter.bucket
+    adapter.download_workers = 1  # ranges before the failing one are all saved
+    failing_start = 5 * adapter.download_chunk_size
+    bucket.fail_ranges = {"indexes/m/m.index": {failing_start}}
+
+    target = str(tmp_path / "cache" / "m")
+    assert not adapter.download_index("indexes/m/m", target)
+    assert not os.path.exists(f"{target}.index")
+    assert os.path.exists(f"{target}.index.part.json")
+
+    with open(f"{target}.index.part.json") as f:
+        saved_chunks = set(json.load(f)['done'])
+    assert set(range(5)) <= saved_chunks and 5 not in saved_chunks
+
+    bucket.fail_ranges = {}
+    bucket.range_requests.clear()
+    assert adapter.download_index("indexes/m/m", target)
+    # Chunks saved by the failed attempt are not fetched again
+    refetched = {start // adapter.download_chunk_size
+                 for name, start, *_ in bucket.range_requests if name == "indexes/m/m.index"}
+    num_chunks = -(-bucket.get_blob("indexes/m/m.index").size // adapter.download_chunk_size)
+    assert refetched == set(range(num_chunks)) - saved_chunks
+    for extension in ("index", "documents", "meta"):
+        assert read(f"{target}.{extension}") == read(f"{local_index}.{extension}")
+    assert not os.path.exists(f"{target}.index.part.json")
+
+
+def test_index_download_restarts_when_blob_changed(adapter, local_index, tmp_path):
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=False)
+    bucket = adapter.bucket
+    bucket.fail_ranges = {"indexes/m/m.index": {0}}
+    target = str(tmp_path / "cache" / "m")
+    assert not adapter.download_index("indexes/m/m", target)
+
+    # A new upload changes the generation, so the partial file is discarded
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=False)
+    bucket.fail_ranges = {}
+    bucket.range_requests.clear()
+    assert adapter.download_index("indexes/m/m", target)
+    index_size = bucket.get_blob("indexes/m/m.index").size
+    fetched = [request for request in bucket.range_requests if request[0] == "indexes/m/m.index"]
+    assert len(fetched) == -(-index_size // adapter.download_chunk_size)
+    assert read(f"{target}.index") == read(f"{local_index}.index")
+
+
+def test_index_download_rejects_checksum_mismatch(adapter, local_index, tmp_path):
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=False)
+    adapter.bucket.get_blob("indexes/m/m.documents").md5_hash = "bad"
+    target = str(tmp_path / "cache" / "m")
+    assert not adapter.download_index("indexes/m/m", target)
+    assert not os.path.exists(f"{target}.documents")
+
+
+def test_packaged_index_round_trip(adapter, local_index, tmp_path):
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=True)
+    bucket = adapter.bucket
+    assert bucket.get_blob("indexes/m/m.pack.zst") is not None
+    assert bucket.get_blob("indexes/m/m.manifest.json") is not None
+    assert bucket.get_blob("indexes/m/m.index") is None
+
+    target = str(tmp_path / "cache" / "m")
+    assert adapter.download_index("indexes/m/m", target)
+    for extension in ("index", "documents", "meta"):
+        assert read(f"{target}.{extension}") == read(f"{local_index}.{extension}")
+    vector_db = FaissVectorDB()
+    assert vector_db.load(target)
+    assert len(vector_db.documents) == 40
+
+
+def test_switching_upload_format_removes_stale_blobs(adapter, local_index):
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=False)
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=True)
+    assert adapter.bucket.get_blob("indexes/m/m.index") is None
+    assert adapter.bucket.get_blob("indexes/m/m.documents") is None
+
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=False)
+    assert adapter.bucket.get_blob("indexes/m/m.pack.zst") is None
+    assert adapter.bucket.get_blob("indexes/m/m.manifest.json") is None
+    assert adapter.bucket.get_blob("indexes/m/m.index") is not None
+
+
+def test_delta_on_packaged_base(adapter, local_index, tmp_path):
+    assert adapter.upload_index(local_index, "indexes/m/m", packaged=True)
+    vector_db = FaissVectorDB()
+    assert vector_db.load(local_index)
+    assert vector_db.delete_documents([0, 1]) == 2
+    assert vector_db.save_delta(local_index)
+    assert adapter.upload_index_delta(local_index, "indexes/m/m", "delta1")
+
+    target = str(tmp_path / "cache" / "m")
+    assert adapter.download_index("indexes/m/m", target)
+    assert os.path.exists(f"{target}.delta1.npz")
+    reloaded = FaissVectorDB()
+    assert reloaded.load(target)
+    assert reloaded.get_document_ids().tolist() == list(range(2, 40))
@@ -0,0 +1,138 @@
+# test_index_cache.py
+import glob
+import os
+import pickle
+import shutil
+import threading
+
+import numpy as np
+import pytest
+
+from src.faiss_db_manager import FaissVectorDB
+from src.index_cache import IndexCacheManager
+
+
+class FakeStorage:
+    """Serves indexes from a local "remote" directory; bump() publishes a new version."""
+
+    def __init__(self, remote_dir):
+        self.remote_dir = remote_dir
+        self.versions = {}
+        self.downloads = []
+
+    def publish(self, model_id, num_documents=4):
+        vector_db = FaissVectorDB(dimension=8)
+        rng = np.random.default_rng(num_documents)
+        vector_db.add_documents([
+            {'text': f"{model_id} {i}", 'embedding': rng.random(8, dtype=np.float32)} for i in range(num_documents)
+        ])
+        assert vector_db.save(os.path.join(self.remote_dir, model_id))
+        self.versions[model_id] = self.versions.get(model_id, 0) + 1
+
+    def get_index_signature_using_model_id(self, model_id):
+        return {'generation': self.versions[model_id]} if model_id in self.versions else {}
+
+    def download_index_using_model_id(self, model_id, local_path):
+        self.downloads.append(model_id)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        for path in glob.glob(os.path.join(self.remote_dir, f"{model_id}.*")):
+            shutil.copy(path, f"{local_path}{os.path.basename(path)[len(model_id):]}")
+        return True
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = FakeStorage(str(tmp_path / "remote"))
+    storage.publish("a")
+    storage.publish("b")
+    return storage
+
+
+def make_cache(tmp_path, storage, **kwargs):
+    return IndexCacheManager(storage, cache_dir=str(tmp_path / "cache"), **kwargs)
+
+
+def test_load_is_cached_and_reloaded_after_refresh(tmp_path, storage):
+    cache = make_cache(tmp_path, storage)
+    first = cache.load_vector_db("a")
+    assert cache.load_vector_db("a") is first
+    assert storage.downloads == ["a"]
+
+    storage.publish("a", num_documents=6)
+    assert cache.refresh_stale() == ["a"]
+    reloaded = cache.load_vector_db("a")
+    assert reloaded is not first
+    assert len(reloaded.documents) == 6
+
+
+def test_loaded_registry_is_lru_bounded(tmp_path, storage):
+    cache = make_cache(tmp_path, storage, max_loaded=1)
+    cache.load_vector_db("a")
+    cache.load_vector_db("b")
+    assert cache.loaded_model_ids() == ["b"]
+
+
+def test_evict_removes_least_recently_used(tmp_path, storage):
+    cache = make_cache(tmp_path, storage)
+    cache.get_index_path("a")
+    cache.get_index_path("b")
+    cache.max_disk_bytes = cache.disk_usage("b")
+
+    assert cache.evict(protect=["b"]) == ["a"]
+    assert sorted(cache.cached_model_ids()) == ["b"]
+
+
+def test_evict_skips_index_being_loaded(tmp_path, storage):
+    cache = make_cache(tmp_path, storage)
+    cache.get_index_path("a")
+    cache.max_disk_bytes = 1
+
+    with cache._model_lock("a", shared=True):
+        assert cache.evict() == []
+    assert cache.evict() == ["a"]
+
+
+def test_refresh_waits_for_loads(tmp_path, storage):
+    cache = make_cache(tmp_path, storage)
+    cache.get_index_path("a")
+    storage.publish("a", num_documents=6)
+
+    done = threading.Event()
+    with cache._model_lock("a", shared=True):
+        refresh = threading.Thread(target=lambda: cache.refresh("a") and done.set())
+        refresh.start()
+        assert not done.wait(0.3)
+    refresh.join(5)
+    assert done.is_set()
+    assert len(cache.load_vector_db("a").documents) == 6
+
+
+def test_access_log_is_compacted_to_daily_counts(tmp_path, storage, monkeypatch):
+    cache = make_cache(tmp_path, storage)
+    for model_id in ["a", "a", "b", "a"]:
+        cache.get_index_path(model_id)
+
+    # Accesses from before the window are dropped by compaction
+    monkeypatch.setattr("src.index_cache.time.time", lambda: 1e9)
+    cache._record_access("b")
+    monkeypatch.undo()
+    with open(cache.access_log_path) as f:
+        assert len(f.readlines()) == 5
+
+    assert cache.compact_access_log(window_seconds=3600) == 2
+    assert cache.top_model_ids(2, window_seconds=3600) == ["a", "b"]
+    counts = {entry['model_id']: entry['count'] for entry in cache._read_access_log()}
+    assert counts == {"a": 3, "b": 1}
+
+
+def test_copy_that_fails_to_load_is_replaced_by_changed_gcs_version(tmp_path, storage):
+    # A legacy pickled copy in GCS, cached before the bucket was converted
+    with open(os.path.join(storage.remote_dir, "a.documents"), 'wb') as f:
+        pickle.dump([{'text': f"a {i}"} for i in range(4)], f)
+    cache = make_cache(tmp_path, storage)
+    with pytest.raises(ValueError):
+        cache.load_vector_db("a")
+
+    storage.publish("a")
+    assert len(cache.load_vector_db("a").documents) == 4
+    assert storage.downloads == ["a", "a"]
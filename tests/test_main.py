@@ -0,0 +1,77 @@
+# test_main.py
+import pytest
+
+from main import BenchmarkComparison
+from src.clinical_trials_rag_pipeline import ClinicalTrialsRAGPipeline
+from src.fetcher import ClinicalTrialsFetcherAgent
+
+
+def make_study(nct_id):
+    return {'protocolSection': {'identificationModule': {'nctId': nct_id, 'briefTitle': f"Study {nct_id}"}}}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = {'generate_api_urls': [], 'fetch': []}
+
+    def generate_api_urls(self, user_query, *args, **kwargs):
+        calls['generate_api_urls'].append(user_query)
+        return {'urls': [f"https://clinicaltrials.gov/api/v2/studies?query.term={len(calls['generate_api_urls'])}"]}
+
+    def fetch_clinical_trials_data(self, urls, max_workers=5):
+        calls['fetch'].append(urls)
+        return {url: {'studies': [make_study("NCT001"), make_study("NCT002")], 'totalCount': 2} for url in urls}, []
+
+    def retrieve_relevant_context(self, query, chunk_embeddings, top_k=10):
+        return {'studies': [{'study_id': "NCT002"}]}
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ClinicalTrialsFetcherAgent, "generate_api_urls", generate_api_urls)
+    monkeypatch.setattr(ClinicalTrialsFetcherAgent, "fetch_clinical_trials_data", fetch_clinical_trials_data)
+    monkeypatch.setattr(ClinicalTrialsRAGPipeline, "vectorize_chunks", lambda self, chunks: {})
+    monkeypatch.setattr(ClinicalTrialsRAGPipeline, "retrieve_relevant_context", retrieve_relevant_context)
+    return calls
+
+
+@pytest.fixture
+def agent():
+    # Only the attributes the trial fetch uses; no index cache or GCS client
+    agent = BenchmarkComparison.__new__(BenchmarkComparison)
+    agent.client = None
+    agent.model = "test-model"
+    return agent
+
+
+def test_speculative_fetch_replaces_profile_fetch(agent, calls):
+    speculative_result = agent.speculative_fetch_trials("raw question")
+    result = agent.fetch_clinical_ncts("local study profile", speculative_result=speculative_result)
+
+    assert result['success'] and result['nct_ids'] == ["NCT002"]
+    assert calls['generate_api_urls'] == ["raw question"]
+    assert len(calls['fetch']) == 1
+
+
+def test_failed_speculative_fetch_falls_back_to_profile(agent, calls):
+    result = agent.fetch_clinical_ncts("local study profile", speculative_result={'success': False, 'data': None})
+
+    assert result['success']
+    assert calls['generate_api_urls'] == ["local study profile"]
+    assert len(calls['fetch']) == 1
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("", None), ("0", None), ("-3", None), ("abc", None), ("25", 25), (" 7 ", 7),
+])
+def test_study_prefilter_top_n_is_parsed_defensively(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("CT_STUDY_PREFILTER_TOP_N", raising=False)
+    else:
+        monkeypatch.setenv("CT_STUDY_PREFILTER_TOP_N", value)
+    assert BenchmarkComparison._study_prefilter_top_n() == expected
+
+
+def test_non_positive_prefilter_keeps_all_studies(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    pipeline = ClinicalTrialsRAGPipeline(study_prefilter_top_n=-2)
+    trials_data = {'studies': [make_study(f"NCT00{i}") for i in range(4)]}
+    assert pipeline.prefilter_studies("query", trials_data) is trials_data